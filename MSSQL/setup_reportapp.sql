@@ -72,6 +72,8 @@ BEGIN
         started_at          DATETIME2     NULL,
         finished_at         DATETIME2     NULL,
         duration_ms         INT           NULL,
+        load_strategy       NVARCHAR(30)  NULL,
+        rows_per_second     DECIMAL(18,2) NULL,
         
         -- Duplicate Detection
         is_duplicate        BIT           NULL,
@@ -156,6 +158,12 @@ BEGIN
         
     IF COL_LENGTH('dbo.import_log', 'duration_ms') IS NULL
         ALTER TABLE dbo.import_log ADD duration_ms INT NULL;
+
+    IF COL_LENGTH('dbo.import_log', 'load_strategy') IS NULL
+        ALTER TABLE dbo.import_log ADD load_strategy NVARCHAR(30) NULL;
+
+    IF COL_LENGTH('dbo.import_log', 'rows_per_second') IS NULL
+        ALTER TABLE dbo.import_log ADD rows_per_second DECIMAL(18,2) NULL;
         
     IF COL_LENGTH('dbo.import_log', 'is_duplicate') IS NULL
         ALTER TABLE dbo.import_log ADD is_duplicate BIT NULL;
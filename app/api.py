@@ -1,5 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse, JSONResponse
 from jose import JWTError, jwt
 from passlib.context import CryptContext
@@ -51,44 +53,6 @@ async def get_current_admin(user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail='Admin privileges required')
     return user
 
-# ===== List stored procedures and their parameters =====
-@router.get('/report/stored-procedures')
-async def list_stored_procedures(_admin=Depends(get_current_admin)):
-    """Return a list of stored procedures and their parameters from the report DB."""
-    conn = _get_report_data_conn()
-    if not conn:
-        raise HTTPException(status_code=503, detail='Report DB connection unavailable')
-    try:
-        cur = conn.cursor()
-        # List all user stored procedures
-        cur.execute("""
-            SELECT SPECIFIC_NAME FROM INFORMATION_SCHEMA.ROUTINES
-            WHERE ROUTINE_TYPE = 'PROCEDURE' AND ROUTINE_SCHEMA = 'dbo'
-            ORDER BY SPECIFIC_NAME
-        """)
-        sps = [row[0] for row in cur.fetchall()]
-        # For each, get parameters
-        result = []
-        for sp in sps:
-            cur.execute("""
-                SELECT PARAMETER_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, PARAMETER_MODE
-                FROM INFORMATION_SCHEMA.PARAMETERS
-                WHERE SPECIFIC_NAME = ?
-                ORDER BY ORDINAL_POSITION
-            """, (sp,))
-            params = [
-                {
-                    'name': r[0],
-                    'type': r[1],
-                    'max_length': r[2],
-                    'mode': r[3]
-                } for r in cur.fetchall()
-            ]
-            result.append({'name': sp, 'parameters': params})
-        cur.close()
-        return {'procedures': result}
-    finally:
-        conn.close()
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
@@ -106,13 +70,34 @@ import platform
 import csv
 from sqlalchemy import func, select
 import logging
+import asyncio
+import time
 import traceback
 import pandas as pd
 import io
 import tempfile
 import requests
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from . import db_connection as dbc
+from . import db_pool
+from . import db_executor
+from . import result_sessions
+from . import report_export
+from . import report_cache
+from . import parameter_values
+from . import report_plan
+from . import audit_log
+from . import import_pipeline
+from . import bulk_loader
+from . import schema_inference
+from . import excel_reader
+from . import upload_staging
+from .single_flight import SingleFlight
+from . import report_jobs
+from . import etags
+from .definitions_cache import DefinitionsCache, DefinitionsUnavailable
+from .proc_catalog import ProcedureCatalog, CatalogUnavailable
+from .db_executor import run_in_db, db_route
 
 # Configure logging
 logging.basicConfig(
@@ -125,6 +110,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Coalesces identical concurrent /report/run executions
+_report_flights = SingleFlight()
+
+# Statement timeout for stored procedure runs; definitions override it with options.timeout_seconds (0 = none)
+REPORT_TIMEOUT_SECONDS = int(os.environ.get('REPORT_TIMEOUT_SECONDS', '300'))
+
+
+class ReportRunTimeout(Exception):
+    """A stored procedure exceeded its statement timeout."""
+
+
+def _report_timeout_seconds(options: dict) -> int:
+    try:
+        value = (options or {}).get('timeout_seconds')
+        return max(0, int(value)) if value is not None else REPORT_TIMEOUT_SECONDS
+    except (TypeError, ValueError):
+        return REPORT_TIMEOUT_SECONDS
+
+
+def _as_report_timeout(exc: Exception, seconds: int) -> Exception:
+    """Map the ODBC 'query timeout expired' error (SQLSTATE HYT00) to ReportRunTimeout."""
+    state = str(exc.args[0]) if getattr(exc, 'args', None) else ''
+    if state == 'HYT00' or 'HYT00' in str(exc):
+        return ReportRunTimeout(f'Report exceeded its {seconds}s timeout')
+    return exc
+
 router = APIRouter()
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -163,6 +174,16 @@ async def get_current_admin(user: dict = Depends(get_current_user)):
     return user
 
 
+_optional_security = HTTPBearer(auto_error=False)
+
+
+async def get_optional_user(creds: Optional[HTTPAuthorizationCredentials] = Depends(_optional_security)):
+    """Token payload when a bearer token is sent, else None (for endpoints that also work anonymously)."""
+    if creds is None:
+        return None
+    return await get_current_user(creds)
+
+
 def user_has_report_access(username: str) -> bool:
     """Check if a user has access to reports. Admin users always have access."""
     if not username:
@@ -209,12 +230,15 @@ class ReportDefinitionIn(BaseModel):
     # Accept either a list of parameter-names (strings) or parameter objects (dicts)
     parameters: Optional[list] = []
     active: Optional[bool] = True
+    # Per-definition settings, e.g. {"cache_ttl_seconds": 300}
+    options: Optional[dict] = None
 
 class ReportDefinitionUpdate(BaseModel):
     report_name: Optional[str] = None
     stored_procedure: Optional[str] = None
     parameters: Optional[list] = None
     active: Optional[bool] = None
+    options: Optional[dict] = None
 
 
 class SettingsUpdateIn(SettingsIn):
@@ -289,21 +313,12 @@ def _seed_admin_if_missing(conn):
 
 # ========== Admin Settings (DB + Report DB) ==========
 
-SETTINGS_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'instance', 'settings.json'))
-
 def _read_settings_file() -> dict:
-    try:
-        if os.path.exists(SETTINGS_FILE):
-            with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except Exception:
-        pass
-    return {}
+    return dbc.load_settings()
 
 def _write_settings_file(data: dict):
-    os.makedirs(os.path.dirname(SETTINGS_FILE), exist_ok=True)
-    with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # Atomic replace; also rebuilds cached connection strings and drops pooled connections
+    dbc.write_settings(data)
 
 
 @router.get('/admin/settings')
@@ -358,6 +373,13 @@ async def update_admin_settings(payload: AdminSettingsUpdate, _admin=Depends(get
     return {'success': True}
 
 
+@router.post('/admin/settings/reload')
+async def reload_admin_settings(_admin=Depends(get_current_admin)):
+    """Re-read instance/settings.json (e.g. after a manual edit) and rebuild connection pools."""
+    dbc.reload_settings()
+    return {'success': True, 'driver': dbc.resolved_odbc_driver()}
+
+
 # ===== Report page and separate DB support =====
 def _get_report_db_conn():
     """Return a pyodbc connection to the separate 'report' database if configured.
@@ -368,71 +390,70 @@ def _get_report_db_conn():
     except Exception:
         return None
 
-    s = dbc.load_settings()
-    # If a separate report database is configured, use it; else fall back
-    server = s.get('host')
-    report_db = s.get('report_database') or s.get('reports_database')
-    main_db = s.get('database')
-    if not server or not (report_db or main_db):
+    conn_str = dbc.get_connection_string('report')
+    if not conn_str:
         return None
-
-    driver = _pick_odbc_driver(s.get('driver'))
-    parts = [f'DRIVER={{{driver}}}', f'SERVER={server}', f'DATABASE={report_db or main_db}']
-    if s.get('trusted', True):
-        parts.append('Trusted_Connection=yes')
-    else:
-        uid = s.get('username') or ''
-        pwd = s.get('password') or ''
-        if uid:
-            parts.append(f'UID={uid}')
-        if pwd:
-            parts.append(f'PWD={pwd}')
-    if s.get('encrypt', False):
-        parts.append('Encrypt=yes')
-    parts.append('TrustServerCertificate=yes')
-    conn_str = ';'.join(parts)
     try:
-        return pyodbc.connect(conn_str, timeout=5)
+        return db_pool.connect(conn_str)
     except Exception:
         return None
 
 
+# Procedure/parameter metadata of the report data DB, for the definition editor
+_procedures = ProcedureCatalog(
+    connect=lambda: _get_report_data_conn(),
+    conn_key=lambda: dbc.get_connection_string('report_data'),
+)
+
+
+@router.get('/report/stored-procedures')
+@db_route('report_data')
+def list_stored_procedures(q: Optional[str] = None, limit: Optional[int] = None, parameters: bool = True,
+                           _admin=Depends(get_current_admin)):
+    """Return the dbo stored procedures of the report DB and their parameters.
+
+    Served from the procedure catalog cache (`app/proc_catalog.py`). `q` filters by
+    name prefix and `limit` caps the count; `parameters=false` omits parameter
+    lists, which is all the procedure picker needs.
+    """
+    try:
+        procs = _procedures.search(q or '', 'dbo', limit if limit and limit > 0 else None)
+    except CatalogUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    result = []
+    for p in procs:
+        item = {'name': p['name']}
+        if parameters:
+            item['parameters'] = [dict(x) for x in p['parameters']]
+        result.append(item)
+    return {'procedures': result}
+
+
 @router.get('/report/proc-parameters')
-async def get_proc_parameters(name: str, _user=Depends(get_current_user)):
+@db_route('report_data')
+def get_proc_parameters(name: str, _user=Depends(get_current_user)):
     """Return parameter metadata for a stored procedure from the runtime reports database.
 
-    Query `INFORMATION_SCHEMA.PARAMETERS` on the runtime DB (via `_get_report_data_conn`).
-    Returns list of parameters in ordinal order with name (without leading @), mode and data type.
+    Served from the procedure catalog cache, which mirrors `INFORMATION_SCHEMA.PARAMETERS`
+    on the runtime DB (via `_get_report_data_conn`); unqualified names prefer the dbo schema.
+    Returns list of parameters in ordinal order with name (without leading @), mode and data type,
+    plus `max_length`, `precision` and `scale` where the type has them.
     """
-    conn = _get_report_data_conn()
-    if not conn:
-        raise HTTPException(status_code=503, detail='Report data DB connection unavailable')
     try:
-        cur = conn.cursor()
-        # Query parameters for the specific procedure name. Prefer dbo schema rows when present.
-        cur.execute(
-            """
-            SELECT PARAMETER_NAME, PARAMETER_MODE, DATA_TYPE
-            FROM INFORMATION_SCHEMA.PARAMETERS
-            WHERE SPECIFIC_NAME = ?
-            ORDER BY ORDINAL_POSITION
-            """,
-            (name,)
-        )
-        rows = cur.fetchall()
-        params = []
-        for r in rows:
-            pname = r[0] or ''
-            if pname.startswith('@'):
-                pname = pname[1:]
-            params.append({'name': pname, 'mode': r[1], 'type': r[2]})
-        cur.close()
-        return {'procedure': name, 'parameters': params}
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
+        proc = _procedures.get(name)
+    except CatalogUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    params = []
+    for p in (proc['parameters'] if proc else []):
+        pname = p['name'] or ''
+        if pname.startswith('@'):
+            pname = pname[1:]
+        item = {'name': pname, 'mode': p['mode'], 'type': p['type']}
+        for key in ('max_length', 'precision', 'scale'):
+            if p.get(key) is not None:
+                item[key] = p[key]
+        params.append(item)
+    return {'procedure': name, 'parameters': params}
 
 def _get_definitions_conn():
     """Return connection to the DB that stores report definitions (report setup).
@@ -442,27 +463,11 @@ def _get_definitions_conn():
         import pyodbc
     except Exception:
         return None
-    s = dbc.load_settings()
-    server = s.get('host')
-    defs_db = s.get('report_database') or s.get('reports_database') or s.get('database')
-    if not server or not defs_db:
+    conn_str = dbc.get_connection_string('definitions')
+    if not conn_str:
         return None
-    driver = _pick_odbc_driver(s.get('driver'))
-    parts = [f'DRIVER={{{driver}}}', f'SERVER={server}', f'DATABASE={defs_db}']
-    if s.get('trusted', True):
-        parts.append('Trusted_Connection=yes')
-    else:
-        uid = s.get('username') or ''
-        pwd = s.get('password') or ''
-        if uid:
-            parts.append(f'UID={uid}')
-        if pwd:
-            parts.append(f'PWD={pwd}')
-    if s.get('encrypt', False):
-        parts.append('Encrypt=yes')
-    parts.append('TrustServerCertificate=yes')
     try:
-        return pyodbc.connect(';'.join(parts), timeout=5)
+        return db_pool.connect(conn_str)
     except Exception:
         return None
 
@@ -474,27 +479,11 @@ def _get_report_data_conn():
         import pyodbc
     except Exception:
         return None
-    s = dbc.load_settings()
-    server = s.get('host')
-    data_db = s.get('reports_database') or s.get('report_data_database') or s.get('database')
-    if not server or not data_db:
+    conn_str = dbc.get_connection_string('report_data')
+    if not conn_str:
         return None
-    driver = _pick_odbc_driver(s.get('driver'))
-    parts = [f'DRIVER={{{driver}}}', f'SERVER={server}', f'DATABASE={data_db}']
-    if s.get('trusted', True):
-        parts.append('Trusted_Connection=yes')
-    else:
-        uid = s.get('username') or ''
-        pwd = s.get('password') or ''
-        if uid:
-            parts.append(f'UID={uid}')
-        if pwd:
-            parts.append(f'PWD={pwd}')
-    if s.get('encrypt', False):
-        parts.append('Encrypt=yes')
-    parts.append('TrustServerCertificate=yes')
     try:
-        return pyodbc.connect(';'.join(parts), timeout=5)
+        return db_pool.connect(conn_str)
     except Exception:
         return None
 def _ensure_report_definitions_table(conn):
@@ -513,6 +502,10 @@ def _ensure_report_definitions_table(conn):
             updated_at DATETIME2 NULL
           )
         END
+        IF COL_LENGTH('dbo.report_definitions', 'options') IS NULL
+        BEGIN
+          ALTER TABLE dbo.report_definitions ADD options NVARCHAR(MAX) NULL
+        END
     """)
     conn.commit()
     cur.close()
@@ -537,38 +530,53 @@ def _ensure_report_log_table(conn):
     conn.commit()
     cur.close()
 
+# Parsed report definitions, shared by the definition endpoints and report runs
+_definitions = DefinitionsCache(
+    connect=lambda: _get_definitions_conn(),
+    ensure_table=lambda conn: _ensure_report_definitions_table(conn),
+    conn_key=lambda: dbc.get_connection_string('definitions'),
+)
+
+
+def _cached_definitions() -> list:
+    try:
+        return _definitions.all()
+    except DefinitionsUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+def _cached_definition(def_id: int) -> Optional[dict]:
+    try:
+        return _definitions.get(def_id)
+    except DefinitionsUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+def warm_definitions_cache():
+    """Create the definitions table if needed and load the cache (best effort, at startup)."""
+    try:
+        _definitions.all()
+    except Exception as e:
+        logger.info("Report definitions not loaded at startup: %s", e)
+
+
+def _definition_out(d: dict) -> dict:
+    return {k: d[k] for k in ('id', 'report_name', 'stored_procedure', 'parameters', 'active', 'options')}
+
 @router.get('/report/definitions')
-async def list_report_definitions(_user=Depends(get_current_user)):
-    conn = _get_definitions_conn()
-    if not conn:
-        raise HTTPException(status_code=503, detail='Definitions DB connection unavailable')
+@db_route('definitions')
+def list_report_definitions(request: Request, _user=Depends(get_current_user)):
     try:
-        _ensure_report_definitions_table(conn)
-        cur = conn.cursor()
-        cur.execute("SELECT id, report_name, stored_procedure, parameters, active FROM dbo.report_definitions ORDER BY report_name")
-        rows = cur.fetchall()
-        cur.close()
-        defs = []
-        for r in rows:
-            params = []
-            if r[3]:
-                try:
-                    params = json.loads(r[3])
-                except Exception:
-                    params = []
-            defs.append({
-                'id': r[0],
-                'report_name': r[1],
-                'stored_procedure': r[2],
-                'parameters': params,
-                'active': bool(r[4]),
-            })
-        return {'items': defs}
-    finally:
-        conn.close()
+        etag = etags.version_etag('definitions', _definitions.current_version())
+    except DefinitionsUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if etags.matches(request, etag):
+        return etags.not_modified(etag)
+    return etags.json_response(request, {'items': [_definition_out(d) for d in _cached_definitions()]}, etag)
 
 @router.post('/report/definitions')
-async def create_report_definition(payload: ReportDefinitionIn, current_user: dict = Depends(get_current_user)):
+@db_route('definitions')
+def create_report_definition(payload: ReportDefinitionIn, current_user: dict = Depends(get_current_user)):
     # Check permission
     username = current_user.get('sub') if isinstance(current_user, dict) else None
     if not check_user_permission(username, 'manage_reports'):
@@ -578,21 +586,24 @@ async def create_report_definition(payload: ReportDefinitionIn, current_user: di
     if not conn:
         raise HTTPException(status_code=503, detail='Definitions DB connection unavailable')
     try:
-        _ensure_report_definitions_table(conn)
+        _definitions.ensure_table(conn)
         cur = conn.cursor()
         params_json = json.dumps(payload.parameters or [])
-        cur.execute("INSERT INTO dbo.report_definitions (report_name, stored_procedure, parameters, active) VALUES (?, ?, ?, ?)",
-                    (payload.report_name, payload.stored_procedure, params_json, 1 if payload.active else 0))
+        options_json = json.dumps(payload.options) if payload.options else None
+        cur.execute("INSERT INTO dbo.report_definitions (report_name, stored_procedure, parameters, active, options) VALUES (?, ?, ?, ?, ?)",
+                    (payload.report_name, payload.stored_procedure, params_json, 1 if payload.active else 0, options_json))
         conn.commit()
         cur.execute("SELECT @@IDENTITY")
         new_id_row = cur.fetchone()
         cur.close()
+        _definitions.invalidate()
         return {'id': int(new_id_row[0]) if new_id_row and new_id_row[0] else None, 'ok': True}
     finally:
         conn.close()
 
 @router.put('/report/definitions/{def_id}')
-async def update_report_definition(def_id: int, payload: ReportDefinitionUpdate, current_user: dict = Depends(get_current_user)):
+@db_route('definitions')
+def update_report_definition(def_id: int, payload: ReportDefinitionUpdate, current_user: dict = Depends(get_current_user)):
     # Check permission
     username = current_user.get('sub') if isinstance(current_user, dict) else None
     if not check_user_permission(username, 'manage_reports'):
@@ -602,15 +613,15 @@ async def update_report_definition(def_id: int, payload: ReportDefinitionUpdate,
     if not conn:
         raise HTTPException(status_code=503, detail='Definitions DB connection unavailable')
     try:
-        _ensure_report_definitions_table(conn)
+        _definitions.ensure_table(conn)
         cur = conn.cursor()
         # Fetch existing to merge
-        cur.execute("SELECT report_name, stored_procedure, parameters, active FROM dbo.report_definitions WHERE id = ?", (def_id,))
+        cur.execute("SELECT report_name, stored_procedure, parameters, active, options FROM dbo.report_definitions WHERE id = ?", (def_id,))
         row = cur.fetchone()
         if not row:
             cur.close()
             raise HTTPException(status_code=404, detail='Report definition not found')
-        report_name, stored_procedure, parameters_json, active_val = row
+        report_name, stored_procedure, parameters_json, active_val, options_json = row
         if payload.report_name is not None:
             report_name = payload.report_name
         if payload.stored_procedure is not None:
@@ -619,139 +630,195 @@ async def update_report_definition(def_id: int, payload: ReportDefinitionUpdate,
             parameters_json = json.dumps(payload.parameters)
         if payload.active is not None:
             active_val = 1 if payload.active else 0
-        cur.execute("UPDATE dbo.report_definitions SET report_name=?, stored_procedure=?, parameters=?, active=?, updated_at=SYSDATETIME() WHERE id=?",
-                    (report_name, stored_procedure, parameters_json, active_val, def_id))
+        if payload.options is not None:
+            options_json = json.dumps(payload.options) if payload.options else None
+        cur.execute("UPDATE dbo.report_definitions SET report_name=?, stored_procedure=?, parameters=?, active=?, options=?, updated_at=SYSDATETIME() WHERE id=?",
+                    (report_name, stored_procedure, parameters_json, active_val, options_json, def_id))
         conn.commit()
         cur.close()
+        _definitions.invalidate()
+        report_cache.invalidate(def_id)
+        parameter_values.invalidate(def_id)
+        report_plan.invalidate(def_id)
         return {'ok': True}
     finally:
         conn.close()
 
 @router.delete('/report/definitions/{def_id}')
-async def delete_report_definition(def_id: int, _admin=Depends(get_current_admin)):
+@db_route('definitions')
+def delete_report_definition(def_id: int, _admin=Depends(get_current_admin)):
     conn = _get_definitions_conn()
     if not conn:
         raise HTTPException(status_code=503, detail='Definitions DB connection unavailable')
     try:
-        _ensure_report_definitions_table(conn)
+        _definitions.ensure_table(conn)
         cur = conn.cursor()
         cur.execute("DELETE FROM dbo.report_definitions WHERE id=?", (def_id,))
         conn.commit()
         cur.close()
+        _definitions.invalidate()
+        report_cache.invalidate(def_id)
+        parameter_values.invalidate(def_id)
+        report_plan.invalidate(def_id)
         return {'ok': True}
     finally:
         conn.close()
 
 
 @router.get('/report/definitions/{def_id}')
-async def get_report_definition(def_id: int, _user=Depends(get_current_user)):
-    """Return a single report definition by id from the definitions DB."""
-    conn = _get_definitions_conn()
-    if not conn:
-        raise HTTPException(status_code=503, detail='Definitions DB connection unavailable')
+@db_route('definitions')
+def get_report_definition(def_id: int, _user=Depends(get_current_user)):
+    """Return a single report definition by id (served from the definitions cache)."""
+    d = _cached_definition(def_id)
+    if d is None:
+        raise HTTPException(status_code=404, detail='Report definition not found')
+    return _definition_out(d)
+
+
+def _load_parameter_value_list(def_id: int, name: str, param: dict, args: tuple = ()):
+    """Return (ValueList, 'hit'|'miss') for a parameter's `values_query`, loading it on a miss.
+
+    `args` are the dependency values bound to the query's `?` placeholders.
+    """
+    values_query = param.get('values_query')
+    key = parameter_values.make_key(def_id, name, values_query, args)
+    value_list = parameter_values.get(key)
+    if value_list is not None:
+        return value_list, 'hit'
+    # Execute values_query against runtime DB
+    data_conn = _get_report_data_conn()
+    if not data_conn:
+        raise HTTPException(status_code=503, detail='Report data DB connection unavailable')
     try:
-        _ensure_report_definitions_table(conn)
-        cur = conn.cursor()
-        cur.execute("SELECT id, report_name, stored_procedure, parameters, active FROM dbo.report_definitions WHERE id = ?", (def_id,))
-        row = cur.fetchone()
-        cur.close()
-        if not row:
-            raise HTTPException(status_code=404, detail='Report definition not found')
-        params = []
-        if row[3]:
-            try:
-                params = json.loads(row[3])
-            except Exception:
-                params = []
-        return {
-            'id': row[0],
-            'report_name': row[1],
-            'stored_procedure': row[2],
-            'parameters': params,
-            'active': bool(row[4])
-        }
+        value_list = parameter_values.load(data_conn, values_query, args)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'Failed to execute values_query: {e}')
     finally:
-        conn.close()
+        try:
+            data_conn.close()
+        except Exception:
+            pass
+    parameter_values.put(key, value_list, parameter_values.ttl_for(param))
+    return value_list, 'miss'
+
+
+def _parameter_values_page(value_list, cache_status: str, q, match: str, offset: int, limit: int) -> dict:
+    values, total = value_list.search(q, match, offset, limit)
+    return {
+        'values': values,
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'has_more': offset + len(values) < total,
+        'truncated': value_list.truncated,
+        'cache': cache_status,
+    }
 
 
 @router.get('/report/parameter-values/{def_id}/{param_name}')
-async def get_parameter_values(def_id: int, param_name: str, _user=Depends(get_current_user)):
+@db_route('report_data')
+def get_parameter_values(
+    def_id: int,
+    param_name: str,
+    request: Request,
+    q: Optional[str] = None,
+    match: str = 'contains',
+    offset: int = 0,
+    limit: int = parameter_values.PARAMETER_VALUES_PAGE_SIZE,
+    _user=Depends(get_current_user)
+):
     """Return a list of values for a named parameter for a given definition.
 
     The report definition `parameters` column may contain objects with a
     `values_query` attribute (SQL text) that will be executed against the
     runtime reports database to retrieve possible values for that parameter.
+    The list is cached per parameter (`cache_ttl_seconds`, see
+    `app/parameter_values.py`); `q` filters it (`match` = contains|prefix,
+    case-insensitive) and `offset`/`limit` page through the matches.
+
+    A parameter may list `depends_on` parameters whose values are bound to the
+    `?` placeholders of its query; pass them as query-string arguments
+    (`?p_owner_id=5`). Until all are given the response is empty with the
+    names listed in `missing`.
 
     Example parameters JSON in dbo.report_definitions:
       [
-        {"name":"p_city", "values_query":"SELECT DISTINCT city FROM dbo.tenants ORDER BY city"},
+        {"name":"p_city", "values_query":"SELECT DISTINCT city FROM dbo.tenants ORDER BY city", "cache_ttl_seconds": 600},
+        {"name":"p_property_id", "values_query":"SELECT id FROM dbo.properties WHERE owner_id = ? ORDER BY id", "depends_on":["p_owner_id"]},
         "p_tenant_name"
       ]
     """
-    # Load definition
-    defs_conn = _get_definitions_conn()
-    if not defs_conn:
-        raise HTTPException(status_code=503, detail='Definitions DB connection unavailable')
-    try:
-        _ensure_report_definitions_table(defs_conn)
-        cur = defs_conn.cursor()
-        cur.execute("SELECT parameters FROM dbo.report_definitions WHERE id = ?", (def_id,))
-        row = cur.fetchone()
-        cur.close()
-        if not row:
-            raise HTTPException(status_code=404, detail='Report definition not found')
-        params_json = row[0]
-        try:
-            params = json.loads(params_json) if params_json else []
-        except Exception:
-            params = []
-    finally:
-        try:
-            defs_conn.close()
-        except Exception:
-            pass
-
-    # Find a values_query for param_name
-    values_query = None
-    for p in params:
-        if isinstance(p, str):
-            if p == param_name:
-                # plain string - no values query
-                values_query = None
-                break
-        elif isinstance(p, dict):
-            name = p.get('name') or p.get('param') or p.get('parameter')
-            if name == param_name:
-                values_query = p.get('values_query')
-                break
+    if match not in parameter_values.MATCH_MODES:
+        raise HTTPException(status_code=400, detail=f"match must be one of: {', '.join(parameter_values.MATCH_MODES)}")
+    offset = max(0, offset)
+    limit = max(1, min(limit, parameter_values.PARAMETER_VALUES_MAX_PAGE))
 
+    # Load definition
+    definition = _cached_definition(def_id)
+    if definition is None:
+        raise HTTPException(status_code=404, detail='Report definition not found')
+    param = parameter_values.find_parameter(definition['parameters'], param_name)
+    values_query = param.get('values_query') if param else None
     if not values_query:
-        return {'values': []}
-
-    # Execute values_query against runtime DB
-    data_conn = _get_report_data_conn()
-    if not data_conn:
-        raise HTTPException(status_code=503, detail='Report data DB connection unavailable')
-    try:
-        cur = data_conn.cursor()
-        try:
-            cur.execute(values_query)
-            rows = cur.fetchmany(1000)
-            values = [r[0] for r in rows if r and len(r) > 0]
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f'Failed to execute values_query: {e}')
-        finally:
-            try:
-                cur.close()
-            except Exception:
-                pass
-    finally:
-        try:
-            data_conn.close()
-        except Exception:
-            pass
-
-    return {'values': values}
+        return {'values': [], 'total': 0, 'offset': offset, 'limit': limit, 'has_more': False}
+    args, missing = parameter_values.dependency_args(param, request.query_params)
+    if missing:
+        return {'values': [], 'total': 0, 'offset': offset, 'limit': limit, 'has_more': False, 'missing': missing}
+
+    value_list, cache_status = _load_parameter_value_list(def_id, param_name, param, args)
+    return _parameter_values_page(value_list, cache_status, q, match, offset, limit)
+
+
+@router.get('/report/parameter-values/{def_id}')
+async def get_all_parameter_values(def_id: int, request: Request,
+                                   limit: int = parameter_values.PARAMETER_VALUES_PAGE_SIZE,
+                                   _user=Depends(get_current_user)):
+    """Resolve every parameter of a definition that has a `values_query` in one call.
+
+    The lists are loaded concurrently (one pooled connection each, cache misses
+    only) and each is returned as the first page of
+    `/report/parameter-values/{def_id}/{param_name}`, keyed by parameter name.
+    A failing query is reported in that parameter's `error` without failing
+    the others. Dependency values for cascading parameters are taken from the
+    query string; parameters still waiting for them are returned empty with
+    `cache: "skipped"` and their `missing` dependencies.
+    """
+    limit = max(1, min(limit, parameter_values.PARAMETER_VALUES_MAX_PAGE))
+    definition = await run_in_db(_cached_definition, def_id, database='definitions')
+    if definition is None:
+        raise HTTPException(status_code=404, detail='Report definition not found')
+    out = {}
+    counts = {'hit': 0, 'miss': 0, 'error': 0, 'skipped': 0}
+    lookups = []
+    for p in definition['parameters']:
+        if not (isinstance(p, dict) and p.get('values_query')):
+            continue
+        name = parameter_values.param_name(p)
+        args, missing = parameter_values.dependency_args(p, request.query_params)
+        if missing:
+            out[name] = {'values': [], 'total': 0, 'has_more': False, 'cache': 'skipped',
+                         'depends_on': parameter_values.dependencies(p), 'missing': missing}
+            counts['skipped'] += 1
+            continue
+        lookups.append((name, p, args))
+
+    results = await asyncio.gather(
+        *(run_in_db(_load_parameter_value_list, def_id, name, p, args, database='report_data')
+          for name, p, args in lookups),
+        return_exceptions=True,
+    )
+    for (name, p, _), result in zip(lookups, results):
+        if isinstance(result, BaseException):
+            detail = result.detail if isinstance(result, HTTPException) else str(result)
+            out[name] = {'values': [], 'total': 0, 'has_more': False, 'cache': 'error', 'error': detail}
+            counts['error'] += 1
+            continue
+        value_list, cache_status = result
+        out[name] = _parameter_values_page(value_list, cache_status, None, 'contains', 0, limit)
+        if parameter_values.dependencies(p):
+            out[name]['depends_on'] = parameter_values.dependencies(p)
+        counts[cache_status] += 1
+    return {'definition_id': def_id, 'parameters': out, 'cache': counts}
 
 @router.post('/report/run')
 async def run_report(definition_id: int = Form(...), request: Request = None, _user=Depends(get_current_user)):
@@ -760,161 +827,661 @@ async def run_report(definition_id: int = Form(...), request: Request = None, _u
     Loads the definition from the definitions DB, then executes the stored procedure
     against the report data DB. Logs execution to `dbo.report_log` in the data DB.
     """
-    # Check permission
+    try:
+        form = await request.form() if request is not None else {}
+    except Exception:
+        form = {}
+    run = await run_in_db(_prepare_report_run, definition_id, form, _user, database='report_data')
+    if run['cached'] is not None:
+        return await run_in_db(_execute_report_run, run, database='report_data')
+
+    # Identical concurrent runs share one stored procedure execution
+    flight, leader = _report_flights.join(run['flight_key'])
+    if not leader:
+        shared = await flight.wait()
+        return await run_in_db(_execute_report_run, run, shared, database='report_data')
+    try:
+        return await run_in_db(_execute_report_run, run, None, flight, database='report_data')
+    finally:
+        flight.publish(None)
+
+
+def _load_runnable_definition(definition_id: int, _user) -> dict:
+    """Check `run_reports` permission and load an active definition.
+
+    Returns a dict with report_name, stored_procedure, parameters, options and updated_at.
+    """
     username = _user.get('sub') if isinstance(_user, dict) else None
     user_role = (_user.get('role') if isinstance(_user, dict) else None) or ''
     if user_role != 'admin' and not check_user_permission(username, 'run_reports'):
         raise HTTPException(status_code=403, detail="Permission denied: 'run_reports' access required")
-    
-    # Load definition from definitions DB
-    defs_conn = _get_definitions_conn()
-    if not defs_conn:
-        raise HTTPException(status_code=503, detail='Definitions DB connection unavailable')
+
+    definition = _cached_definition(definition_id)
+    if definition is None:
+        raise HTTPException(status_code=404, detail='Definition not found')
+    if not definition['active']:
+        raise HTTPException(status_code=400, detail='Definition inactive')
+    return definition
+
+
+def _bind_report_plan(definition: dict, form):
+    """Return (plan, values_dict, ordered_values) for a definition run; bad input is a 400."""
+    plan = report_plan.plan_for(definition)
     try:
-        _ensure_report_definitions_table(defs_conn)
-        cur = defs_conn.cursor()
-        cur.execute("SELECT report_name, stored_procedure, parameters, active FROM dbo.report_definitions WHERE id=?", (definition_id,))
-        row = cur.fetchone()
-        cur.close()
-        if not row:
-            raise HTTPException(status_code=404, detail='Definition not found')
-        report_name, stored_proc, params_json, active_val = row
-        if not active_val:
-            raise HTTPException(status_code=400, detail='Definition inactive')
-        try:
-            param_names = json.loads(params_json) if params_json else []
-        except Exception:
-            param_names = []
-    finally:
-        try:
-            defs_conn.close()
-        except Exception:
-            pass
+        values_dict, ordered_values = plan.bind(form)
+    except report_plan.PlanError as e:
+        raise HTTPException(status_code=400, detail={'message': 'Invalid report parameters', 'errors': e.errors})
+    return plan, values_dict, ordered_values
 
-    # Execute stored procedure against the report data DB
-    data_conn = _get_report_data_conn()
-    if not data_conn:
-        raise HTTPException(status_code=503, detail='Report data DB connection unavailable')
+
+# Audit rows (dbo.report_log / dbo.import_log) are written in batches off the request path (see app/audit_log.py)
+_report_audit = audit_log.writer('report_data', lambda: _get_report_data_conn())
+_main_audit = audit_log.writer('main', lambda: db.get_sqlserver_connection())
+
+
+def _start_report_log(report_name: str, _user, details: dict, status: str = 'running'):
+    """Queue a dbo.report_log row (default status 'running'); returns its pre-allocated id or None."""
     try:
-        cur = data_conn.cursor()
-        # Extract form values
-        values_dict = {}
-        try:
-            form = await request.form() if request is not None else {}
-            for name in param_names:
-                key = f'param_{name}'
-                values_dict[name] = form.get(key)
-        except Exception:
-            # fallback empty
-            values_dict = {n: None for n in param_names}
-        ordered_values = [values_dict.get(n) for n in param_names]
+        return _report_audit.insert('dbo.report_log', {
+            'report_name': report_name,
+            'user_name': _user.get('sub') if isinstance(_user, dict) else 'unknown',
+            'status': status,
+            'started_at': datetime.datetime.now(),
+            'details': json.dumps(details, default=str),
+        })
+    except Exception:
+        logger.warning("Failed to queue report_log row", exc_info=True)
+        return None
 
-        placeholders = ', '.join(['?'] * len(ordered_values))
-        exec_sql = f"EXEC dbo.[{stored_proc}]" + (f" {placeholders}" if placeholders else '')
 
-        # Insert running log
-        started_details = json.dumps({'stored_procedure': stored_proc, 'parameters': param_names, 'input_values': values_dict})
-        try:
-            cur.execute("INSERT INTO dbo.report_log (report_name, user_name, status, details) VALUES (?, ?, 'running', ?)",
-                        (report_name, _user.get('sub') if isinstance(_user, dict) else 'unknown', started_details))
-            data_conn.commit()
-            cur.execute("SELECT @@IDENTITY")
-            rid_row = cur.fetchone()
-            log_id = int(rid_row[0]) if rid_row and rid_row[0] else None
-        except Exception:
-            log_id = None
+def _set_report_log_status(log_id, status: str):
+    """Move a dbo.report_log row to another non-final status (e.g. a queued job starting)."""
+    _report_audit.update('dbo.report_log', log_id, {'status': status, 'started_at': datetime.datetime.now()})
+
+
+def _finish_report_log(log_id, status: str, details: dict):
+    """Close out a dbo.report_log row."""
+    _report_audit.update('dbo.report_log', log_id, {
+        'finished_at': datetime.datetime.now(),
+        'status': status,
+        'details': json.dumps(details, default=str),
+    })
 
-        rows = []
-        cols = []
-        error_details = None
+
+def _fetch_for_cache(cur, limit_bytes: int):
+    """Read converted rows until the cursor ends or `limit_bytes` is exceeded.
+
+    Returns (rows, size, complete); when not complete the cursor still has rows.
+    """
+    rows, size = [], 0
+    while True:
+        batch = cur.fetchmany(result_sessions.FETCH_BATCH)
+        converted = [[_safe_cell(x) for x in r] for r in batch]
+        rows.extend(converted)
+        size += report_cache.estimate_size(converted)
+        if len(batch) < result_sessions.FETCH_BATCH:
+            return rows, size, True
+        if size > limit_bytes:
+            return rows, size, False
+
+
+def _prepare_report_run(definition_id: int, form, _user, log_status: str = 'running') -> dict:
+    """Permission check, definition load, report_log row and cache lookup for a run."""
+    definition = _load_runnable_definition(definition_id, _user)
+    stored_proc, param_names = definition['stored_procedure'], definition['parameters']
+    plan, values_dict, ordered_values = _bind_report_plan(definition, form)
+    log_id = _start_report_log(definition['report_name'], _user,
+                               {'stored_procedure': stored_proc, 'parameters': param_names, 'input_values': values_dict},
+                               status=log_status)
+
+    key = report_cache.make_key(definition_id, stored_proc, values_dict, definition['updated_at'])
+    timeout_seconds = _report_timeout_seconds(definition['options'])
+    cache_ttl = report_cache.ttl_for(definition['options'])
+    cached = None
+    cache_status = 'bypass'
+    if cache_ttl > 0:
+        cached = report_cache.get(key)
+        cache_status = 'hit' if cached is not None else 'miss'
+    return {
+        'definition_id': definition_id,
+        'username': _user.get('sub') if isinstance(_user, dict) else None,
+        'report_name': definition['report_name'],
+        'stored_procedure': stored_proc,
+        'parameters': param_names,
+        'values': values_dict,
+        'ordered_values': ordered_values,
+        'plan': plan,
+        'log_id': log_id,
+        'flight_key': key,
+        'cache_key': key if cache_ttl > 0 else None,
+        'cache_ttl': cache_ttl,
+        'cache_status': cache_status,
+        'cached': cached,
+        'timeout_seconds': timeout_seconds,
+    }
+
+
+def _execute_report_run(run: dict, shared: Optional[dict] = None, flight=None):
+    """Blocking part of `/report/run`; runs on the DB executor.
+
+    `shared` is a result published by a coalesced leader run; `flight` is set when
+    this run is the leader and should publish its result to waiting callers.
+    """
+    owner = run['username'] or 'unknown'
+    cache_key, cache_ttl = run['cache_key'], run['cache_ttl']
+    rows = []
+    cols = []
+    page = None
+    error_details = None
+    data_conn = None
+    cur = None
+    coalesced_with = None
+    started = time.monotonic()
+    try:
         try:
-            if ordered_values:
-                cur.execute(exec_sql, ordered_values)
+            if run['cached'] is not None or shared is not None:
+                source = run['cached'] if run['cached'] is not None else shared
+                if shared is not None:
+                    coalesced_with = shared.get('log_id')
+                if source.get('error'):
+                    if source.get('status') == 'timeout':
+                        raise ReportRunTimeout(source['error'])
+                    raise RuntimeError(source['error'])
+                cols = source['columns']
+                page = result_sessions.open_session(owner, cols, None,
+                                                    report_cache.RowsCursor(source['rows']), _safe_cell)
+                rows = page['rows']
             else:
-                cur.execute(exec_sql)
-            try:
-                cols = [c[0] for c in cur.description] if cur.description else []
-                fetched = cur.fetchall()
-                for r in fetched[:100]:
-                    rows.append([_safe_cell(x) for x in r])
-            except Exception:
-                pass
+                # Execute stored procedure against the report data DB
+                result_sessions.release_connections()
+                data_conn = _get_report_data_conn()
+                if not data_conn:
+                    raise HTTPException(status_code=503, detail='Report data DB connection unavailable')
+                data_conn.timeout = run['timeout_seconds']
+                cur = data_conn.cursor()
+                try:
+                    run['plan'].execute(cur, run['ordered_values'])
+                except Exception as e:
+                    err = _as_report_timeout(e, run['timeout_seconds'])
+                    if flight is not None:
+                        flight.publish({'error': str(err), 'log_id': run['log_id'],
+                                        'status': 'timeout' if isinstance(err, ReportRunTimeout) else 'error'})
+                    if err is not e:
+                        raise err from e
+                    raise
+                try:
+                    description = cur.description
+                except Exception:
+                    # Procedures that return no result set (e.g. only modify data)
+                    description = None
+                try:
+                    cols = [c[0] for c in description] if description else []
+                    if not description:
+                        if flight is not None:
+                            flight.publish({'columns': [], 'rows': [], 'log_id': run['log_id']})
+                    else:
+                        share = flight is not None and flight.waiters > 0
+                        complete = False
+                        if cache_key is not None or share:
+                            prefetched, size, complete = _fetch_for_cache(cur, report_cache.REPORT_CACHE_MAX_ENTRY_BYTES)
+                            if complete:
+                                if cache_key is not None:
+                                    report_cache.put(cache_key, {'columns': cols, 'rows': prefetched}, cache_ttl, size)
+                                if flight is not None:
+                                    flight.publish({'columns': cols, 'rows': prefetched, 'log_id': run['log_id']})
+                                cur.close()
+                                cursor_for_session = report_cache.RowsCursor(prefetched)
+                            else:
+                                cursor_for_session = report_cache.RowsCursor(prefetched, cur)
+                        else:
+                            cursor_for_session = cur
+                        if flight is not None:
+                            # Too large to share (or nobody waiting): followers run it themselves
+                            flight.publish(None)
+                        # Only the first page is returned here; the result session keeps the
+                        # cursor (and pins the connection) while the client pages through the rest
+                        session_conn = None
+                        if not complete:
+                            session_conn, data_conn = data_conn, None
+                        try:
+                            page = result_sessions.open_session(owner, cols, session_conn, cursor_for_session, _safe_cell)
+                        except Exception:
+                            if session_conn is not None:
+                                session_conn.close()
+                            raise
+                        rows = page['rows']
+                except Exception as e:
+                    err = _as_report_timeout(e, run['timeout_seconds'])
+                    if flight is not None:
+                        flight.publish({'error': str(err), 'log_id': run['log_id'],
+                                        'status': 'timeout' if isinstance(err, ReportRunTimeout) else 'error'})
+                    if err is not e:
+                        raise err from e
+                    raise
             status = 'success'
+        except HTTPException as e:
+            _finish_report_log(run['log_id'], 'error', {'stored_procedure': run['stored_procedure'], 'error': e.detail})
+            raise
         except Exception as e:
-            status = 'error'
+            status = 'timeout' if isinstance(e, ReportRunTimeout) else 'error'
             error_details = str(e)
 
-        # Update log
-        final_details = json.dumps({
-            'stored_procedure': stored_proc,
-            'parameters': param_names,
-            'input_values': values_dict,
+        # Update log; the data connection may now belong to the result session
+        details = {
+            'stored_procedure': run['stored_procedure'],
+            'parameters': run['parameters'],
+            'input_values': run['values'],
             'columns': cols,
             'rows_returned': len(rows),
+            'total_rows': page['total_rows'] if page else None,
+            'cache': run['cache_status'],
+            'coalesced': shared is not None,
+            'timeout_seconds': run['timeout_seconds'],
+            'elapsed_ms': round((time.monotonic() - started) * 1000),
             'error': error_details
-        })
-        try:
-            if log_id is not None:
-                cur.execute("UPDATE dbo.report_log SET finished_at = SYSDATETIME(), status = ?, details = ? WHERE id = ?",
-                            (status, final_details, log_id))
-                data_conn.commit()
-        except Exception:
-            pass
+        }
+        if coalesced_with is not None:
+            details['coalesced_with'] = coalesced_with
+        _finish_report_log(run['log_id'], status, details)
 
-        cur.close()
+        if page is None and cur is not None:
+            cur.close()
         return {
             'ok': status == 'success',
-            'report_log_id': log_id,
-            'report_name': report_name,
-            'stored_procedure': stored_proc,
-            'parameters': param_names,
-            'input_values': values_dict,
+            'report_log_id': run['log_id'],
+            'report_name': run['report_name'],
+            'stored_procedure': run['stored_procedure'],
+            'parameters': run['parameters'],
+            'input_values': run['values'],
             'columns': cols,
             'rows': rows,
             'rows_returned': len(rows),
+            'result_id': page['result_id'] if page else None,
+            'total_rows': page['total_rows'] if page else None,
+            'has_more': page['has_more'] if page else False,
+            'next_token': page['next_token'] if page else None,
+            'cache': run['cache_status'],
+            'coalesced': shared is not None,
             'status': status,
             'error': error_details
         }
+    finally:
+        if data_conn is not None:
+            try:
+                data_conn.close()
+            except Exception:
+                pass
+
+
+@router.get('/report/results/{result_id}')
+@db_route('report_data')
+def get_report_result_page(
+    result_id: str,
+    offset: int = 0,
+    limit: int = result_sessions.RESULT_PAGE_SIZE,
+    token: Optional[str] = None,
+    _user=Depends(get_current_user)
+):
+    """Return a page of a `/report/run` result set.
+
+    Page either with `offset`/`limit` or by passing the `next_token` from the
+    previous page as `token`. `total_rows` is null until the last row has been read.
+    """
+    username = _user.get('sub') if isinstance(_user, dict) else None
+    try:
+        if token:
+            token_id, offset = result_sessions.decode_token(token)
+            if token_id != result_id:
+                raise result_sessions.ResultSessionError('Token does not belong to this result set')
+        return result_sessions.get_page(result_id, username or 'unknown', offset, limit)
+    except result_sessions.ResultSessionError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except result_sessions.ResultFetchError as e:
+        logger.error(f"Paging result {result_id} failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete('/report/results/{result_id}')
+@db_route('report_data')
+def close_report_result(result_id: str, _user=Depends(get_current_user)):
+    """Release a result set early (frees its cursor, connection and spool file)."""
+    username = _user.get('sub') if isinstance(_user, dict) else None
+    if not result_sessions.close_session(result_id, username or 'unknown'):
+        raise HTTPException(status_code=404, detail='Result set not found or expired')
+    return {'ok': True}
+
+
+def _open_report_export(definition_id: int, form, _user, fmt: str):
+    """Execute the definition for an export and return the open stream state."""
+    definition = _load_runnable_definition(definition_id, _user)
+    report_name, stored_proc, param_names = definition['report_name'], definition['stored_procedure'], definition['parameters']
+    plan, values_dict, ordered_values = _bind_report_plan(definition, form)
+    timeout_seconds = _report_timeout_seconds(definition['options'])
+    result_sessions.release_connections()
+    data_conn = _get_report_data_conn()
+    if not data_conn:
+        raise HTTPException(status_code=503, detail='Report data DB connection unavailable')
+    details = {'stored_procedure': stored_proc, 'parameters': param_names, 'input_values': values_dict,
+               'export_format': fmt, 'timeout_seconds': timeout_seconds}
+    log_id = _start_report_log(report_name, _user, details)
+    data_conn.timeout = timeout_seconds
+    cur = data_conn.cursor()
+    try:
+        plan.execute(cur, ordered_values)
+        encoder = report_export.make_encoder(fmt, cur.description, _safe_cell)
+    except Exception as e:
+        err = _as_report_timeout(e, timeout_seconds)
+        timed_out = isinstance(err, ReportRunTimeout)
+        _finish_report_log(log_id, 'timeout' if timed_out else 'error', dict(details, error=str(err)))
+        data_conn.close()
+        if timed_out:
+            raise HTTPException(status_code=504, detail=str(err))
+        raise HTTPException(status_code=500, detail=f'Report failed: {e}')
+    details['columns'] = [c[0] for c in cur.description] if cur.description else []
+    return {'report_name': report_name, 'format': fmt, 'conn': data_conn, 'cursor': cur,
+            'encoder': encoder, 'log_id': log_id, 'details': details, 'timeout_seconds': timeout_seconds}
+
+
+def _next_export_chunk(export: dict):
+    """Fetch and encode the next batch; returns (bytes, row_count), row_count 0 at the end."""
+    cur = export['cursor']
+    if not cur.description:
+        return b'', 0
+    batch = cur.fetchmany(export['encoder'].batch_size)
+    if not batch:
+        return b'', 0
+    return export['encoder'].encode(batch), len(batch)
+
+
+def _close_report_export(export: dict, status: str, rows: int, nbytes: int, error: Optional[str]):
+    try:
+        export['cursor'].close()
+    except Exception:
+        pass
+    spool = export.get('spool')
+    if spool is not None:
+        spool.close()
+        if status != 'success':
+            for path in (spool.name, spool.name + '.owner'):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+    details = dict(export['details'], rows_streamed=rows, bytes_streamed=nbytes, error=error)
+    if spool is not None and status == 'success':
+        details['spool_file'] = export['spool_file']
+    _finish_report_log(export['log_id'], status, details)
+    try:
+        export['conn'].close()
+    except Exception:
+        pass
+
+
+async def _stream_report_export(export: dict):
+    status, rows, nbytes, error = 'error', 0, 0, None
+    spool = export.get('spool')
+
+    def _emit(chunk):
+        if spool is not None:
+            spool.write(chunk)
+        return chunk
+
+    try:
+        chunk = export['encoder'].header()
+        if chunk:
+            nbytes += len(chunk)
+            yield _emit(chunk)
+        while True:
+            chunk, count = await run_in_db(_next_export_chunk, export, database='report_data')
+            if not count:
+                break
+            rows += count
+            if chunk:
+                nbytes += len(chunk)
+                yield _emit(chunk)
+        chunk = export['encoder'].finish()
+        if chunk:
+            nbytes += len(chunk)
+            yield _emit(chunk)
+        status = 'success'
+    except (GeneratorExit, asyncio.CancelledError):
+        # Client went away mid-download
+        status = 'cancelled'
+        raise
+    except Exception as e:
+        err = _as_report_timeout(e, export['timeout_seconds'])
+        if isinstance(err, ReportRunTimeout):
+            status = 'timeout'
+        error = str(err)
+        logger.exception('Report export failed after %s rows', rows)
+        raise
     finally:
         try:
-            data_conn.close()
-        except Exception:
+            await asyncio.shield(run_in_db(_close_report_export, export, status, rows, nbytes, error,
+                                           database='report_data'))
+        except BaseException:
             pass
-    """Return a pyodbc connection to the separate 'report' database if configured.
-    Falls back to main SQL Server connection if no separate DB provided.
+
+
+@router.post('/report/run/{definition_id}/export')
+async def export_report(definition_id: int, format: str = 'csv', spool: bool = False, request: Request = None,
+                        _user=Depends(get_current_user)):
+    """Stream the full result of a definition run as CSV, TSV, NDJSON, Arrow IPC or Parquet.
+
+    Parameters are posted as `param_<name>` form fields, as for `/report/run`.
+    Rows are fetched and encoded in batches, so memory use does not grow with the
+    result size. Arrow/Parquet keep the column types reported by the driver.
+    With `spool=true` a copy is also written to `instance/results/exports` and
+    its id returned in the `X-Export-File` header (see `/report/exports/{file_id}`).
+    Rows and bytes streamed are recorded in `dbo.report_log`.
     """
+    fmt = (format or 'csv').lower()
+    if fmt not in report_export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format '{format}'")
     try:
-        import pyodbc
+        report_export.check_format_available(fmt)
+    except report_export.ExportUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    try:
+        form = await request.form() if request is not None else {}
     except Exception:
-        return None
+        form = {}
+    export = await run_in_db(_open_report_export, definition_id, form, _user, fmt, database='report_data')
+    media_type, ext = report_export.EXPORT_FORMATS[fmt]
+    base = re.sub(r'[^A-Za-z0-9_.-]+', '_', export['report_name'] or 'report').strip('_') or 'report'
+    headers = {'Content-Disposition': f'attachment; filename="{base}.{ext}"'}
+    if spool:
+        username = _user.get('sub') if isinstance(_user, dict) else None
+        export['spool_file'], export['spool'] = report_export.new_spool_file(ext, username or 'unknown')
+        headers['X-Export-File'] = export['spool_file']
+    return StreamingResponse(_stream_report_export(export), media_type=media_type, headers=headers)
+
+
+@router.get('/report/exports/{file_id}')
+async def download_spooled_export(file_id: str, _user=Depends(get_current_user)):
+    """Download an export previously written with `spool=true` by the caller (any export for admins)."""
+    username = _user.get('sub') if isinstance(_user, dict) else None
+    is_admin = isinstance(_user, dict) and _user.get('role') == 'admin'
+    path = report_export.spool_path(file_id, None if is_admin else (username or 'unknown'))
+    if not path:
+        raise HTTPException(status_code=404, detail='Export not found or expired')
+    ext = os.path.splitext(file_id)[1].lstrip('.')
+    media_type = next((m for m, e in report_export.EXPORT_FORMATS.values() if e == ext), 'application/octet-stream')
+    return FileResponse(path, media_type=media_type, filename=file_id)
+
+
+def _run_report_job(job, run: dict):
+    """Worker body of a background report job: execute, spool every row, update report_log."""
+    _set_report_log_status(run['log_id'], 'running')
+    data_conn = None
+    session = None
+    started = time.monotonic()
+    timeout = run['timeout_seconds']
+    details = {
+        'stored_procedure': run['stored_procedure'],
+        'parameters': run['parameters'],
+        'input_values': run['values'],
+        'cache': run['cache_status'],
+        'job_id': job.id,
+        'timeout_seconds': timeout,
+    }
 
-    s = dbc.load_settings()
-    # If a separate report database is configured, use it; else fall back
-    server = s.get('host')
-    report_db = s.get('report_database') or s.get('reports_database')
-    main_db = s.get('database')
-    if not server or not (report_db or main_db):
-        return None
+    def _progress(n):
+        job.update(rows_fetched=n)
+        job.check_cancelled()
+        # The statement timeout only covers execution; bound fetching the rows as well
+        if timeout and time.monotonic() - started > timeout:
+            raise ReportRunTimeout(f'Report exceeded its {timeout}s timeout')
 
-    driver = _pick_odbc_driver(s.get('driver'))
-    parts = [f'DRIVER={{{driver}}}', f'SERVER={server}', f'DATABASE={report_db or main_db}']
-    if s.get('trusted', True):
-        parts.append('Trusted_Connection=yes')
-    else:
-        uid = s.get('username') or ''
-        pwd = s.get('password') or ''
-        if uid:
-            parts.append(f'UID={uid}')
-        if pwd:
-            parts.append(f'PWD={pwd}')
-    if s.get('encrypt', False):
-        parts.append('Encrypt=yes')
-    parts.append('TrustServerCertificate=yes')
-    conn_str = ';'.join(parts)
     try:
-        return pyodbc.connect(conn_str, timeout=5)
+        job.check_cancelled()
+        if run['cached'] is not None:
+            cols = run['cached']['columns']
+            session = result_sessions.ResultSession(job.owner, cols, None,
+                                                    report_cache.RowsCursor(run['cached']['rows']), _safe_cell)
+        else:
+            result_sessions.release_connections()
+            data_conn = _get_report_data_conn()
+            if not data_conn:
+                raise RuntimeError('Report data DB connection unavailable')
+            data_conn.timeout = timeout
+            cur = data_conn.cursor()
+            job.update(cursor=cur)
+            try:
+                run['plan'].execute(cur, run['ordered_values'])
+            except Exception as e:
+                job.check_cancelled()
+                err = _as_report_timeout(e, timeout)
+                if err is not e:
+                    raise err from e
+                raise
+            job.check_cancelled()
+            cols = [c[0] for c in cur.description] if cur.description else []
+            if cur.description:
+                # The session closes the cursor and returns the connection once drained
+                session, data_conn = result_sessions.ResultSession(job.owner, cols, data_conn, cur, _safe_cell), None
+            else:
+                cur.close()
+        job.update(columns=cols, session=session)
+        total = session.spool_all(_progress) if session is not None else 0
+        job.update(status='success', total_rows=total, rows_fetched=total, cursor=None, finished_at=time.time())
+        _finish_report_log(run['log_id'], 'success', dict(details, columns=cols, total_rows=total, error=None,
+                                                          elapsed_ms=round((time.monotonic() - started) * 1000)))
+    except Exception as e:
+        e = _as_report_timeout(e, timeout)
+        if job.cancel_requested:
+            status, error = 'cancelled', 'Report job was cancelled'
+        elif isinstance(e, ReportRunTimeout):
+            status, error = 'timeout', str(e)
+        else:
+            status, error = 'error', str(e)
+        if session is not None:
+            session.close()
+        job.update(status=status, error=error, cursor=None, session=None, finished_at=time.time())
+        _finish_report_log(run['log_id'], status, dict(details, error=error, rows_fetched=job.rows_fetched,
+                                                       elapsed_ms=round((time.monotonic() - started) * 1000)))
+    finally:
+        if data_conn is not None:
+            data_conn.close()
+
+
+def _get_owned_job(job_id: str, _user):
+    job = report_jobs.get(job_id)
+    username = _user.get('sub') if isinstance(_user, dict) else None
+    is_admin = isinstance(_user, dict) and _user.get('role') == 'admin'
+    if job is None or (job.owner != (username or 'unknown') and not is_admin):
+        raise HTTPException(status_code=404, detail='Report job not found or expired')
+    return job
+
+
+@router.post('/report/jobs')
+async def submit_report_job(definition_id: int = Form(...), request: Request = None, _user=Depends(get_current_user)):
+    """Queue a definition run in the background and return its job id immediately.
+
+    Poll `/report/jobs/{job_id}` (or subscribe to `/report/jobs/{job_id}/events`)
+    and read rows from `/report/jobs/{job_id}/result` once it has finished.
+    """
+    try:
+        form = await request.form() if request is not None else {}
     except Exception:
-        return None
+        form = {}
+    run = await run_in_db(_prepare_report_run, definition_id, form, _user, 'queued', database='report_data')
+    job = report_jobs.Job(run['username'] or 'unknown', definition_id, run['report_name'], run['log_id'])
+    try:
+        report_jobs.submit(job, lambda j: _run_report_job(j, run))
+    except report_jobs.JobQueueFull as e:
+        await run_in_db(_finish_report_log, run['log_id'], 'error', {'stored_procedure': run['stored_procedure'], 'error': str(e)},
+                        database='report_data')
+        raise HTTPException(status_code=429, detail=str(e))
+    return job.to_dict()
+
+
+@router.get('/report/jobs')
+async def list_report_jobs(_user=Depends(get_current_user)):
+    """List the caller's report jobs (all jobs for admins), newest first."""
+    is_admin = isinstance(_user, dict) and _user.get('role') == 'admin'
+    owner = None if is_admin else ((_user.get('sub') if isinstance(_user, dict) else None) or 'unknown')
+    return {'items': [j.to_dict() for j in report_jobs.list_jobs(owner)], 'stats': report_jobs.stats()}
+
+
+@router.get('/report/jobs/{job_id}')
+async def get_report_job(job_id: str, _user=Depends(get_current_user)):
+    return _get_owned_job(job_id, _user).to_dict()
+
+
+@router.post('/report/jobs/{job_id}/cancel')
+async def cancel_report_job(job_id: str, _user=Depends(get_current_user)):
+    """Cancel a queued or running job; a running statement is cancelled through the ODBC cursor."""
+    job = _get_owned_job(job_id, _user)
+    if job.finished:
+        raise HTTPException(status_code=409, detail=f"Report job is already {job.status}")
+    if await run_in_db(report_jobs.cancel, job, database='report_data'):
+        # Never reached a worker, so nothing else will close its report_log row
+        await run_in_db(_finish_report_log, job.log_id, 'cancelled',
+                        {'job_id': job.id, 'error': 'Report job was cancelled', 'elapsed_ms': 0},
+                        database='report_data')
+    return job.to_dict()
+
+
+@router.get('/report/jobs/{job_id}/result')
+async def get_report_job_result(job_id: str, offset: int = 0, limit: int = result_sessions.RESULT_PAGE_SIZE,
+                                _user=Depends(get_current_user)):
+    """Return a page of a finished job's spooled result."""
+    job = _get_owned_job(job_id, _user)
+    if job.status != 'success':
+        raise HTTPException(status_code=409, detail=f"Report job is {job.status}")
+    if job.session is None:
+        return {'job_id': job.id, 'columns': job.columns, 'rows': [], 'offset': 0, 'limit': limit,
+                'rows_returned': 0, 'total_rows': 0, 'has_more': False}
+    page = job.session.page(offset, limit)
+    page.pop('result_id', None)
+    page.pop('next_token', None)
+    page['job_id'] = job.id
+    return page
+
+
+@router.get('/report/jobs/{job_id}/events')
+async def report_job_events(job_id: str, _user=Depends(get_current_user)):
+    """Server-sent events with the job state on every change, ending once the job finishes."""
+    job = _get_owned_job(job_id, _user)
+
+    async def _events():
+        seen = -1
+        idle = 0.0
+        while True:
+            if job.version != seen:
+                seen = job.version
+                idle = 0.0
+                yield f"event: status\ndata: {json.dumps(job.to_dict(), default=str)}\n\n"
+                if job.finished:
+                    return
+            elif idle >= 15:
+                idle = 0.0
+                yield ': keep-alive\n\n'
+            await asyncio.sleep(0.5)
+            idle += 0.5
+
+    return StreamingResponse(_events(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 
 @router.get('/report/page-auth-check')
@@ -933,7 +1500,8 @@ async def report_page_auth_check(_user=Depends(get_current_user)):
 
 
 @router.get('/report/db/diag')
-async def report_db_diag(_user=Depends(get_current_user)):
+@db_route('definitions')
+def report_db_diag(_user=Depends(get_current_user)):
     """Show which database is used for report feature; detect if DB exists and return details.
 
     Returns 200 with details if the report DB exists and is reachable.
@@ -1051,7 +1619,8 @@ async def report_db_diag(_user=Depends(get_current_user)):
 
 
 @router.get('/report/db/diag/runtime')
-async def report_runtime_db_diag(_user=Depends(get_current_user)):
+@db_route('report_data')
+def report_runtime_db_diag(_user=Depends(get_current_user)):
     """Diagnose the runtime reports database (uses `reports_database` setting).
 
     Mirrors `/report/db/diag` but targets the runtime DB setting so the admin
@@ -1163,7 +1732,8 @@ async def report_runtime_db_diag(_user=Depends(get_current_user)):
 
 
 @router.get('/admin/databases')
-async def list_databases(_admin=Depends(get_current_admin)):
+@db_route('main')
+def list_databases(_admin=Depends(get_current_admin)):
     """List available SQL Server databases to help configure the report_database setting."""
     s = dbc.load_settings()
     server = s.get('host')
@@ -1201,42 +1771,63 @@ async def list_databases(_admin=Depends(get_current_admin)):
 
 # ===== ODBC driver detection helpers and endpoint =====
 def _available_odbc_drivers():
-    try:
-        import pyodbc
-        return list(pyodbc.drivers())
-    except Exception:
-        return []
+    return dbc.available_odbc_drivers()
 
 
 def _pick_odbc_driver(preferred: Optional[str]) -> str:
-    drivers = _available_odbc_drivers()
-    if preferred and preferred in drivers:
-        return preferred
-    # Prefer latest Microsoft ODBC Driver for SQL Server
-    candidates = [d for d in drivers if 'ODBC Driver' in d and 'SQL Server' in d]
-    if candidates:
-        # Sort by version number if present (e.g., 18, 17)
-        import re
-        def ver(d):
-            m = re.search(r'(\d+)', d)
-            return int(m.group(1)) if m else 0
-        candidates.sort(key=ver, reverse=True)
-        return candidates[0]
-    # Fallback to any SQL Server driver
-    legacy = [d for d in drivers if 'SQL Server' in d]
-    if legacy:
-        return legacy[0]
-    # Last resort: keep preferred or default to common latest
-    return preferred or 'ODBC Driver 18 for SQL Server'
+    return dbc.pick_odbc_driver(preferred)
 
 
 @router.get('/admin/odbc-drivers')
 async def get_odbc_drivers(_admin=Depends(get_current_admin)):
-    return {'drivers': _available_odbc_drivers()}
+    return {'drivers': dbc.available_odbc_drivers(refresh=True)}
+
+
+@router.get('/admin/db/pool-stats')
+async def get_db_pool_stats(_admin=Depends(get_current_admin)):
+    """Return checkout/reuse/eviction counters for each pyodbc connection pool."""
+    return {'pools': db_pool.pool_stats()}
+
+
+@router.get('/admin/db/executor-stats')
+async def get_db_executor_stats(_admin=Depends(get_current_admin)):
+    """Return DB executor queue depth, wait time and run time per database."""
+    return db_executor.executor_stats()
+
+
+@router.get('/admin/db/audit-stats')
+async def get_audit_log_stats(_admin=Depends(get_current_admin)):
+    """Return queue depth, batch and merge counters of the report_log/import_log writers."""
+    return {'writers': audit_log.stats()}
+
+
+@router.get('/admin/report-cache')
+async def get_report_cache_stats(_admin=Depends(get_current_admin)):
+    """Return report result cache hit/miss counters, memory use and run coalescing counters."""
+    out = report_cache.stats()
+    out['coalescing'] = _report_flights.stats()
+    out['jobs'] = report_jobs.stats()
+    out['definitions'] = _definitions.stats()
+    out['parameter_values'] = parameter_values.stats()
+    out['procedures'] = _procedures.stats()
+    out['plans'] = report_plan.stats()
+    return out
+
+
+@router.post('/admin/report-cache/invalidate')
+async def invalidate_report_cache(definition_id: Optional[int] = None, _admin=Depends(get_current_admin)):
+    """Drop cached report results and parameter value lists, for one definition or (without
+    `definition_id`) all of them; a full invalidation also reloads the procedure catalog."""
+    removed = report_cache.invalidate(definition_id)
+    removed_values = parameter_values.invalidate(definition_id)
+    if definition_id is None:
+        _procedures.invalidate()
+    return {'ok': True, 'removed': removed, 'removed_parameter_values': removed_values}
 
 
 @router.post('/report/generate')
-async def report_generate(report_name: Optional[str] = Form(None), _user=Depends(get_current_user)):
+@db_route('main')
+def report_generate(report_name: Optional[str] = Form(None), _user=Depends(get_current_user)):
     """Generate a report: ensures dbo.report_log exists, inserts a success row, and returns summary info.
 
     Optionally accepts form field 'report_name'. If not provided, a timestamp-based name is used.
@@ -1288,21 +1879,17 @@ async def report_generate(report_name: Optional[str] = Form(None), _user=Depends
         except Exception:
             pass
 
-        # Insert report_log row as success
+        cur.close()
+        # Queue the report_log row as success
         details_json = json.dumps({
             'tables': payload['tables'],
             'rows_total_estimate': payload['rows_total_estimate']
         })
-        cur.execute(
-            "INSERT INTO dbo.report_log (report_name, user_name, finished_at, status, details) VALUES (?, ?, SYSDATETIME(), 'success', ?)",
-            (name, user_name, details_json)
-        )
-        conn.commit()
-        cur.execute("SELECT @@IDENTITY")
-        rid_row = cur.fetchone()
-        if rid_row and rid_row[0]:
-            payload['report_log_id'] = int(rid_row[0])
-        cur.close()
+        now = datetime.datetime.now()
+        payload['report_log_id'] = _main_audit.insert('dbo.report_log', {
+            'report_name': name, 'user_name': user_name, 'started_at': now, 'finished_at': now,
+            'status': 'success', 'details': details_json,
+        })
     except HTTPException:
         raise
     except Exception as e:
@@ -1316,6 +1903,25 @@ async def report_generate(report_name: Optional[str] = Form(None), _user=Depends
     return payload
 
 
+def _fetch_sqlserver_login_row(username: str):
+    """Return (connected, users row or None) for a login attempt against SQL Server."""
+    conn = db.get_sqlserver_connection()
+    if not conn:
+        return False, None
+    try:
+        logger.info(f"Attempting SQL Server login for {username}")
+        # Ensure users table and seed default admin if missing
+        _ensure_users_table(conn)
+        _seed_admin_if_missing(conn)
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, username, password_hash, role, must_change_password FROM users WHERE username = ?", (username,))
+        row = cursor.fetchone()
+        cursor.close()
+        return True, row
+    finally:
+        conn.close()
+
+
 @router.post('/login')
 async def login(payload: LoginIn):
     logger.info(f"Login attempt for user: {payload.username}")
@@ -1323,18 +1929,8 @@ async def login(payload: LoginIn):
     # Check SQL Server first for users (using centralized config)
     sql_server_tried = False
     try:
-        conn = db.get_sqlserver_connection()
-        if conn:
-            logger.info(f"Attempting SQL Server login for {payload.username}")
-            # Ensure users table and seed default admin if missing
-            _ensure_users_table(conn)
-            _seed_admin_if_missing(conn)
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, username, password_hash, role, must_change_password FROM users WHERE username = ?", (payload.username,))
-            row = cursor.fetchone()
-            cursor.close()
-            conn.close()
-            
+        connected, row = await run_in_db(_fetch_sqlserver_login_row, payload.username)
+        if connected:
             sql_server_tried = True
             
             if row:
@@ -1387,33 +1983,253 @@ async def login(payload: LoginIn):
     raise HTTPException(status_code=401, detail='Invalid credentials')
 
 
-@router.get('/diag')
-async def diag():
-    info = {'db_url': getattr(db, 'DATABASE_URL', None)}
+@router.get('/diag')
+async def diag():
+    info = {'db_url': getattr(db, 'DATABASE_URL', None)}
+    try:
+        q = select(func.count(db.users.c.id))
+        cnt = await db.database.fetch_val(q)
+        info['users_count'] = cnt
+    except Exception:
+        pass
+    return info
+
+
+def _import_source(file: Optional[UploadFile], staged_file_id: Optional[str], user) -> tuple:
+    """(staged file or None, file extension, callable returning the file rewound) for a preview endpoint."""
+    if staged_file_id:
+        username = user.get('sub') if isinstance(user, dict) else None
+        try:
+            staged = upload_staging.get(staged_file_id, username or 'unknown')
+        except upload_staging.StagingError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        return staged, staged.ext, lambda: staged.path
+    if file is None:
+        raise HTTPException(status_code=400, detail="Upload a file or pass staged_file_id")
+
+    def _rewind():
+        file.file.seek(0)
+        return file.file
+    return None, os.path.splitext(file.filename)[1].lower(), _rewind
+
+
+def _cached(staged, key: str, compute):
+    return staged.cached(key, compute) if staged is not None else compute()
+
+
+def _read_sheet_names(source, file_ext: str) -> list:
+    if file_ext not in ['.xlsx', '.xls']:
+        raise HTTPException(status_code=400, detail="Only Excel files have sheets")
+    try:
+        # Only the workbook index is parsed
+        return excel_reader.sheet_names(source(), ext=file_ext)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to read Excel file: {e}")
+
+
+def _read_columns(source, file_ext: str, sheet_name: Optional[str]) -> dict:
+    """Headers plus types inferred from a sample of rows."""
+    sample_rows = schema_inference.IMPORT_INFER_SAMPLE_ROWS
+    if file_ext in ['.xlsx', '.xls']:
+        try:
+            df = excel_reader.read_head(source(), sheet_name, sample_rows, ext=file_ext)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Failed to read Excel file: {e}")
+    elif file_ext == '.csv':
+        try:
+            df = pd.read_csv(source(), nrows=sample_rows, dtype=str, keep_default_na=False, na_values=[''])
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Failed to read CSV file: {e}")
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported file type. Please upload CSV or Excel.")
+    inferred = schema_inference.infer_types(df)
+    return {'columns': [str(c) for c in df.columns], 'types': [inferred[c] for c in df.columns]}
+
+
+def _read_preview(source, file_ext: str, sheet_name: Optional[str], max_rows: int) -> dict:
+    """Columns, the first `max_rows` rows (JSON-ready) and the total row count."""
+    df = None
+    row_count = 0
+    if file_ext in ['.xlsx', '.xls']:
+        try:
+            df = excel_reader.read_head(source(), sheet_name, max_rows, ext=file_ext)
+            row_count = excel_reader.row_count(source(), sheet_name, ext=file_ext)
+        except Exception as e:
+            # If a specific sheet was requested and failed, surface a clear error
+            if sheet_name:
+                raise HTTPException(status_code=400, detail=f"Failed to read sheet '{sheet_name}': {e}")
+            raise HTTPException(status_code=400, detail=f"Failed to read Excel file: {e}")
+    elif file_ext == '.csv':
+        try:
+            df = pd.read_csv(source(), nrows=max_rows)
+            row_count = import_pipeline.count_csv_rows(source()) if len(df) >= max_rows else len(df)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Failed to read CSV file: {e}")
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported file type. Please upload CSV or Excel.")
+
+    if df is None or df.empty:
+        return {'columns': [str(c) for c in df.columns] if df is not None else [], 'rows': [], 'row_count': 0}
+
+    # Replace NaN/inf values with None for JSON serialization
+    preview_df = df.replace({pd.NA: None, pd.NaT: None})
+    preview_df = preview_df.where(pd.notna(preview_df), None)
+
+    return {
+        'columns': [str(c) for c in df.columns],
+        'rows': jsonable_encoder(preview_df.to_dict(orient='records')),
+        'row_count': row_count if row_count is not None else len(df),
+    }
+
+
+PREVIEW_MAX_ROWS = 100
+
+
+@router.post('/import/stage')
+async def stage_import_file(
+    file: UploadFile = File(...),
+    sheet_name: Optional[str] = Form(None),
+    max_rows: int = Form(10),
+    current_user: dict = Depends(get_current_user)
+):
+    """Upload an import file once and keep it on the server for `upload_staging.IMPORT_STAGING_TTL` seconds.
+
+    Returns `staged_file_id` together with the sheet names (Excel), columns,
+    inferred types and a preview of `sheet_name` (default: first sheet). Pass the
+    id as `staged_file_id` to /get-sheet-names, /get-columns, /import-preview
+    and /import-data instead of uploading the file again.
+    """
+    username = current_user.get('sub') if isinstance(current_user, dict) else None
+    if not await run_in_db(check_user_permission, username, 'import_data'):
+        raise HTTPException(status_code=403, detail="Permission denied: 'import_data' access required")
     try:
-        q = select(func.count(db.users.c.id))
-        cnt = await db.database.fetch_val(q)
-        info['users_count'] = cnt
-    except Exception:
-        pass
-    return info
+        staged = await upload_staging.stage_upload(file, username or 'unknown')
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Parsing is blocking work; keep it off the event loop
+    return await run_in_threadpool(_describe_staged, staged, sheet_name, max_rows)
+
+
+def _describe_staged(staged, sheet_name: Optional[str], max_rows: int) -> dict:
+    """Staged file info plus its sheets, columns, types and preview (parsed once and cached).
+
+    A file that cannot be parsed stays staged: the 400 carries its `staged_file_id`
+    so the client can retry with another sheet or discard it.
+    """
+    def source():
+        return staged.path
+    max_rows = max(1, min(int(max_rows or 10), PREVIEW_MAX_ROWS))
+    result = staged.info()
+    try:
+        if staged.ext in ['.xlsx', '.xls']:
+            result['sheet_names'] = staged.cached('sheet_names', lambda: _read_sheet_names(source, staged.ext))
+        result.update(staged.cached(f"columns:{sheet_name or ''}", lambda: _read_columns(source, staged.ext, sheet_name)))
+        preview = staged.cached(f"preview:{sheet_name or ''}", lambda: _read_preview(source, staged.ext, sheet_name, PREVIEW_MAX_ROWS))
+    except HTTPException as e:
+        raise HTTPException(status_code=e.status_code,
+                            detail={'message': e.detail, 'staged_file_id': staged.staged_file_id})
+    result['rows'] = preview['rows'][:max_rows]
+    result['row_count'] = preview['row_count']
+    result['sheet_name_used'] = sheet_name if staged.ext in ['.xlsx', '.xls'] else None
+    return result
+
+
+class ChunkedUploadInit(BaseModel):
+    filename: str
+    size: int
+    sha256: Optional[str] = None
+
+
+def _upload_error(e: 'upload_staging.UploadError'):
+    return HTTPException(status_code=409 if e.conflict else 400, detail={'message': str(e), 'offset': e.offset})
+
+
+@router.post('/import/uploads')
+async def init_chunked_upload(body: ChunkedUploadInit, current_user: dict = Depends(get_current_user)):
+    """Start a resumable upload of a large import file.
+
+    Send the file as `PUT /import/uploads/{staged_file_id}?offset=N` chunks (raw
+    bytes; optional `X-Chunk-Sha256` header), then `POST .../finalize`. After an
+    interruption, `GET /import/uploads/{staged_file_id}` returns the offset to
+    continue from. The finalized file is a staged file (see /import/stage).
+    """
+    username = current_user.get('sub') if isinstance(current_user, dict) else None
+    if not await run_in_db(check_user_permission, username, 'import_data'):
+        raise HTTPException(status_code=403, detail="Permission denied: 'import_data' access required")
+    try:
+        staged = upload_staging.init_upload(body.filename, body.size, username or 'unknown', body.sha256)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return upload_staging.upload_status(staged.staged_file_id, username or 'unknown')
+
+
+@router.get('/import/uploads/{staged_file_id}')
+async def chunked_upload_status(staged_file_id: str, current_user: dict = Depends(get_current_user)):
+    """Bytes received so far (`offset`), to resume an interrupted upload."""
+    username = current_user.get('sub') if isinstance(current_user, dict) else None
+    try:
+        return upload_staging.upload_status(staged_file_id, username or 'unknown')
+    except upload_staging.StagingError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.put('/import/uploads/{staged_file_id}')
+async def put_upload_chunk(staged_file_id: str, offset: int, request: Request,
+                           current_user: dict = Depends(get_current_user)):
+    """Write one chunk at `offset`; the body is streamed to the staging file, never held whole."""
+    username = current_user.get('sub') if isinstance(current_user, dict) else None
+    try:
+        new_offset = await upload_staging.write_chunk(
+            staged_file_id, username or 'unknown', offset, request.stream(), request.headers.get('x-chunk-sha256'))
+    except upload_staging.StagingError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except upload_staging.UploadError as e:
+        raise _upload_error(e)
+    return {'staged_file_id': staged_file_id, 'offset': new_offset}
+
+
+@router.post('/import/uploads/{staged_file_id}/finalize')
+async def finalize_chunked_upload(
+    staged_file_id: str,
+    sha256: Optional[str] = Form(None),
+    sheet_name: Optional[str] = Form(None),
+    max_rows: int = Form(10),
+    current_user: dict = Depends(get_current_user)
+):
+    """Verify the size and SHA-256 of an uploaded file and stage it; returns what /import/stage returns."""
+    username = current_user.get('sub') if isinstance(current_user, dict) else None
+    try:
+        # Hashing re-reads the whole file; keep it off the event loop
+        staged = await run_in_threadpool(upload_staging.finalize_upload, staged_file_id, username or 'unknown', sha256)
+    except upload_staging.StagingError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except upload_staging.UploadError as e:
+        raise _upload_error(e)
+    result = await run_in_threadpool(_describe_staged, staged, sheet_name, max_rows)
+    result['sha256'] = staged.meta['sha256']
+    return result
+
+
+@router.delete('/import/stage/{staged_file_id}')
+async def discard_staged_import_file(staged_file_id: str, current_user: dict = Depends(get_current_user)):
+    """Delete a staged file before it expires."""
+    username = current_user.get('sub') if isinstance(current_user, dict) else None
+    if not upload_staging.discard(staged_file_id, username or 'unknown'):
+        raise HTTPException(status_code=404, detail='Staged file not found or expired')
+    return {'ok': True}
 
 
 @router.post('/get-sheet-names')
-async def get_sheet_names(file: UploadFile = File(...)):
-    """Get list of sheet names from an Excel file."""
+async def get_sheet_names(
+    file: Optional[UploadFile] = File(None),
+    staged_file_id: Optional[str] = Form(None),
+    _user=Depends(get_optional_user)
+):
+    """Get list of sheet names from an Excel file (uploaded or staged)."""
     try:
-        content = await file.read()
-        file_ext = os.path.splitext(file.filename)[1].lower()
-        
-        if file_ext not in ['.xlsx', '.xls']:
-            raise HTTPException(status_code=400, detail="Only Excel files have sheets")
-        
-        excel_io = io.BytesIO(content)
-        excel_file = pd.ExcelFile(excel_io)
-        sheet_names = excel_file.sheet_names
-        
-        return {'sheet_names': sheet_names}
+        staged, file_ext, source = _import_source(file, staged_file_id, _user)
+        sheets = await run_in_threadpool(_cached, staged, 'sheet_names', lambda: _read_sheet_names(source, file_ext))
+        return {'sheet_names': sheets}
     except HTTPException:
         raise
     except Exception as e:
@@ -1422,40 +2238,21 @@ async def get_sheet_names(file: UploadFile = File(...)):
 
 @router.post('/get-columns')
 async def get_columns(
-    file: UploadFile = File(...),
-    sheet_name: Optional[str] = Form(None)
+    file: Optional[UploadFile] = File(None),
+    sheet_name: Optional[str] = Form(None),
+    staged_file_id: Optional[str] = Form(None),
+    _user=Depends(get_optional_user)
 ):
     """Return only column names from a file (no data rows).
     
     This is a lightweight endpoint for the Create Table feature.
-    Column names are taken from the first row of the file.
+    Column names are taken from the first row of the file; `types` are
+    inferred from a sample of rows.
     """
     try:
-        content = await file.read()
-        file_ext = os.path.splitext(file.filename)[1].lower()
-        
-        columns = []
-        
-        if file_ext in ['.xlsx', '.xls']:
-            read_kwargs = {'nrows': 1}  # Read just 1 row to get headers
-            if sheet_name:
-                read_kwargs['sheet_name'] = sheet_name
-            try:
-                df = pd.read_excel(io.BytesIO(content), **read_kwargs)
-                columns = [str(c) for c in df.columns]  # Convert to strings
-            except Exception as e:
-                raise HTTPException(status_code=400, detail=f"Failed to read Excel file: {e}")
-        elif file_ext == '.csv':
-            try:
-                df = pd.read_csv(io.BytesIO(content), nrows=1)  # Read just 1 row
-                columns = [str(c) for c in df.columns]  # Convert to strings
-            except Exception as e:
-                raise HTTPException(status_code=400, detail=f"Failed to read CSV file: {e}")
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file type. Please upload CSV or Excel.")
-        
-        return {'columns': columns}
-        
+        staged, file_ext, source = _import_source(file, staged_file_id, _user)
+        return await run_in_threadpool(_cached, staged, f"columns:{sheet_name or ''}",
+                                       lambda: _read_columns(source, file_ext, sheet_name))
     except HTTPException:
         raise
     except Exception as e:
@@ -1465,71 +2262,36 @@ async def get_columns(
 
 @router.post('/import-preview')
 async def import_preview(
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
     sheet_name: Optional[str] = Form(None),
-    max_rows: int = Form(10)
+    max_rows: int = Form(10),
+    staged_file_id: Optional[str] = Form(None),
+    _user=Depends(get_optional_user)
 ):
     """Return a lightweight preview of an import file (columns + first rows).
 
     This does not write anything to SQL Server; it only parses the
-    uploaded CSV/Excel file and returns:
+    uploaded (or staged) CSV/Excel file and returns:
 
     - columns: list of column names
     - rows: list of row dicts (up to max_rows)
     - sheet_name_used: which sheet was actually read (for Excel)
+
+    Only the header and the first max_rows rows are parsed; row_count comes
+    from the sheet's stored dimensions (Excel) or a one-column pass (CSV).
+    A staged file's preview is parsed once (`PREVIEW_MAX_ROWS` rows) and cached.
     """
     try:
-        content = await file.read()
-        file_ext = os.path.splitext(file.filename)[1].lower()
-
-        df = None
-        sheet_used = None
-
-        if file_ext in ['.xlsx', '.xls']:
-            read_kwargs = {}
-            if sheet_name:
-                read_kwargs['sheet_name'] = sheet_name
-            excel_io = io.BytesIO(content)
-            try:
-                df = pd.read_excel(excel_io, **read_kwargs)
-                sheet_used = sheet_name
-            except Exception as e:
-                # If a specific sheet was requested and failed, surface a clear error
-                if sheet_name:
-                    raise HTTPException(status_code=400, detail=f"Failed to read sheet '{sheet_name}': {e}")
-                raise HTTPException(status_code=400, detail=f"Failed to read Excel file: {e}")
-        elif file_ext == '.csv':
-            try:
-                df = pd.read_csv(io.BytesIO(content))
-            except Exception as e:
-                raise HTTPException(status_code=400, detail=f"Failed to read CSV file: {e}")
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file type. Please upload CSV or Excel.")
-
-        if df is None or df.empty:
-            return {
-                'columns': list(df.columns) if df is not None else [],
-                'rows': [],
-                'sheet_name_used': sheet_used,
-                'row_count': 0,
-            }
-
+        staged, file_ext, source = _import_source(file, staged_file_id, _user)
         # Clip to max_rows
-        max_rows = max(1, min(int(max_rows or 10), 100))
-        preview_df = df.head(max_rows)
-        
-        # Replace NaN/inf values with None for JSON serialization
-        preview_df = preview_df.replace({pd.NA: None, pd.NaT: None})
-        preview_df = preview_df.where(pd.notna(preview_df), None)
-        
-        rows = preview_df.to_dict(orient='records')
-
-        return {
-            'columns': list(df.columns),
-            'rows': rows,
-            'sheet_name_used': sheet_used,
-            'row_count': len(df),
-        }
+        max_rows = max(1, min(int(max_rows or 10), PREVIEW_MAX_ROWS))
+        if staged is not None:
+            preview = await run_in_threadpool(staged.cached, f"preview:{sheet_name or ''}",
+                                              lambda: _read_preview(source, file_ext, sheet_name, PREVIEW_MAX_ROWS))
+        else:
+            preview = await run_in_threadpool(_read_preview, source, file_ext, sheet_name, max_rows)
+        return dict(preview, rows=preview['rows'][:max_rows],
+                    sheet_name_used=sheet_name if file_ext in ['.xlsx', '.xls'] else None)
     except HTTPException:
         raise
     except Exception as e:
@@ -1539,7 +2301,8 @@ async def import_preview(
 
 
 @router.get('/dashboard/summary')
-async def dashboard_summary(_admin=Depends(get_current_admin)):
+@db_route('main')
+def dashboard_summary(_admin=Depends(get_current_admin)):
     """Return high-level dashboard metrics from SQL Server only.
 
     This endpoint assumes your main data lives in SQL Server and
@@ -1636,7 +2399,8 @@ async def dashboard_summary(_admin=Depends(get_current_admin)):
 
 
 @router.get('/recent-activity')
-async def recent_activity(_admin=Depends(get_current_admin)):
+@db_route('main')
+def recent_activity(_admin=Depends(get_current_admin)):
     """Return recent activity feed from import and report logs"""
     activities = []
     
@@ -1724,6 +2488,71 @@ async def recent_activity(_admin=Depends(get_current_admin)):
     return {'activities': activities}
 
 
+_import_log_has_load_columns = False
+
+
+def _parse_column_types(raw: Optional[str]) -> dict:
+    """Validate the `column_types` form field: JSON {column: SQL type}; keys are sanitized like file headers."""
+    if not raw:
+        return {}
+    try:
+        parsed = json.loads(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="column_types must be a JSON object")
+    if not isinstance(parsed, dict):
+        raise HTTPException(status_code=400, detail="column_types must be a JSON object")
+    invalid = [f"{k}: {v}" for k, v in parsed.items() if not isinstance(v, str) or not schema_inference.valid_type(v)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Unsupported column types: {', '.join(invalid)}")
+    return {import_pipeline.sanitize_name(str(k).strip()): v.strip() for k, v in parsed.items()}
+
+
+def _ensure_import_log_load_columns(conn):
+    """Add dbo.import_log.load_strategy / rows_per_second once per process, if the table exists."""
+    global _import_log_has_load_columns
+    if _import_log_has_load_columns:
+        return
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            IF OBJECT_ID('dbo.import_log', 'U') IS NOT NULL
+            BEGIN
+              IF COL_LENGTH('dbo.import_log', 'load_strategy') IS NULL
+                ALTER TABLE dbo.import_log ADD load_strategy NVARCHAR(30) NULL;
+              IF COL_LENGTH('dbo.import_log', 'rows_per_second') IS NULL
+                ALTER TABLE dbo.import_log ADD rows_per_second DECIMAL(18,2) NULL;
+            END
+        """)
+        conn.commit()
+        _import_log_has_load_columns = True
+    except Exception:
+        logger.warning("Could not add load columns to dbo.import_log; rows/s will not be logged", exc_info=True)
+    finally:
+        cur.close()
+
+
+def _import_log_row(file_name, file_size, file_ext, sheet_name, target_table, settings, create_new,
+                    rows_total, columns_count, column_names, column_types, current_user) -> dict:
+    """Initial dbo.import_log row for an import attempt (status 'started')."""
+    return {
+        'file_name': file_name,
+        'file_size': file_size,
+        'file_type': file_ext.replace('.', ''),  # file type without dot
+        'sheet_name': sheet_name or '',
+        'table_name': target_table,
+        'database_name': settings.get('database', ''),
+        'create_new_table': 1 if create_new == 'true' else 0,
+        'rows_total': rows_total,
+        'rows_imported': 0,
+        'columns_imported': columns_count,
+        'column_names': ','.join(column_names)[:4000],  # Limit to 4000 chars
+        'column_types': ','.join(column_types)[:4000],  # Limit to 4000 chars
+        'user_name': (current_user or {}).get('sub') or (current_user or {}).get('username') or 'unknown',
+        'status': 'started',
+        'started_at': datetime.datetime.now(),
+    }
+
+
 @router.post('/import-data')
 async def import_data(
     files: Optional[List[UploadFile]] = File(None),
@@ -1731,24 +2560,39 @@ async def import_data(
     create_new: Optional[str] = Form(None),
     sheet_name: Optional[str] = Form(None),
     duplicate_action: Optional[str] = Form(None),  # 'append', 'overwrite', or 'skip'
+    load_strategy: Optional[str] = Form(None),  # 'executemany' or 'bulk_insert'; default IMPORT_LOAD_STRATEGY
+    column_types: Optional[str] = Form(None),  # JSON {"column": "SQL type"} overriding inferred types
+    staged_file_id: Optional[List[str]] = Form(None),  # files from /import/stage, instead of uploading them again
     current_user: dict = Depends(get_current_user)
 ):
     """Import CSV files into SQL Server table using PowerShell"""
     # Check permission
     username = current_user.get('sub') if isinstance(current_user, dict) else None
-    if not check_user_permission(username, 'import_data'):
+    if not await run_in_db(check_user_permission, username, 'import_data'):
         raise HTTPException(status_code=403, detail="Permission denied: 'import_data' access required")
     
     try:
-        if not files:
+        if not files and not staged_file_id:
             logger.info("Import data called with no files")
             return {'success': True, 'rows_imported': 0}
+
+        try:
+            staged_files = [upload_staging.get(sid, username or 'unknown') for sid in staged_file_id or []]
+        except upload_staging.StagingError as e:
+            raise HTTPException(status_code=404, detail=str(e))
         
+        if load_strategy and load_strategy not in bulk_loader.STRATEGIES:
+            raise HTTPException(status_code=400, detail=f"load_strategy must be one of: {', '.join(bulk_loader.STRATEGIES)}")
+        type_overrides = _parse_column_types(column_types)
+
         # Verify SQL Server connection
-        conn = db.get_sqlserver_connection()
+        conn = await run_in_db(db.get_sqlserver_connection)
         if not conn:
             raise HTTPException(status_code=503, detail="SQL Server not available")
-        conn.close()
+        try:
+            await run_in_db(_ensure_import_log_load_columns, conn)
+        finally:
+            conn.close()
         
         # Load database settings for PowerShell script
         from . import db_connection as dbc
@@ -1762,13 +2606,15 @@ async def import_data(
         results = []
         created_table = None
         
-        for f in files:
-            logger.info(f"Processing file: {f.filename}")
+        def _import_one(filename, path, file_size):
+            """Import a single uploaded file; runs on the DB executor."""
+            nonlocal total_rows, created_table
+            logger.info(f"Processing file: {filename}")
             
             # Determine table name
             if create_new == 'true':
                 # Create table from filename (remove .csv extension and sanitize)
-                base_name = os.path.splitext(f.filename)[0]
+                base_name = os.path.splitext(filename)[0]
                 # Sanitize table name: remove special chars, replace spaces with underscores
                 target_table = re.sub(r'[^a-zA-Z0-9_]', '_', base_name)
                 # Ensure it starts with a letter
@@ -1783,9 +2629,7 @@ async def import_data(
                 raise HTTPException(status_code=400, detail="Table name is required")
             
             # Detect file type and convert to CSV if needed
-            file_ext = os.path.splitext(f.filename)[1].lower()
-            content = await f.read()
-            file_size = len(content) if content is not None else 0
+            file_ext = os.path.splitext(filename)[1].lower()
 
             # Duplicate check in SQL Server import_log (by file_name, table_name, file_size, success)
             # Skip check if duplicate_action is 'append' or 'overwrite'
@@ -1793,6 +2637,9 @@ async def import_data(
             should_truncate = duplicate_action == 'overwrite'
             
             if not skip_duplicate_check:
+                # Earlier imports may still have their import_log rows queued
+                if not _main_audit.flush():
+                    logger.warning("import_log writer still busy; duplicate check may miss recent imports")
                 try:
                     conn = db.get_sqlserver_connection()
                     if conn:
@@ -1806,13 +2653,13 @@ async def import_data(
                                 ORDER BY finished_at DESC
                                 ELSE SELECT NULL, NULL, NULL
                                 """,
-                                (f.filename, target_table, file_size)
+                                (filename, target_table, file_size)
                             )
                             dup = cur.fetchone()
                             if dup and dup[0] is not None:
-                                logger.info(f"Duplicate detected for file {f.filename} into {target_table} (size {file_size} bytes)")
+                                logger.info(f"Duplicate detected for file {filename} into {target_table} (size {file_size} bytes)")
                                 results.append({
-                                    'file': f.filename,
+                                    'file': filename,
                                     'success': False,
                                     'error': 'This file was already imported for this table with the same size.',
                                     'duplicate': True,
@@ -1824,7 +2671,7 @@ async def import_data(
                                 })
                                 cur.close()
                                 conn.close()
-                                continue
+                                return
                         finally:
                             try:
                                 cur.close()
@@ -1838,414 +2685,238 @@ async def import_data(
                     # Duplicate check failures should not block import; just log
                     logger.warning("Duplicate import check failed; proceeding without dedupe", exc_info=True)
             
+            # Determine if_exists mode based on duplicate_action
+            # 'overwrite' -> replace the table (truncate + insert)
+            # 'append' -> append to existing table
+            # default (new table) -> replace
+            if should_truncate:
+                sql_if_exists = 'replace'
+                logger.info(f"Overwrite mode: will replace table {target_table}")
+            elif duplicate_action == 'append':
+                sql_if_exists = 'append'
+                logger.info(f"Append mode: will add to table {target_table}")
+            elif create_new == 'true':
+                sql_if_exists = 'replace'
+            else:
+                sql_if_exists = 'append'  # Default to append for existing tables
+
+            import_log_id = None
+            load_result = None
             if file_ext in ['.xlsx', '.xls']:
-                # Convert Excel to CSV
-                logger.info(f"Converting Excel file to CSV: {f.filename}")
+                # Stream the sheet in chunks (openpyxl read-only); only one chunk is in memory at a time
                 try:
-                    # If sheet_name provided, try to use it; otherwise pandas default (first sheet)
-                    read_kwargs = {}
-                    if sheet_name:
-                        read_kwargs['sheet_name'] = sheet_name
-                    df = pd.read_excel(io.BytesIO(content), **read_kwargs)
-                    
-                    # Drop columns that are entirely empty
-                    df = df.dropna(axis=1, how='all')
-                    
-                    # Drop rows that are entirely empty
-                    df = df.dropna(axis=0, how='all')
-                    
-                    # Reset index after dropping rows
-                    df = df.reset_index(drop=True)
-                    
-                    # Fix duplicate column names by making them unique
-                    new_cols = []
-                    col_counts = {}
-                    for idx, col in enumerate(df.columns):
-                        # Handle empty/unnamed columns
-                        if pd.isna(col) or str(col).strip() == '' or str(col).startswith('Unnamed:'):
-                            col_str = f"Column_{idx+1}"
-                        else:
-                            col_str = str(col).strip()
-                        
-                        # Sanitize column names - replace any non-alphanumeric chars (except underscore) with underscore
-                        # This must match the logic in /create-table endpoint
-                        import re
-                        col_str = re.sub(r'[^a-zA-Z0-9_]', '_', col_str)
-                        
-                        # Ensure column name starts with a letter
-                        if col_str and not col_str[0].isalpha():
-                            col_str = 'col_' + col_str
-                        
-                        if col_str in col_counts:
-                            col_counts[col_str] += 1
-                            new_col = f"{col_str}_{col_counts[col_str]}"
-                            new_cols.append(new_col)
-                            logger.info(f"Renamed duplicate column '{col_str}' to '{new_col}'")
-                        else:
-                            col_counts[col_str] = 0
-                            new_cols.append(col_str)
-                    df.columns = new_cols
-                    
-                    # Convert all columns to string to avoid type issues
-                    for col in df.columns:
-                        df[col] = df[col].astype(str).replace('nan', '').replace('None', '').replace('NaT', '')
-                    
-                    logger.info(f"Final columns ({len(df.columns)} total): {list(df.columns)}")
-                    logger.info(f"DataFrame shape: {df.shape} (rows, columns)")
-                    
-                    # Create import_log entry FIRST to get import_log_id for tracking
-                    import_log_id = None
-                    import_start_time = datetime.datetime.now()
-                    column_names_list = list(df.columns)
-                    column_types_list = [str(df[col].dtype) for col in df.columns]
-                    rows_total = len(df)
-                    columns_count = len(df.columns)
-                    
-                    try:
-                        conn_log = db.get_sqlserver_connection()
-                        if conn_log:
-                            cur_log = conn_log.cursor()
-                            try:
-                                cur_log.execute(
-                                    """
-                                    INSERT INTO dbo.import_log
-                                        (file_name, file_size, file_type, sheet_name, table_name, database_name,
-                                         create_new_table, rows_total, rows_imported, columns_imported, column_names,
-                                         column_types, user_name, status, started_at, finished_at)
-                                    OUTPUT INSERTED.id
-                                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?, ?, ?, 'started', GETDATE(), NULL)
-                                    """,
-                                    (
-                                        f.filename,
-                                        file_size,
-                                        file_ext.replace('.', ''),
-                                        sheet_name or '',
-                                        target_table,
-                                        settings.get('database', ''),
-                                        1 if create_new == 'true' else 0,
-                                        rows_total,
-                                        columns_count,
-                                        ','.join(column_names_list)[:4000],
-                                        ','.join(column_types_list)[:4000],
-                                        (current_user or {}).get('sub') or (current_user or {}).get('username') or 'unknown',
-                                    )
-                                )
-                                row = cur_log.fetchone()
-                                if row:
-                                    import_log_id = row[0]
-                                conn_log.commit()
-                            finally:
-                                try:
-                                    cur_log.close()
-                                except Exception:
-                                    pass
-                                try:
-                                    conn_log.close()
-                                except Exception:
-                                    pass
-                    except Exception:
-                        logger.warning("Failed to insert initial import_log row", exc_info=True)
-                    
-                    # Add _import_id column to track which import this data came from
-                    if import_log_id is not None:
-                        df['_import_id'] = import_log_id
-                    
-                    # Insert directly to SQL Server using pandas + pyodbc (skip CSV/PowerShell)
-                    try:
-                        import urllib
-                        from sqlalchemy import create_engine, text
-                        from .db_connection import get_sqlserver_connection
-                        
-                        # Get connection info from settings
-                        conn_info = get_sqlserver_connection()
-                        server = conn_info['server']
-                        database = conn_info['database']
-                        
-                        # Build SQLAlchemy connection string
-                        params = urllib.parse.quote_plus(
-                            f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-                            f"SERVER={server};"
-                            f"DATABASE={database};"
-                            f"Trusted_Connection=yes"
-                        )
-                        engine = create_engine(f"mssql+pyodbc:///?odbc_connect={params}", fast_executemany=True)
-                        
-                        # Determine if_exists mode based on duplicate_action
-                        # 'overwrite' -> replace the table (truncate + insert)
-                        # 'append' -> append to existing table
-                        # default (new table) -> replace
-                        if should_truncate:
-                            sql_if_exists = 'replace'
-                            logger.info(f"Overwrite mode: will replace table {target_table}")
-                        elif duplicate_action == 'append':
-                            sql_if_exists = 'append'
-                            logger.info(f"Append mode: will add to table {target_table}")
-                        elif create_new == 'true':
-                            sql_if_exists = 'replace'
-                        else:
-                            sql_if_exists = 'append'  # Default to append for existing tables
-                        
-                        # For append mode, filter DataFrame columns to match existing table columns
-                        if sql_if_exists == 'append':
-                            try:
-                                with engine.connect() as conn:
-                                    # Get existing table columns
-                                    result = conn.execute(text(f"SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = '{target_table}'"))
-                                    existing_cols = [row[0] for row in result.fetchall()]
-                                    if existing_cols:
-                                        # Filter DataFrame to only include columns that exist in target table
-                                        matching_cols = [c for c in df.columns if c in existing_cols]
-                                        missing_in_table = [c for c in df.columns if c not in existing_cols]
-                                        extra_in_table = [c for c in existing_cols if c not in df.columns and c != '_id']
-                                        
-                                        if missing_in_table:
-                                            logger.warning(f"Columns in file but not in table (will be skipped): {missing_in_table}")
-                                        if extra_in_table:
-                                            logger.warning(f"Columns in table but not in file: {extra_in_table}")
-                                        
-                                        if matching_cols:
-                                            df = df[matching_cols]
-                                            logger.info(f"Filtered to {len(matching_cols)} matching columns: {matching_cols}")
-                                        else:
-                                            raise ValueError(f"No matching columns between file and table. File has: {list(df.columns)}, Table has: {existing_cols}")
-                            except Exception as col_err:
-                                logger.warning(f"Could not check table columns: {col_err}")
-                        
-                        # Insert data using pandas to_sql
-                        logger.info(f"Inserting {len(df)} rows into {target_table} (mode: {sql_if_exists})...")
-                        df.to_sql(
-                            name=target_table,
-                            con=engine,
-                            if_exists=sql_if_exists,
-                            index=False,
-                            chunksize=1000,
-                            method='multi'
-                        )
-                        
-                        rows_imported = len(df)
-                        logger.info(f"Successfully inserted {rows_imported} rows into {target_table}")
-                        
-                        # No need for PowerShell anymore, skip tmp_path creation
-                        tmp_path = None
-                        
-                    except Exception as sql_err:
-                        logger.error(f"Direct SQL insert failed: {str(sql_err)}")
-                        # Fallback to CSV method if direct insert fails
-                        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', newline='', encoding='utf-8') as tmp_file:
-                            df.to_csv(tmp_file, index=False, quoting=1)
-                            tmp_path = tmp_file.name
-                        rows_imported = None  # Will use PowerShell fallback
+                    chunks = excel_reader.ExcelChunks(path, sheet_name, import_pipeline.IMPORT_CSV_CHUNK_ROWS, ext=file_ext)
                 except Exception as excel_err:
-                    logger.error(f"Failed to convert Excel file: {str(excel_err)}")
+                    logger.error(f"Failed to read Excel file: {str(excel_err)}")
                     results.append({
-                        'file': f.filename,
+                        'file': filename,
                         'success': False,
                         'error': f"Failed to read Excel file: {str(excel_err)}"
                     })
-                    continue
-            elif file_ext == '.csv':
-                # For CSV files, use direct pandas read and SQL insert
+                    return
+                logger.info(f"Final columns ({len(chunks.columns)} total): {chunks.columns}")
+
+                # Create import_log entry FIRST to get import_log_id for tracking
+                import_start_time = datetime.datetime.now()
+                df = None
+                column_names_list = chunks.columns
                 try:
-                    df = pd.read_csv(io.BytesIO(content))
-                    
-                    # Apply same cleaning as Excel
-                    df = df.dropna(axis=1, how='all')
-                    df = df.dropna(axis=0, how='all')
-                    df = df.reset_index(drop=True)
-                    
-                    # Fix column names - sanitize to match create-table logic
-                    import re
-                    new_cols = []
-                    col_counts = {}
-                    for idx, col in enumerate(df.columns):
-                        if pd.isna(col) or str(col).strip() == '' or str(col).startswith('Unnamed:'):
-                            col_str = f"Column_{idx+1}"
-                        else:
-                            col_str = str(col).strip()
-                        
-                        # Sanitize column names - replace any non-alphanumeric chars (except underscore) with underscore
-                        col_str = re.sub(r'[^a-zA-Z0-9_]', '_', col_str)
-                        
-                        # Ensure column name starts with a letter
-                        if col_str and not col_str[0].isalpha():
-                            col_str = 'col_' + col_str
-                        
-                        if col_str in col_counts:
-                            col_counts[col_str] += 1
-                            new_cols.append(f"{col_str}_{col_counts[col_str]}")
-                        else:
-                            col_counts[col_str] = 0
-                            new_cols.append(col_str)
-                    df.columns = new_cols
-                    
-                    # Convert to strings
-                    for col in df.columns:
-                        df[col] = df[col].astype(str).replace('nan', '').replace('None', '').replace('NaT', '')
-                    
-                    logger.info(f"CSV loaded: {df.shape} (rows, columns)")
-                    
-                    # Use direct SQL insert
+                    import_log_id = _main_audit.insert('dbo.import_log', _import_log_row(
+                        filename, file_size, file_ext, sheet_name, target_table, settings, create_new,
+                        None, len(column_names_list), column_names_list, chunks.dtypes, current_user))
+                except Exception:
+                    logger.warning("Failed to queue initial import_log row", exc_info=True)
+
+                loaded = 0
+
+                def _progress(rows_done):
+                    nonlocal loaded
+                    loaded = rows_done
+                    _main_audit.update('dbo.import_log', import_log_id, {'rows_imported': rows_done})
+
+                # Insert directly to SQL Server through the bulk loader (skip CSV/PowerShell)
+                conn = None
+                try:
+                    conn = db.get_sqlserver_connection()
+                    if not conn:
+                        raise RuntimeError("SQL Server not available")
+                    logger.info(f"Inserting rows into {target_table} (mode: {sql_if_exists})...")
+                    load_result = import_pipeline.load_frames(
+                        conn, chunks, chunks.columns, target_table, sql_if_exists,
+                        extra={'_import_id': import_log_id} if import_log_id is not None else None,
+                        on_progress=_progress, strategy=load_strategy, column_types=type_overrides)
+                    rows_imported = load_result['rows']
+                    logger.info(f"Successfully inserted {rows_imported} rows into {target_table} "
+                                f"({load_result['rows_per_second']} rows/s, {load_result['strategy']})")
+                    _main_audit.update('dbo.import_log', import_log_id, {'rows_total': rows_imported})
+
+                    # No need for PowerShell anymore, skip tmp_path creation
+                    tmp_path = None
+
+                except Exception as sql_err:
+                    logger.error(f"Direct SQL insert failed: {str(sql_err)}")
+                    if conn:
+                        try:
+                            conn.rollback()
+                        except Exception:
+                            pass
+                    if loaded:
+                        # Earlier chunks are committed; re-running the whole file would duplicate them
+                        _main_audit.update('dbo.import_log', import_log_id, {
+                            'status': 'failed', 'rows_imported': loaded, 'finished_at': datetime.datetime.now(),
+                            'error_message': str(sql_err)[:4000],
+                        })
+                        results.append({
+                            'file': filename,
+                            'success': False,
+                            'error': f"Import stopped after {loaded} rows: {str(sql_err)}"
+                        })
+                        return
+                    # Fallback to CSV method if direct insert fails; re-read the sheet chunk by chunk
+                    tmp_path = None
                     try:
-                        import urllib
-                        from sqlalchemy import create_engine
-                        from .db_connection import get_sqlserver_connection
-                        
-                        conn_info = get_sqlserver_connection()
-                        params = urllib.parse.quote_plus(
-                            f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-                            f"SERVER={conn_info['server']};"
-                            f"DATABASE={conn_info['database']};"
-                            f"Trusted_Connection=yes"
-                        )
-                        engine = create_engine(f"mssql+pyodbc:///?odbc_connect={params}", fast_executemany=True)
-                        
-                        df.to_sql(
-                            name=table_name,
-                            con=engine,
-                            if_exists='replace',
-                            index=False,
-                            chunksize=1000,
-                            method='multi'
-                        )
-                        
-                        rows_imported = len(df)
-                        tmp_path = None
-                        
-                    except Exception as csv_err:
-                        logger.error(f"CSV direct insert failed: {str(csv_err)}")
+                        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', newline='', encoding='utf-8') as tmp_file:
+                            tmp_path = tmp_file.name
+                            for i, chunk in enumerate(excel_reader.ExcelChunks(path, sheet_name, import_pipeline.IMPORT_CSV_CHUNK_ROWS, ext=file_ext)):
+                                chunk.to_csv(tmp_file, index=False, header=(i == 0), quoting=1)
+                    except Exception as excel_err:
+                        import_pipeline.remove(tmp_path)
+                        logger.error(f"Failed to convert Excel file: {str(excel_err)}")
                         results.append({
-                            'file': f.filename,
+                            'file': filename,
                             'success': False,
-                            'error': f"Failed to import CSV: {str(csv_err)}"
+                            'error': f"Failed to read Excel file: {str(excel_err)}"
                         })
-                        continue
-                        
+                        return
+                    rows_imported = None  # Will use PowerShell fallback
+                finally:
+                    chunks.close()
+                    if conn:
+                        conn.close()
+            elif file_ext == '.csv':
+                # Stream the spooled CSV in chunks; only one chunk is in memory at a time
+                try:
+                    chunks = import_pipeline.CsvChunks(path)
                 except Exception as csv_read_err:
                     logger.error(f"Failed to read CSV file: {str(csv_read_err)}")
                     results.append({
-                        'file': f.filename,
+                        'file': filename,
                         'success': False,
                         'error': f"Failed to read CSV file: {str(csv_read_err)}"
                     })
-                    continue
+                    return
+                logger.info(f"CSV columns ({len(chunks.columns)} total): {chunks.columns}")
+
+                import_start_time = datetime.datetime.now()
+                df = None
+                column_names_list = chunks.columns
+                try:
+                    import_log_id = _main_audit.insert('dbo.import_log', _import_log_row(
+                        filename, file_size, file_ext, sheet_name, target_table, settings, create_new,
+                        None, len(column_names_list), column_names_list, ['object'] * len(column_names_list), current_user))
+                except Exception:
+                    logger.warning("Failed to queue initial import_log row", exc_info=True)
+
+                def _progress(rows_done):
+                    _main_audit.update('dbo.import_log', import_log_id, {'rows_imported': rows_done})
+
+                conn = db.get_sqlserver_connection()
+                if not conn:
+                    chunks.close()
+                    raise HTTPException(status_code=503, detail="SQL Server not available")
+                try:
+                    load_result = import_pipeline.load_frames(
+                        conn, chunks, chunks.columns, target_table, sql_if_exists,
+                        extra={'_import_id': import_log_id} if import_log_id is not None else None,
+                        on_progress=_progress, strategy=load_strategy, column_types=type_overrides)
+                    rows_imported = load_result['rows']
+                    tmp_path = None
+                    _main_audit.update('dbo.import_log', import_log_id, {'rows_total': rows_imported})
+                except Exception as csv_err:
+                    logger.error(f"CSV direct insert failed: {str(csv_err)}")
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        pass
+                    _main_audit.update('dbo.import_log', import_log_id, {
+                        'status': 'failed', 'finished_at': datetime.datetime.now(),
+                        'duration_ms': int((datetime.datetime.now() - import_start_time).total_seconds() * 1000),
+                        'error_message': str(csv_err)[:4000],
+                    })
+                    results.append({
+                        'file': filename,
+                        'success': False,
+                        'error': f"Failed to import CSV: {str(csv_err)}"
+                    })
+                    return
+                finally:
+                    chunks.close()
+                    conn.close()
             else:
                 logger.error(f"Unsupported file type: {file_ext}")
                 results.append({
-                    'file': f.filename,
+                    'file': filename,
                     'success': False,
                     'error': f"Unsupported file type: {file_ext}. Please upload CSV or Excel files."
                 })
-                continue
-            
-            # Prepare to log this import attempt in SQL Server
-            import_log_id = None
-            import_start_time = datetime.datetime.now()
-            
-            # Gather column info for logging
-            column_names_list = list(df.columns) if df is not None else []
-            column_types_list = [str(df[col].dtype) for col in df.columns] if df is not None else []
-            rows_total = len(df) if df is not None else 0
-            columns_count = len(df.columns) if df is not None else 0
+                return
             
-            try:
-                conn_log = db.get_sqlserver_connection()
-                if conn_log:
-                    cur_log = conn_log.cursor()
-                    try:
-                        cur_log.execute(
-                            """
-                            INSERT INTO dbo.import_log
-                                (file_name, file_size, file_type, sheet_name, table_name, database_name,
-                                 create_new_table, rows_total, rows_imported, columns_imported, column_names,
-                                 column_types, user_name, status, started_at, finished_at)
-                            OUTPUT INSERTED.id
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?, ?, ?, 'started', GETDATE(), NULL)
-                            """,
-                            (
-                                f.filename,
-                                file_size,
-                                file_ext.replace('.', ''),  # file type without dot
-                                sheet_name or '',
-                                target_table,
-                                settings.get('database', ''),
-                                1 if create_new == 'true' else 0,
-                                rows_total,
-                                columns_count,
-                                ','.join(column_names_list)[:4000],  # Limit to 4000 chars
-                                ','.join(column_types_list)[:4000],  # Limit to 4000 chars
-                                (current_user or {}).get('sub') or (current_user or {}).get('username') or 'unknown',
-                            )
-                        )
-                        row = cur_log.fetchone()
-                        if row:
-                            import_log_id = row[0]
-                        conn_log.commit()
-                    finally:
-                        try:
-                            cur_log.close()
-                        except Exception:
-                            pass
-                        try:
-                            conn_log.close()
-                        except Exception:
-                            pass
-            except Exception:
-                logger.warning("Failed to insert initial import_log row", exc_info=True)
+            # Log this import attempt in SQL Server (the Excel path logged it before inserting)
+            if import_log_id is None:
+                import_start_time = datetime.datetime.now()
+
+                # Gather column info for logging
+                column_names_list = list(df.columns) if df is not None else []
+                column_types_list = [str(df[col].dtype) for col in df.columns] if df is not None else []
+                rows_total = len(df) if df is not None else 0
+                columns_count = len(df.columns) if df is not None else 0
+
+                try:
+                    import_log_id = _main_audit.insert('dbo.import_log', _import_log_row(
+                        filename, file_size, file_ext, sheet_name, target_table, settings, create_new,
+                        rows_total, columns_count, column_names_list, column_types_list, current_user))
+                except Exception:
+                    logger.warning("Failed to queue initial import_log row", exc_info=True)
 
             # If direct insert succeeded, skip PowerShell
             if rows_imported is not None and rows_imported > 0:
                 total_rows += rows_imported
-                logger.info(f"Successfully imported {rows_imported} rows from {f.filename} using direct insert")
-                results.append({
-                    'file': f.filename,
+                logger.info(f"Successfully imported {rows_imported} rows from {filename} using direct insert")
+                result = {
+                    'file': filename,
                     'success': True,
                     'rows': rows_imported,
                     'table': target_table,
                     'import_log_id': import_log_id
-                })
+                }
+                if load_result and load_result['ddl']:
+                    result['column_types'] = load_result['column_types']
+                    result['ddl'] = load_result['ddl']
+                results.append(result)
                 
                 # Update import_log
-                try:
-                    if import_log_id is not None:
-                        duration_ms = int((datetime.datetime.now() - import_start_time).total_seconds() * 1000)
-                        conn_upd = db.get_sqlserver_connection()
-                        if conn_upd:
-                            cur_upd = conn_upd.cursor()
-                            try:
-                                cur_upd.execute(
-                                    """
-                                    UPDATE dbo.import_log
-                                    SET rows_imported = ?,
-                                        status = 'success',
-                                        finished_at = GETDATE(),
-                                        duration_ms = ?
-                                    WHERE id = ?
-                                    """,
-                                    (rows_imported, duration_ms, import_log_id)
-                                )
-                                conn_upd.commit()
-                            finally:
-                                try:
-                                    cur_upd.close()
-                                except Exception:
-                                    pass
-                                try:
-                                    conn_upd.close()
-                                except Exception:
-                                    pass
-                except Exception:
-                    logger.warning("Failed to update import_log after direct insert", exc_info=True)
+                duration_ms = int((datetime.datetime.now() - import_start_time).total_seconds() * 1000)
+                fields = {
+                    'rows_imported': rows_imported, 'status': 'success',
+                    'finished_at': datetime.datetime.now(), 'duration_ms': duration_ms,
+                }
+                if load_result and load_result['column_types']:
+                    fields['column_types'] = ','.join(load_result['column_types'].get(c, '') for c in column_names_list)[:4000]
+                if load_result and _import_log_has_load_columns:
+                    fields['load_strategy'] = load_result['strategy']
+                    fields['rows_per_second'] = load_result['rows_per_second']
+                _main_audit.update('dbo.import_log', import_log_id, fields)
                 
-                continue  # Skip PowerShell fallback
+                return  # Skip PowerShell fallback
             
             # Only use PowerShell if tmp_path exists (fallback scenario)
             if tmp_path is None:
-                logger.info(f"No fallback needed for {f.filename}, skipping PowerShell")
-                continue
+                logger.info(f"No fallback needed for {filename}, skipping PowerShell")
+                return
                 
             try:
                 # Build PowerShell script for SQL Server import (fallback only)
-                logger.info(f"Using PowerShell fallback for {f.filename}")
+                logger.info(f"Using PowerShell fallback for {filename}")
                 create_new_flag = "$true" if create_new == 'true' else "$false"
                 ps_script = f"""
 $ErrorActionPreference = "Stop"
@@ -2368,59 +3039,31 @@ try {{
                 
                 if result.returncode != 0:
                     error_msg = result.stderr.strip() or result.stdout.strip()
-                    logger.error(f"PowerShell import failed for {f.filename}: {error_msg}")
+                    logger.error(f"PowerShell import failed for {filename}: {error_msg}")
                     results.append({
-                        'file': f.filename,
+                        'file': filename,
                         'success': False,
                         'error': error_msg
                     })
                 else:
                     rows_imported = int(result.stdout.strip() or '0')
                     total_rows += rows_imported
-                    logger.info(f"Successfully imported {rows_imported} rows from {f.filename}")
+                    logger.info(f"Successfully imported {rows_imported} rows from {filename}")
                     results.append({
-                        'file': f.filename,
+                        'file': filename,
                         'success': True,
                         'rows': rows_imported,
                         'table': target_table,
                         'import_log_id': import_log_id
                     })
                 # Update import_log entry if we created one
-                try:
-                    if import_log_id is not None:
-                        duration_ms = int((datetime.datetime.now() - import_start_time).total_seconds() * 1000)
-                        conn_upd = db.get_sqlserver_connection()
-                        if conn_upd:
-                            cur_upd = conn_upd.cursor()
-                            try:
-                                cur_upd.execute(
-                                    """
-                                    UPDATE dbo.import_log
-                                    SET rows_imported = ?,
-                                        status = ?,
-                                        finished_at = GETDATE(),
-                                        duration_ms = ?
-                                    WHERE id = ?
-                                    """,
-                                    (
-                                        int(result.stdout.strip() or '0') if result.returncode == 0 else 0,
-                                        'success' if result.returncode == 0 else 'failed',
-                                        duration_ms,
-                                        import_log_id,
-                                    )
-                                )
-                                conn_upd.commit()
-                            finally:
-                                try:
-                                    cur_upd.close()
-                                except Exception:
-                                    pass
-                                try:
-                                    conn_upd.close()
-                                except Exception:
-                                    pass
-                except Exception:
-                    logger.warning("Failed to update import_log row after import", exc_info=True)
+                duration_ms = int((datetime.datetime.now() - import_start_time).total_seconds() * 1000)
+                _main_audit.update('dbo.import_log', import_log_id, {
+                    'rows_imported': int(result.stdout.strip() or '0') if result.returncode == 0 else 0,
+                    'status': 'success' if result.returncode == 0 else 'failed',
+                    'finished_at': datetime.datetime.now(),
+                    'duration_ms': duration_ms,
+                })
                 
                 # Clean up temp file if it was created
                 if tmp_path:
@@ -2430,12 +3073,22 @@ try {{
                         logger.warning(f"Could not delete temp file {tmp_path}: {cleanup_err}")
                         
             except Exception as powershell_err:
-                logger.error(f"PowerShell fallback failed for {f.filename}: {str(powershell_err)}")
+                logger.error(f"PowerShell fallback failed for {filename}: {str(powershell_err)}")
                 results.append({
-                    'file': f.filename,
+                    'file': filename,
                     'success': False,
                     'error': f"Import failed: {str(powershell_err)}"
                 })
+
+        for f in files or []:
+            path, file_size = await import_pipeline.spool_upload(f, os.path.splitext(f.filename or '')[1])
+            try:
+                await run_in_db(_import_one, f.filename, path, file_size)
+            finally:
+                import_pipeline.remove(path)
+        # Staged files are imported in place and kept until they expire (a duplicate prompt may re-submit them)
+        for staged in staged_files:
+            await run_in_db(_import_one, staged.filename, staged.path, staged.size)
         
         logger.info(f"Total rows imported: {total_rows}")
         response = {
@@ -2513,8 +3166,7 @@ async def get_settings_info():
     """Get database connection info (no authentication required for login page)"""
     try:
         if os.path.exists(SETTINGS_PATH):
-            with open(SETTINGS_PATH, 'r', encoding='utf-8') as f:
-                settings = json.load(f)
+            settings = dbc.load_settings()
             return {
                 'configured': True,
                 'host': settings.get('host', ''),
@@ -2548,7 +3200,8 @@ ADMIN_SETTINGS_PASSWORD = os.environ.get('ADMIN_SETTINGS_PASSWORD', '1234567890'
 
 
 @router.post('/settings/test-public')
-async def test_settings_public(payload: SettingsUpdateIn, request: Request):
+@db_route('main')
+def test_settings_public(payload: SettingsUpdateIn, request: Request):
     """Test a DB connection without requiring a logged-in session.
     Authenticates via adminPassword in the request body (same as /settings/save).
     Always appends TrustServerCertificate=yes so Driver 18 self-signed certs work.
@@ -2667,12 +3320,10 @@ async def save_settings(payload: SettingsUpdateIn, request: Request):
                 raise HTTPException(status_code=403, detail='Invalid admin password')
 
         logger.info(f"Saving settings for server: {payload.host}, database: {payload.database}")
-        os.makedirs(os.path.dirname(SETTINGS_PATH), exist_ok=True)
-        with open(SETTINGS_PATH, 'w', encoding='utf-8') as f:
-            # Exclude adminPassword from persisted settings
-            data = payload.dict()
-            data.pop('adminPassword', None)
-            json.dump(data, f, indent=2)
+        # Exclude adminPassword from persisted settings
+        data = payload.dict()
+        data.pop('adminPassword', None)
+        _write_settings_file(data)
         new_url = _build_connection_url(payload)
         
         # Note: We don't actually switch the database here because the 'databases' library
@@ -2691,12 +3342,12 @@ async def save_settings(payload: SettingsUpdateIn, request: Request):
 async def get_settings(_admin=Depends(get_current_admin)):
     if not os.path.exists(SETTINGS_PATH):
         raise HTTPException(status_code=404, detail='No settings')
-    with open(SETTINGS_PATH, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return dbc.load_settings()
 
 
 @router.post('/settings/test')
-async def test_settings(payload: SettingsIn, _admin=Depends(get_current_admin)):
+@db_route('main')
+def test_settings(payload: SettingsIn, _admin=Depends(get_current_admin)):
     logger.info(f"Testing connection to server: {payload.host}, database: {payload.database}")
     url = _build_connection_url(payload)
     try:
@@ -2809,7 +3460,8 @@ async def scan_local_instances(_admin=Depends(get_current_admin)):
 
 
 @router.post('/settings/list-databases')
-async def list_databases(payload: SettingsIn, _admin=Depends(get_current_admin)):
+@db_route('main')
+def list_databases(payload: SettingsIn, _admin=Depends(get_current_admin)):
     try:
         import pyodbc
     except Exception:
@@ -2852,7 +3504,8 @@ async def list_databases(payload: SettingsIn, _admin=Depends(get_current_admin))
 
 
 @router.post('/create-user')
-async def create_user(username: str = Form(...), password: str = Form(...), role: str = Form('user'), _admin=Depends(get_current_admin)):
+@db_route('main')
+def create_user(username: str = Form(...), password: str = Form(...), role: str = Form('user'), _admin=Depends(get_current_admin)):
     try:
         logger.info(f"Creating user: {username} with role: {role}")
         hashed = _hash_password(password)
@@ -2903,35 +3556,46 @@ async def create_user(username: str = Form(...), password: str = Form(...), role
         raise HTTPException(status_code=500, detail=f"Failed to create user: {msg}")
 
 
+def _list_sqlserver_users():
+    """Return the SQL Server user list, or None when SQL Server is not configured."""
+    conn = db.get_sqlserver_connection()
+    if not conn:
+        return None
+    # Ensure users table exists and seed default admin if missing
+    _ensure_users_table(conn)
+    _seed_admin_if_missing(conn)
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT id, username, role, created_at FROM users ORDER BY id")
+    rows = cursor.fetchall()
+    
+    users = []
+    for row in rows:
+        users.append({
+            'id': row[0],
+            'username': row[1],
+            'role': row[2],
+            'created_at': str(row[3]) if row[3] else None
+        })
+    
+    cursor.close()
+    conn.close()
+    return users
+
+
 @router.get('/users')
-async def list_users(_admin=Depends(get_current_admin)):
+async def list_users(request: Request, _admin=Depends(get_current_admin)):
+    return etags.json_response(request, await _list_users_payload())
+
+
+async def _list_users_payload():
     try:
         logger.info("Fetching user list")
         
         # Try SQL Server first
         try:
-            conn = db.get_sqlserver_connection()
-            if conn:
-                # Ensure users table exists and seed default admin if missing
-                _ensure_users_table(conn)
-                _seed_admin_if_missing(conn)
-                cursor = conn.cursor()
-                
-                cursor.execute("SELECT id, username, role, created_at FROM users ORDER BY id")
-                rows = cursor.fetchall()
-                
-                users = []
-                for row in rows:
-                    users.append({
-                        'id': row[0],
-                        'username': row[1],
-                        'role': row[2],
-                        'created_at': str(row[3]) if row[3] else None
-                    })
-                
-                cursor.close()
-                conn.close()
-                
+            users = await run_in_db(_list_sqlserver_users)
+            if users is not None:
                 logger.info(f"Retrieved {len(users)} users from SQL Server")
                 return users
         except Exception as sql_err:
@@ -2952,7 +3616,8 @@ async def list_users(_admin=Depends(get_current_admin)):
 
 
 @router.put('/users/{user_id}')
-async def update_user(
+@db_route('main')
+def update_user(
     user_id: int,
     username: str = Form(...),
     password: Optional[str] = Form(None),
@@ -3013,7 +3678,8 @@ async def update_user(
 
 
 @router.delete('/users/{user_id}')
-async def delete_user(user_id: int, _admin=Depends(get_current_admin)):
+@db_route('main')
+def delete_user(user_id: int, _admin=Depends(get_current_admin)):
     try:
         logger.info(f"Deleting user ID {user_id}")
         
@@ -3156,7 +3822,7 @@ def check_user_permission(username: str, permission_name: str) -> bool:
 async def require_permission(permission_name: str, user: dict = Depends(get_current_user)):
     """Dependency to require a specific permission."""
     username = user.get('sub') if isinstance(user, dict) else None
-    if not check_user_permission(username, permission_name):
+    if not await run_in_db(check_user_permission, username, permission_name):
         raise HTTPException(
             status_code=403,
             detail=f"Permission denied: {permission_name} access required"
@@ -3165,9 +3831,9 @@ async def require_permission(permission_name: str, user: dict = Depends(get_curr
 
 
 @router.get('/permissions/available')
-async def get_available_permissions(_user=Depends(get_current_user)):
+async def get_available_permissions(request: Request, _user=Depends(get_current_user)):
     """Get list of all available permission names."""
-    return {
+    return etags.json_response(request, {
         'permissions': AVAILABLE_PERMISSIONS,
         'descriptions': {
             'import_data': 'Can import data files (CSV, Excel)',
@@ -3178,11 +3844,12 @@ async def get_available_permissions(_user=Depends(get_current_user)):
             'manage_reports': 'Can create and edit report definitions',
             'view_dashboard': 'Can view the dashboard summary',
         }
-    }
+    })
 
 
 @router.get('/permissions/user/{user_id}')
-async def get_user_permissions(user_id: int, _admin=Depends(get_current_admin)):
+@db_route('main')
+def get_user_permissions(user_id: int, _admin=Depends(get_current_admin)):
     """Get all permissions for a specific user."""
     try:
         conn = db.get_sqlserver_connection()
@@ -3248,7 +3915,8 @@ class PermissionUpdate(BaseModel):
 
 
 @router.post('/permissions/user/{user_id}')
-async def set_user_permission(
+@db_route('main')
+def set_user_permission(
     user_id: int,
     perm: PermissionUpdate,
     _admin=Depends(get_current_admin)
@@ -3315,7 +3983,8 @@ async def set_user_permission(
 
 
 @router.post('/permissions/user/{user_id}/bulk')
-async def set_user_permissions_bulk(
+@db_route('main')
+def set_user_permissions_bulk(
     user_id: int,
     permissions: List[PermissionUpdate],
     _admin=Depends(get_current_admin)
@@ -3384,7 +4053,8 @@ async def set_user_permissions_bulk(
 
 
 @router.get('/permissions/all-users')
-async def get_all_users_permissions(_admin=Depends(get_current_admin)):
+@db_route('main')
+def get_all_users_permissions(_admin=Depends(get_current_admin)):
     """Get permissions for all users (admin only)."""
     try:
         conn = db.get_sqlserver_connection()
@@ -3438,7 +4108,8 @@ async def get_all_users_permissions(_admin=Depends(get_current_admin)):
 
 
 @router.get('/me/permissions')
-async def get_my_permissions(current_user: dict = Depends(get_current_user)):
+@db_route('main')
+def get_my_permissions(current_user: dict = Depends(get_current_user)):
     """Get the current user's permissions."""
     try:
         username = current_user.get('sub') if isinstance(current_user, dict) else None
@@ -3514,7 +4185,8 @@ async def get_my_permissions(current_user: dict = Depends(get_current_user)):
 
 
 @router.post('/me/change-password')
-async def me_change_password(new_password: str = Form(...), current_user: dict = Depends(get_current_user)):
+@db_route('main')
+def me_change_password(new_password: str = Form(...), current_user: dict = Depends(get_current_user)):
     """Allow logged-in user to change their own password and clear must_change_password flag."""
     try:
         conn = db.get_sqlserver_connection()
@@ -3546,7 +4218,8 @@ async def me_change_password(new_password: str = Form(...), current_user: dict =
 
 
 @router.get('/tables')
-async def list_tables(_user=Depends(get_current_user)):
+@db_route('main')
+def list_tables(request: Request, _user=Depends(get_current_user)):
     """Get list of tables from import_log (only tables that have been imported)"""
     try:
         logger.info("Fetching table list from import_log")
@@ -3573,7 +4246,7 @@ async def list_tables(_user=Depends(get_current_user)):
         conn.close()
         
         logger.info(f"Retrieved {len(tables)} imported tables from import_log")
-        return {"tables": tables}
+        return etags.json_response(request, {"tables": tables})
         
     except HTTPException:
         raise
@@ -3592,7 +4265,8 @@ class CreateTableRequest(BaseModel):
 
 
 @router.post('/create-table')
-async def create_table(request: CreateTableRequest, current_user: dict = Depends(get_current_user)):
+@db_route('main')
+def create_table(request: CreateTableRequest, current_user: dict = Depends(get_current_user)):
     """Create a new table in SQL Server with specified columns"""
     # Check permission
     username = current_user.get('sub') if isinstance(current_user, dict) else None
@@ -3639,14 +4313,10 @@ async def create_table(request: CreateTableRequest, current_user: dict = Depends
         # Build CREATE TABLE statement
         column_defs = []
         for col in columns:
-            col_name = re.sub(r'[^a-zA-Z0-9_]', '_', str(col.get('name', 'column')))
-            # Ensure column name starts with a letter (must match import-data logic)
-            if col_name and not col_name[0].isalpha():
-                col_name = 'col_' + col_name
-            col_type = col.get('type', 'VARCHAR(255)')
-            # Validate column type to prevent SQL injection
-            valid_types = ['VARCHAR(255)', 'VARCHAR(MAX)', 'INT', 'BIGINT', 'FLOAT', 'DECIMAL(18,4)', 'DATETIME', 'DATE', 'BIT', 'NVARCHAR(255)', 'NVARCHAR(MAX)', 'TEXT']
-            if col_type.upper() not in [t.upper() for t in valid_types]:
+            col_name = import_pipeline.sanitize_name(col.get('name', 'column'))  # must match import-data logic
+            col_type = str(col.get('type') or 'VARCHAR(255)').strip()
+            # Validate column type to prevent SQL injection (also accepts the types /get-columns infers)
+            if not schema_inference.valid_type(col_type):
                 col_type = 'VARCHAR(255)'  # Default to safe type
             column_defs.append(f"[{col_name}] {col_type}")
         
@@ -3717,7 +4387,8 @@ def normalize_powerbi_url(url: str) -> str:
 
 
 @router.get('/powerbi/reports')
-async def get_powerbi_reports(_user=Depends(get_current_user)):
+@db_route('main')
+def get_powerbi_reports(request: Request, _user=Depends(get_current_user)):
     """Get list of all Power BI reports"""
     try:
         conn = db.get_sqlserver_connection()
@@ -3751,14 +4422,15 @@ async def get_powerbi_reports(_user=Depends(get_current_user)):
         } for row in rows]
         cursor.close()
         conn.close()
-        return {"reports": reports}
+        return etags.json_response(request, {"reports": reports})
     except Exception as e:
         logger.error(f"Error fetching Power BI reports: {str(e)}")
         return {"reports": []}
 
 
 @router.get('/powerbi/settings')
-async def get_powerbi_settings(_user=Depends(get_current_user)):
+@db_route('main')
+def get_powerbi_settings(_user=Depends(get_current_user)):
     """Get Power BI settings - returns first enabled report"""
     try:
         conn = db.get_sqlserver_connection()
@@ -3800,7 +4472,8 @@ async def get_powerbi_settings(_user=Depends(get_current_user)):
 
 
 @router.post('/powerbi/settings')
-async def save_powerbi_settings(settings: PowerBISettings, user=Depends(get_current_admin)):
+@db_route('main')
+def save_powerbi_settings(settings: PowerBISettings, user=Depends(get_current_admin)):
     """Save Power BI embed settings (admin only)"""
     try:
         conn = db.get_sqlserver_connection()
@@ -3864,7 +4537,8 @@ async def save_powerbi_settings(settings: PowerBISettings, user=Depends(get_curr
 
 
 @router.post('/powerbi/reports')
-async def add_powerbi_report(settings: PowerBISettings, user=Depends(get_current_admin)):
+@db_route('main')
+def add_powerbi_report(settings: PowerBISettings, user=Depends(get_current_admin)):
     """Add a new Power BI report to the multi-report collection (admin only)"""
     try:
         conn = db.get_sqlserver_connection()
@@ -3945,7 +4619,8 @@ async def add_powerbi_report(settings: PowerBISettings, user=Depends(get_current
 
 
 @router.delete('/powerbi/reports/{report_id}')
-async def delete_powerbi_report(report_id: int, user=Depends(get_current_admin)):
+@db_route('main')
+def delete_powerbi_report(report_id: int, user=Depends(get_current_admin)):
     """Delete a Power BI report by ID (admin only)"""
     try:
         conn = db.get_sqlserver_connection()
@@ -4104,7 +4779,8 @@ async def list_local_powerbi_files(_user=Depends(get_current_user)):
 
 
 @router.get('/powerbi/health')
-async def powerbi_health(url: Optional[str] = None, _user=Depends(get_current_user)):
+@db_route('main')
+def powerbi_health(url: Optional[str] = None, _user=Depends(get_current_user)):
     """Health check and classification for the stored (or provided) Power BI embed URL.
 
     Returns:
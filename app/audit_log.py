@@ -0,0 +1,435 @@
+"""Asynchronous, batched writer for audit rows (`dbo.report_log`, `dbo.import_log`).
+
+Callers queue inserts and updates and return immediately. A background thread
+per database drains the queue every `AUDIT_FLUSH_INTERVAL` seconds (or once
+`AUDIT_BATCH_SIZE` events are waiting) and writes them in one transaction:
+
+- inserts become multi-row `INSERT ... VALUES (...), (...)` statements;
+- an update whose insert is still queued is merged into that insert, so a
+  short report run costs a single row write;
+- other updates are grouped by column set and sent with `executemany`.
+
+Row ids are handed out before the row is written. They are reserved in blocks
+of `AUDIT_ID_BLOCK` from a per-table SEQUENCE (`dbo.<table>_id_seq`, created
+on first use above the current `MAX(id)`) and inserted with
+`IDENTITY_INSERT`. A block always starts above both `MAX(id)` and
+`IDENT_CURRENT`, and the table's identity is reseeded to the end of the block,
+so rows inserted elsewhere without an explicit id never take a reserved id. If
+the sequence cannot be created or `IDENTITY_INSERT` or the reseed is not
+permitted, inserts for that table fall back to a synchronous
+`OUTPUT INSERTED.id` statement, which matches the old behaviour. Other
+reservation failures (deadlock, timeout, lost connection, table not created
+yet) only make the current insert synchronous; reserving is tried again after
+`AUDIT_RESERVE_BACKOFF` seconds, doubling up to `AUDIT_RESERVE_BACKOFF_MAX`.
+
+The queue holds at most `AUDIT_QUEUE_MAX` events. When it is full, callers
+block for up to `AUDIT_ENQUEUE_TIMEOUT` seconds (backpressure), after which
+the event is dropped and counted. A failed batch is retried
+`AUDIT_MAX_RETRIES` times; then its events are written one at a time and only
+the ones that still fail are dropped. `flush()` queues a marker and returns
+once the flusher thread has written every event before it, so callers can read
+their own log rows and writes still happen in queue order.
+"""
+import os
+import re
+import time
+import queue
+import threading
+import logging
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_MAX = int(os.environ.get('AUDIT_QUEUE_MAX', '10000'))
+AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', '500'))
+AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', '0.5'))
+AUDIT_ENQUEUE_TIMEOUT = float(os.environ.get('AUDIT_ENQUEUE_TIMEOUT', '5'))
+AUDIT_ID_BLOCK = int(os.environ.get('AUDIT_ID_BLOCK', '100'))
+AUDIT_MAX_RETRIES = int(os.environ.get('AUDIT_MAX_RETRIES', '3'))
+AUDIT_FLUSH_TIMEOUT = float(os.environ.get('AUDIT_FLUSH_TIMEOUT', '30'))
+AUDIT_RESERVE_BACKOFF = float(os.environ.get('AUDIT_RESERVE_BACKOFF', '5'))
+AUDIT_RESERVE_BACKOFF_MAX = float(os.environ.get('AUDIT_RESERVE_BACKOFF_MAX', '300'))
+
+# SQL Server allows 2100 parameters per statement
+_MAX_PARAMS = 2000
+_MAX_ROWS_PER_INSERT = 1000
+
+# SQL Server errors meaning the login may not reserve ids: permission denied (229, 230, 262, 300),
+# not the table owner for IDENTITY_INSERT (8104), no permission for DBCC CHECKIDENT (2557)
+_PERMISSION_ERRORS = re.compile(r'\((?:229|230|262|300|2557|8104)\)|permission was denied|does not have permission',
+                                re.IGNORECASE)
+_TABLE_RE = re.compile(r'^dbo\.[A-Za-z_][A-Za-z0-9_]*$')
+_COLUMN_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+_ENSURE_SEQUENCE_SQL = """
+    IF OBJECT_ID('{seq}', 'SO') IS NULL
+    BEGIN
+        DECLARE @start BIGINT = (SELECT ISNULL(MAX(id), 0) + 1 FROM {table});
+        EXEC('CREATE SEQUENCE {seq} AS BIGINT START WITH ' + CAST(@start AS NVARCHAR(20)) + ' INCREMENT BY 1');
+    END
+"""
+_RESERVE_SQL = """
+    SET NOCOUNT ON;
+    DECLARE @first SQL_VARIANT;
+    EXEC sys.sp_sequence_get_range @sequence_name = ?, @range_size = ?, @range_first_value = @first OUTPUT;
+    SELECT CAST(@first AS BIGINT);
+"""
+
+
+class _FlushMarker:
+    """Queued by `flush()`; set by the flusher thread once every earlier event is written."""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class AuditUnavailable(RuntimeError):
+    """The audit database could not be connected to."""
+
+
+def _check_names(table: str, columns) -> None:
+    if not _TABLE_RE.match(table) or not all(_COLUMN_RE.match(c) for c in columns):
+        raise ValueError(f'Invalid audit table/column name for {table}')
+
+
+class AuditWriter:
+    def __init__(self, name: str, connect: Callable):
+        """`connect()` returns a pyodbc connection to the database holding the log tables, or None."""
+        self.name = name
+        self._connect = connect
+        self._queue = queue.Queue(maxsize=AUDIT_QUEUE_MAX)
+        self._blocks: Dict[str, list] = {}  # table -> [next id, end (exclusive)]
+        self._sync_tables = set()
+        self._reserve_failures: Dict[str, tuple] = {}  # table -> (consecutive failures, retry at)
+        self._alloc_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stats = {'inserts': 0, 'updates': 0, 'merged': 0, 'batches': 0, 'sync_inserts': 0,
+                       'reserved_blocks': 0, 'retries': 0, 'dropped': 0}
+
+    # ----- id allocation -----
+    def _reserve(self, conn, table: str) -> int:
+        seq = f'{table}_id_seq'
+        cur = conn.cursor()
+        try:
+            cur.execute(_ENSURE_SEQUENCE_SQL.format(seq=seq, table=table))
+            # Fails early (and switches the table to synchronous inserts) without ALTER permission
+            cur.execute(f'SET IDENTITY_INSERT {table} ON; SET IDENTITY_INSERT {table} OFF;')
+            # The table lock keeps identity inserts out until the reseed below is committed
+            cur.execute(f'SELECT ISNULL(MAX(id), 0), ISNULL(IDENT_CURRENT(?), 0) FROM {table} WITH (TABLOCKX, HOLDLOCK)',
+                        (table,))
+            current_max = int(max(cur.fetchone()))
+            cur.execute(_RESERVE_SQL, (seq, AUDIT_ID_BLOCK))
+            first = int(cur.fetchone()[0])
+            if first <= current_max:
+                # Rows were added outside this writer; move the sequence past them
+                cur.execute(f'ALTER SEQUENCE {seq} RESTART WITH {current_max + 1}')
+                cur.execute(_RESERVE_SQL, (seq, AUDIT_ID_BLOCK))
+                first = int(cur.fetchone()[0])
+            # Identity values generated by other inserts continue after the reserved block
+            cur.execute(f"DBCC CHECKIDENT ('{table}', RESEED, {first + AUDIT_ID_BLOCK - 1}) WITH NO_INFOMSGS")
+            conn.commit()
+            return first
+        finally:
+            try:
+                cur.close()
+            except Exception:
+                pass
+
+    def _allocate(self, table: str) -> Optional[int]:
+        with self._alloc_lock:
+            block = self._blocks.get(table)
+            if block and block[0] < block[1]:
+                block[0] += 1
+                return block[0] - 1
+            if table in self._sync_tables:
+                return None
+            failures, retry_at = self._reserve_failures.get(table, (0, 0.0))
+            if time.monotonic() < retry_at:
+                return None
+            conn = self._connect()
+            if not conn:
+                return None
+            try:
+                first = self._reserve(conn, table)
+            except Exception as e:
+                if _PERMISSION_ERRORS.search(str(e)):
+                    logger.warning("Cannot pre-allocate %s ids; using synchronous inserts", table, exc_info=True)
+                    self._sync_tables.add(table)
+                else:
+                    delay = min(AUDIT_RESERVE_BACKOFF_MAX, AUDIT_RESERVE_BACKOFF * 2 ** failures)
+                    self._reserve_failures[table] = (failures + 1, time.monotonic() + delay)
+                    logger.warning("Reserving %s ids failed; inserting synchronously for %.0fs", table, delay,
+                                   exc_info=True)
+                return None
+            finally:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._reserve_failures.pop(table, None)
+            self._blocks[table] = [first + 1, first + AUDIT_ID_BLOCK]
+            self._stats['reserved_blocks'] += 1
+            return first
+
+    def _insert_now(self, table: str, row: dict) -> Optional[int]:
+        conn = self._connect()
+        if not conn:
+            return None
+        try:
+            cols = list(row)
+            cur = conn.cursor()
+            cur.execute(f"INSERT INTO {table} ({', '.join(cols)}) OUTPUT INSERTED.id VALUES ({', '.join(['?'] * len(cols))})",
+                        [row[c] for c in cols])
+            out = cur.fetchone()
+            conn.commit()
+            cur.close()
+            self._stats['sync_inserts'] += 1
+            return int(out[0]) if out and out[0] is not None else None
+        finally:
+            conn.close()
+
+    # ----- public API -----
+    def insert(self, table: str, row: dict) -> Optional[int]:
+        """Queue an INSERT and return the new row's id (None if the database is unavailable)."""
+        _check_names(table, row)
+        log_id = self._allocate(table)
+        if log_id is None:
+            try:
+                return self._insert_now(table, row)
+            except Exception:
+                logger.warning("Synchronous insert into %s failed", table, exc_info=True)
+                return None
+        self._put(('insert', table, log_id, dict(row)))
+        return log_id
+
+    def update(self, table: str, row_id: Optional[int], fields: dict):
+        """Queue an UPDATE of `fields` on row `row_id` (ignored when `row_id` is None)."""
+        if row_id is None or not fields:
+            return
+        _check_names(table, fields)
+        self._put(('update', table, row_id, dict(fields)))
+
+    def _put(self, event):
+        self._ensure_thread()
+        try:
+            self._queue.put(event, timeout=AUDIT_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            self._stats['dropped'] += 1
+            logger.error("Audit queue %s full for %.1fs; dropped %s on %s id %s",
+                         self.name, AUDIT_ENQUEUE_TIMEOUT, event[0], event[1], event[2])
+
+    def flush(self, timeout: float = AUDIT_FLUSH_TIMEOUT) -> bool:
+        """Wait (up to `timeout` seconds) until everything queued so far has been written.
+
+        The flusher thread does the writing, so events are still written in queue
+        order. Returns False on timeout.
+        """
+        marker = _FlushMarker()
+        self._ensure_thread()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.done.wait(timeout)
+
+    def _drain(self):
+        """Write whatever is queued on the calling thread (only once the flusher thread has stopped)."""
+        batch = []
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(event, _FlushMarker):
+                if batch:
+                    self._write_with_retry(batch)
+                    batch = []
+                event.done.set()
+            else:
+                batch.append(event)
+        if batch:
+            self._write_with_retry(batch)
+
+    # ----- background flushing -----
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name=f'audit-{self.name}', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                event = self._queue.get(timeout=AUDIT_FLUSH_INTERVAL)
+            except queue.Empty:
+                continue
+            batch = []
+            marker = None
+            deadline = time.monotonic() + AUDIT_FLUSH_INTERVAL
+            while True:
+                if isinstance(event, _FlushMarker):
+                    # Someone is waiting for everything before the marker: write it now
+                    marker = event
+                    break
+                batch.append(event)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= AUDIT_BATCH_SIZE or remaining <= 0 or self._stop.is_set():
+                    break
+                try:
+                    event = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                self._write_with_retry(batch)
+            if marker is not None:
+                marker.done.set()
+
+    def _write_with_retry(self, batch: list):
+        for attempt in range(AUDIT_MAX_RETRIES + 1):
+            try:
+                with self._write_lock:
+                    self._write(batch)
+                return
+            except Exception:
+                if attempt == AUDIT_MAX_RETRIES:
+                    logger.error("Audit batch of %d events for %s failed %d times; writing them one by one",
+                                 len(batch), self.name, attempt + 1, exc_info=True)
+                    break
+                self._stats['retries'] += 1
+                logger.warning("Audit flush for %s failed; retrying", self.name, exc_info=True)
+                time.sleep(min(5.0, 0.5 * 2 ** attempt))
+        self._write_each(batch)
+
+    def _write_each(self, batch: list):
+        """Write events one at a time so one bad row does not cost the whole batch."""
+        for i, event in enumerate(batch):
+            try:
+                with self._write_lock:
+                    self._write([event])
+            except AuditUnavailable:
+                self._stats['dropped'] += len(batch) - i
+                logger.error("Dropping %d audit events for %s: database unavailable", len(batch) - i, self.name)
+                return
+            except Exception:
+                self._stats['dropped'] += 1
+                logger.error("Dropping audit %s on %s id %s", event[0], event[1], event[2], exc_info=True)
+
+    @staticmethod
+    def _merge(batch: list) -> tuple:
+        inserts = {}  # (table, id) -> row, in queue order
+        updates = {}  # (table, id) -> fields, in queue order
+        merged = 0
+        for kind, table, row_id, fields in batch:
+            key = (table, row_id)
+            if kind == 'insert':
+                inserts[key] = fields
+            elif key in inserts:
+                inserts[key].update(fields)
+                merged += 1
+            elif key in updates:
+                updates[key].update(fields)
+                merged += 1
+            else:
+                updates[key] = fields
+        return inserts, updates, merged
+
+    def _write(self, batch: list):
+        inserts, updates, merged = self._merge(batch)
+        conn = self._connect()
+        if not conn:
+            raise AuditUnavailable(f'Audit database {self.name} unavailable')
+        try:
+            cur = conn.cursor()
+            grouped = {}
+            for (table, row_id), row in inserts.items():
+                cols = tuple(row)
+                grouped.setdefault((table, cols), []).append([row_id] + [row[c] for c in cols])
+            for (table, cols), rows in grouped.items():
+                width = len(cols) + 1
+                per_stmt = max(1, min(_MAX_ROWS_PER_INSERT, _MAX_PARAMS // width))
+                row_sql = '(' + ', '.join(['?'] * width) + ')'
+                for i in range(0, len(rows), per_stmt):
+                    chunk = rows[i:i + per_stmt]
+                    cur.execute(
+                        f"SET IDENTITY_INSERT {table} ON; "
+                        f"INSERT INTO {table} (id, {', '.join(cols)}) VALUES {', '.join([row_sql] * len(chunk))}; "
+                        f"SET IDENTITY_INSERT {table} OFF;",
+                        [v for r in chunk for v in r],
+                    )
+            grouped = {}
+            for (table, row_id), fields in updates.items():
+                cols = tuple(sorted(fields))
+                grouped.setdefault((table, cols), []).append([fields[c] for c in cols] + [row_id])
+            for (table, cols), rows in grouped.items():
+                sql = f"UPDATE {table} SET {', '.join(c + ' = ?' for c in cols)} WHERE id = ?"
+                if len(rows) == 1:
+                    cur.execute(sql, rows[0])
+                else:
+                    try:
+                        cur.fast_executemany = True
+                    except Exception:
+                        pass
+                    cur.executemany(sql, rows)
+            conn.commit()
+            cur.close()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            conn.close()
+        self._stats['batches'] += 1
+        self._stats['inserts'] += len(inserts)
+        self._stats['updates'] += len(updates)
+        self._stats['merged'] += merged
+
+    def shutdown(self):
+        """Stop the flusher thread and write whatever is still queued."""
+        self._stop.set()
+        t = self._thread
+        if t is not None:
+            t.join(timeout=AUDIT_FLUSH_INTERVAL * 4)
+        self._drain()
+
+    def stats(self) -> dict:
+        out = dict(self._stats)
+        out.update({'queued': self._queue.qsize(), 'queue_max': AUDIT_QUEUE_MAX,
+                    'sync_tables': sorted(self._sync_tables)})
+        return out
+
+
+_writers: Dict[str, AuditWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def writer(name: str, connect: Callable) -> AuditWriter:
+    """The shared writer for database `name` (created on first use)."""
+    with _writers_lock:
+        w = _writers.get(name)
+        if w is None:
+            w = _writers[name] = AuditWriter(name, connect)
+        return w
+
+
+def stats() -> dict:
+    with _writers_lock:
+        writers = dict(_writers)
+    return {name: w.stats() for name, w in writers.items()}
+
+
+def shutdown():
+    with _writers_lock:
+        writers = list(_writers.values())
+    for w in writers:
+        try:
+            w.shutdown()
+        except Exception:
+            logger.warning("Flushing audit writer %s at shutdown failed", w.name, exc_info=True)
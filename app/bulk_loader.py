@@ -0,0 +1,244 @@
+"""Bulk insert of imported rows into SQL Server.
+
+Two strategies, chosen per import (`load_strategy` on `/import-data`) with
+`IMPORT_LOAD_STRATEGY` as the default:
+
+- `executemany`: one parameterized INSERT sent with pyodbc `fast_executemany`.
+  Parameter types come from the target table's columns through `setinputsizes`,
+  so the driver sends whole arrays of typed values instead of one round trip
+  (or one giant multi-row statement) per batch of rows.
+- `bulk_insert`: each chunk is written to a staging file in bcp Unicode
+  character format (`bcp -w`), and the server loads it with `BULK INSERT ...
+  WITH (DATAFILETYPE = 'widechar', TABLOCK)`. This needs
+  `IMPORT_BULK_STAGING_DIR`, a directory the SQL Server service can read.
+  `IMPORT_BULK_SERVER_DIR` is the same directory as the server sees it, e.g. a
+  UNC path, and defaults to the staging dir. If the dir is not configured, or
+  the server cannot read the file or lacks the bulk-load permission, the loader
+  switches to `executemany` for the rest of the import. The same happens when
+  the table has columns the import does not fill (e.g. an `_id` identity),
+  since BULK INSERT maps fields to every table column by position.
+
+None values are loaded as NULL by both strategies. The staging file writes
+each value in a form BULK INSERT converts unambiguously (`_bcp_field`). An
+empty field is read as NULL (KEEPNULLS), so chunks with empty strings go
+through `executemany` instead.
+"""
+import os
+import time
+import uuid
+import decimal
+import datetime
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ('executemany', 'bulk_insert')
+
+IMPORT_LOAD_STRATEGY = os.environ.get('IMPORT_LOAD_STRATEGY', 'executemany')
+IMPORT_BULK_STAGING_DIR = os.environ.get('IMPORT_BULK_STAGING_DIR') or None
+IMPORT_BULK_SERVER_DIR = os.environ.get('IMPORT_BULK_SERVER_DIR') or IMPORT_BULK_STAGING_DIR
+
+# Terminators for the staging files; values containing them are loaded with executemany
+FIELD_TERMINATOR = '\x1f'
+ROW_TERMINATOR = '\x1e'
+
+
+def _quote(name: str) -> str:
+    return '[' + str(name).replace(']', ']]') + ']'
+
+
+def _bcp_field(v) -> str:
+    """Text of one value in the staging file, as SQL Server parses it for any target type."""
+    if v is None:
+        return ''
+    if isinstance(v, bool):
+        return '1' if v else '0'
+    if isinstance(v, datetime.datetime):
+        return v.strftime('%Y-%m-%d %H:%M:%S.%f')[:23]
+    if isinstance(v, datetime.date):
+        return v.isoformat()
+    if isinstance(v, decimal.Decimal):
+        return format(v, 'f')
+    if isinstance(v, float):
+        text = repr(v)
+        # No exponent notation: it does not convert to DECIMAL columns
+        return format(decimal.Decimal(text), 'f') if 'e' in text else text
+    return str(v)
+
+
+def type_family(data_type: Optional[str]) -> str:
+    """'integer', 'bit', 'decimal', 'float', 'date', 'datetime' or 'text' for a SQL Server type name."""
+    t = (data_type or '').lower()
+    if t in ('tinyint', 'smallint', 'int', 'bigint'):
+        return 'integer'
+    if t == 'bit':
+        return 'bit'
+    if t in ('decimal', 'numeric', 'money', 'smallmoney'):
+        return 'decimal'
+    if t in ('float', 'real'):
+        return 'float'
+    if t == 'date':
+        return 'date'
+    if t in ('datetime', 'datetime2', 'smalldatetime', 'datetimeoffset'):
+        return 'datetime'
+    return 'text'
+
+
+def table_column_types(cur, table: str) -> dict:
+    """column -> (DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE)."""
+    cur.execute(
+        "SELECT COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE "
+        "FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = ? ORDER BY ORDINAL_POSITION", (table,))
+    return {r[0]: tuple(r[1:]) for r in cur.fetchall()}
+
+
+def input_size(odbc, meta: tuple, kind: str = 'text') -> tuple:
+    """`setinputsizes` entry for a target column; text values bound to a typed column
+    go as NVARCHAR so the server converts them, as a plain INSERT would."""
+    data_type, length, precision, scale = meta
+    data_type = (data_type or '').lower()
+    family = type_family(data_type)
+    if family != 'text' and kind == 'text':
+        return (odbc.SQL_WVARCHAR, 0, 0)
+    if family == 'integer' and kind == 'float':
+        return (odbc.SQL_DOUBLE, 0, 0)
+    if data_type in ('tinyint', 'smallint', 'int'):
+        return (odbc.SQL_INTEGER, 0, 0)
+    if data_type == 'bigint':
+        return (odbc.SQL_BIGINT, 0, 0)
+    if family == 'bit':
+        return (odbc.SQL_BIT, 0, 0)
+    if family == 'decimal' and kind != 'float':
+        return (odbc.SQL_DECIMAL, precision or 38, scale or 0)
+    if family in ('decimal', 'float'):
+        return (odbc.SQL_DOUBLE, 0, 0)
+    if family == 'date':
+        return (odbc.SQL_TYPE_DATE, 0, 0)
+    if data_type in ('datetime', 'smalldatetime'):
+        return (odbc.SQL_TYPE_TIMESTAMP, 23, 3)
+    if family == 'datetime':
+        return (odbc.SQL_TYPE_TIMESTAMP, 27, 7)
+    # (n)varchar(max)/text need size 0, otherwise fast_executemany buffers the declared max per row
+    size = length if length and 0 < length <= 4000 else 0
+    return (odbc.SQL_WVARCHAR, size, 0)
+
+
+class BulkLoader:
+    """Load batches of row tuples into `table`; tracks rows, elapsed time and the strategy used."""
+
+    def __init__(self, conn, table: str, columns: list, strategy: Optional[str] = None):
+        strategy = strategy or IMPORT_LOAD_STRATEGY
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown load strategy '{strategy}'. Use one of: {', '.join(STRATEGIES)}")
+        if strategy == 'bulk_insert' and not IMPORT_BULK_STAGING_DIR:
+            logger.warning("bulk_insert requested but IMPORT_BULK_STAGING_DIR is not set; using executemany")
+            strategy = 'executemany'
+        self.conn = conn
+        self.table = table
+        self.columns = list(columns)
+        self.strategy = strategy
+        self.rows = 0
+        self.seconds = 0.0
+        self._cur = None
+        self.refresh_types()
+        if self.strategy == 'bulk_insert' and self._table_columns != self.columns:
+            # BULK INSERT maps data file fields to every table column by position
+            logger.warning(f"{table} has columns the import does not fill; using executemany")
+            self.strategy = 'executemany'
+        self._insert_sql = (f"INSERT INTO {_quote(table)} ({', '.join(_quote(c) for c in self.columns)}) "
+                            f"VALUES ({', '.join(['?'] * len(self.columns))})")
+
+    def refresh_types(self):
+        """Re-read the target column types (after an ALTER COLUMN)."""
+        cur = self.conn.cursor()
+        try:
+            meta = table_column_types(cur, self.table)
+        finally:
+            cur.close()
+        self._table_columns = list(meta)
+        self._meta = [meta.get(c, ('nvarchar', -1, None, None)) for c in self.columns]
+        self.target_families = {c: type_family(m[0]) for c, m in zip(self.columns, self._meta)}
+        self._kinds = None
+
+    def _cursor(self, kinds: list):
+        if self._cur is None:
+            self._cur = self.conn.cursor()
+            self._cur.fast_executemany = True
+        if kinds != self._kinds:
+            try:
+                import pyodbc
+                self._cur.setinputsizes([input_size(pyodbc, m, k) for m, k in zip(self._meta, kinds)])
+            except Exception:
+                logger.debug("setinputsizes unavailable; binding by value type", exc_info=True)
+            self._kinds = kinds
+        return self._cur
+
+    def _executemany(self, rows: list, kinds: list):
+        self._cursor(kinds).executemany(self._insert_sql, rows)
+
+    def _bulk_insert(self, rows: list) -> bool:
+        """Stage `rows` as a bcp -w file and BULK INSERT it; False if the rows must go through executemany."""
+        lines = []
+        for row in rows:
+            if any(v == '' for v in row if isinstance(v, str)):
+                # Would be loaded as NULL
+                return False
+            fields = [_bcp_field(v) for v in row]
+            if any(FIELD_TERMINATOR in f or ROW_TERMINATOR in f for f in fields):
+                return False
+            lines.append(FIELD_TERMINATOR.join(fields))
+        name = f"import_{uuid.uuid4().hex}.dat"
+        local_path = os.path.join(IMPORT_BULK_STAGING_DIR, name)
+        server_path = os.path.join(IMPORT_BULK_SERVER_DIR, name) if IMPORT_BULK_SERVER_DIR != IMPORT_BULK_STAGING_DIR else local_path
+        try:
+            with open(local_path, 'w', encoding='utf-16-le', newline='') as out:
+                out.write(ROW_TERMINATOR.join(lines) + ROW_TERMINATOR)
+            cur = self.conn.cursor()
+            try:
+                cur.execute(
+                    f"BULK INSERT {_quote(self.table)} FROM '{server_path.replace(chr(39), chr(39) * 2)}' "
+                    f"WITH (DATAFILETYPE = 'widechar', FIELDTERMINATOR = '{FIELD_TERMINATOR}', "
+                    f"ROWTERMINATOR = '{ROW_TERMINATOR}', TABLOCK, KEEPNULLS)")
+            finally:
+                cur.close()
+            return True
+        finally:
+            try:
+                os.unlink(local_path)
+            except Exception:
+                pass
+
+    def load(self, rows: list, kinds: Optional[list] = None):
+        """Insert one batch (row sequences ordered like `columns`). `kinds` gives each
+        column's value kind ('text', 'int', 'float', 'bool', 'datetime'); default text.
+        The caller commits."""
+        if not rows:
+            return
+        kinds = list(kinds or ['text'] * len(self.columns))
+        start = time.perf_counter()
+        if self.strategy == 'bulk_insert':
+            try:
+                if not self._bulk_insert(rows):
+                    self._executemany(rows, kinds)
+            except Exception as e:
+                # Server cannot read the staging dir, or no ADMINISTER BULK OPERATIONS permission
+                logger.warning(f"BULK INSERT into {self.table} failed ({e}); switching to executemany")
+                self.strategy = 'executemany'
+                self._executemany(rows, kinds)
+        else:
+            self._executemany(rows, kinds)
+        self.seconds += time.perf_counter() - start
+        self.rows += len(rows)
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        return round(self.rows / self.seconds, 2) if self.seconds > 0 else None
+
+    def close(self):
+        if self._cur is not None:
+            try:
+                self._cur.close()
+            except Exception:
+                pass
+            self._cur = None
@@ -1,13 +1,29 @@
 import os
+import re
 import json
+import tempfile
+import threading
 import urllib.parse
 from typing import Optional
 
 SETTINGS_PATH = os.path.join(os.path.dirname(__file__), '..', 'instance', 'settings.json')
 
+# Parsed settings plus everything derived from them (resolved ODBC driver and
+# connection strings). The whole snapshot is swapped at once under the lock.
+_snapshot = None
+_snapshot_lock = threading.Lock()
+_drivers_cache = None
 
-def load_settings() -> dict:
-    """Load DB settings from instance/settings.json if present, else {}."""
+
+def _settings_mtime():
+    try:
+        st = os.stat(SETTINGS_PATH)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+def _read_settings_json() -> dict:
     try:
         if os.path.exists(SETTINGS_PATH):
             with open(SETTINGS_PATH, 'r', encoding='utf-8') as f:
@@ -17,6 +33,141 @@ def load_settings() -> dict:
     return {}
 
 
+def available_odbc_drivers(refresh: bool = False) -> list:
+    """Installed ODBC driver names; `pyodbc.drivers()` is only queried once per process."""
+    global _drivers_cache
+    if _drivers_cache is None or refresh:
+        try:
+            import pyodbc
+            _drivers_cache = list(pyodbc.drivers())
+        except Exception:
+            _drivers_cache = []
+    return list(_drivers_cache)
+
+
+def pick_odbc_driver(preferred: Optional[str]) -> str:
+    drivers = available_odbc_drivers()
+    if preferred and preferred in drivers:
+        return preferred
+    # Prefer latest Microsoft ODBC Driver for SQL Server
+    candidates = [d for d in drivers if 'ODBC Driver' in d and 'SQL Server' in d]
+    if candidates:
+        # Sort by version number if present (e.g., 18, 17)
+        def ver(d):
+            m = re.search(r'(\d+)', d)
+            return int(m.group(1)) if m else 0
+        candidates.sort(key=ver, reverse=True)
+        return candidates[0]
+    # Fallback to any SQL Server driver
+    legacy = [d for d in drivers if 'SQL Server' in d]
+    if legacy:
+        return legacy[0]
+    # Last resort: keep preferred or default to common latest
+    return preferred or 'ODBC Driver 18 for SQL Server'
+
+
+def build_odbc_connection_string(s: dict, database: str, driver: str) -> str:
+    """ODBC connection string for `database` using host/auth options from settings `s`."""
+    parts = [f'DRIVER={{{driver}}}', f'SERVER={s.get("host")}', f'DATABASE={database}']
+    if s.get('trusted', True):
+        parts.append('Trusted_Connection=yes')
+    else:
+        uid = s.get('username') or ''
+        pwd = s.get('password') or ''
+        if uid:
+            parts.append(f'UID={uid}')
+        if pwd:
+            parts.append(f'PWD={pwd}')
+    if s.get('encrypt', False):
+        parts.append('Encrypt=yes')
+    parts.append('TrustServerCertificate=yes')
+    return ';'.join(parts)
+
+
+def _build_snapshot(mtime) -> dict:
+    s = _read_settings_json()
+    server = s.get('host')
+    driver = pick_odbc_driver(s.get('driver')) if server else None
+    report_db = s.get('report_database') or s.get('reports_database')
+    defs_db = s.get('report_database') or s.get('reports_database') or s.get('database')
+    data_db = s.get('reports_database') or s.get('report_data_database') or s.get('database')
+    conn_strs = {
+        # Same resolved driver as the other databases, so equal settings give equal strings
+        'main': build_odbc_connection_string(s, s.get('database'), driver) if server and s.get('database') else None,
+        'definitions': build_odbc_connection_string(s, defs_db, driver) if server and defs_db else None,
+        'report_data': build_odbc_connection_string(s, data_db, driver) if server and data_db else None,
+        'report': build_odbc_connection_string(s, report_db or s.get('database'), driver)
+        if server and (report_db or s.get('database')) else None,
+    }
+    return {'mtime': mtime, 'settings': s, 'driver': driver, 'connection_strings': conn_strs}
+
+
+def _current_snapshot() -> dict:
+    global _snapshot
+    mtime = _settings_mtime()
+    snap = _snapshot
+    if snap is not None and snap['mtime'] == mtime:
+        return snap
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot['mtime'] != mtime:
+            changed = _snapshot is not None
+            _snapshot = _build_snapshot(mtime)
+            if changed:
+                _close_pools()
+        return _snapshot
+
+
+def _close_pools():
+    try:
+        from . import db_pool
+        db_pool.close_all()
+    except Exception:
+        pass
+
+
+def reload_settings() -> dict:
+    """Re-read settings.json now and drop pooled connections built from the old values."""
+    global _snapshot
+    available_odbc_drivers(refresh=True)
+    with _snapshot_lock:
+        _snapshot = _build_snapshot(_settings_mtime())
+    _close_pools()
+    return dict(_snapshot['settings'])
+
+
+def write_settings(data: dict):
+    """Atomically replace settings.json and reload the cached snapshot."""
+    folder = os.path.dirname(os.path.abspath(SETTINGS_PATH))
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix='.settings-', suffix='.json', dir=folder)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, SETTINGS_PATH)
+    except Exception:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    reload_settings()
+
+
+def load_settings() -> dict:
+    """Return DB settings from instance/settings.json (cached; revalidated on file mtime), else {}."""
+    return dict(_current_snapshot()['settings'])
+
+
+def resolved_odbc_driver() -> Optional[str]:
+    """The installed ODBC driver chosen for the configured `driver` setting."""
+    return _current_snapshot()['driver']
+
+
+def get_connection_string(name: str) -> Optional[str]:
+    """Precomputed ODBC connection string for `main`, `definitions`, `report_data` or `report`."""
+    return _current_snapshot()['connection_strings'].get(name)
+
+
 def get_database_url_from_settings() -> str:
     """Return SQLAlchemy-style URL from settings or fallback to sqlite file."""
     s = load_settings()
@@ -54,32 +205,17 @@ def get_database_url_from_settings() -> str:
 
 
 def get_odbc_connection_string() -> Optional[str]:
-    """Build a pyodbc connection string from settings; None if insufficient."""
-    s = load_settings()
-    server = s.get('host')
-    database = s.get('database')
-    if not server or not database:
-        return None
-    driver = s.get('driver', 'ODBC Driver 17 for SQL Server')
-    parts = [f'DRIVER={{{driver}}}', f'SERVER={server}', f'DATABASE={database}']
-    if s.get('trusted', True):
-        parts.append('Trusted_Connection=yes')
-    else:
-        uid = s.get('username', '')
-        pwd = s.get('password', '')
-        if uid:
-            parts.append(f'UID={uid}')
-        if pwd:
-            parts.append(f'PWD={pwd}')
-    if s.get('encrypt', False):
-        parts.append('Encrypt=yes')
-    # Add TrustServerCertificate if present in settings
-    parts.append('TrustServerCertificate=yes')
-    return ';'.join(parts)
+    """Return the pyodbc connection string for the main DB; None if insufficient."""
+    return get_connection_string('main')
 
 
 def get_sqlserver_connection(timeout: int = 5):
-    """Return a live pyodbc connection using current settings, or None."""
+    """Return a pooled pyodbc connection using current settings, or None.
+
+    The returned object is a `db_pool.PooledConnection`; calling `close()`
+    returns it to the pool rather than tearing down the ODBC session.
+    `timeout` is the login timeout used if a new connection must be opened.
+    """
     try:
         import pyodbc
     except Exception:
@@ -87,7 +223,8 @@ def get_sqlserver_connection(timeout: int = 5):
     conn_str = get_odbc_connection_string()
     if not conn_str:
         return None
-    return pyodbc.connect(conn_str, timeout=timeout)
+    from . import db_pool
+    return db_pool.connect(conn_str, connect_timeout=timeout)
 
 
 def use_sqlserver() -> bool:
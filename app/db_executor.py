@@ -0,0 +1,145 @@
+"""Run blocking pyodbc work off the asyncio event loop.
+
+All SQL Server access goes through pyodbc, which blocks the calling thread.
+Routes hand that work to `run_in_db(fn, ...)`, which runs it on a bounded
+thread pool and caps how many calls may hit each logical database at once
+(`main`, `definitions`, `report_data`), so one slow stored procedure cannot
+stall `/login` or static pages on the same worker.
+
+`db_route(database)` wraps a plain `def` route so its whole body runs through
+`run_in_db`; FastAPI still sees the original signature for dependencies.
+"""
+import os
+import time
+import asyncio
+import functools
+import contextvars
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+DB_EXECUTOR_WORKERS = int(os.environ.get('DB_EXECUTOR_WORKERS', '16'))
+DB_CONCURRENCY_PER_DB = int(os.environ.get('DB_CONCURRENCY_PER_DB', '8'))
+
+_executor = None
+_executor_lock = threading.Lock()
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+_metrics: Dict[str, dict] = {}
+_metrics_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix='db')
+        return _executor
+
+
+def _get_semaphore(database: str) -> asyncio.Semaphore:
+    sem = _semaphores.get(database)
+    if sem is None:
+        sem = asyncio.Semaphore(DB_CONCURRENCY_PER_DB)
+        _semaphores[database] = sem
+    return sem
+
+
+def _metric(database: str) -> dict:
+    m = _metrics.get(database)
+    if m is None:
+        m = {
+            'queued': 0,
+            'running': 0,
+            'completed': 0,
+            'errors': 0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0,
+            'run_ms_total': 0.0,
+            'run_ms_max': 0.0,
+        }
+        _metrics[database] = m
+    return m
+
+
+async def run_in_db(fn: Callable, *args, database: str = 'main', **kwargs):
+    """Await `fn(*args, **kwargs)` on the DB thread pool.
+
+    Waits for a free slot for `database` first; the time spent waiting (for the
+    slot and for a worker thread) is recorded as wait time.
+    """
+    submitted = time.perf_counter()
+    with _metrics_lock:
+        _metric(database)['queued'] += 1
+    started = {}
+
+    def _call():
+        started['at'] = time.perf_counter()
+        with _metrics_lock:
+            m = _metric(database)
+            m['queued'] -= 1
+            m['running'] += 1
+            wait_ms = (started['at'] - submitted) * 1000
+            m['wait_ms_total'] += wait_ms
+            m['wait_ms_max'] = max(m['wait_ms_max'], wait_ms)
+        return fn(*args, **kwargs)
+
+    ctx = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    failed = False
+    try:
+        async with _get_semaphore(database):
+            return await loop.run_in_executor(_get_executor(), ctx.run, _call)
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        with _metrics_lock:
+            m = _metric(database)
+            if 'at' in started:
+                run_ms = (time.perf_counter() - started['at']) * 1000
+                m['running'] -= 1
+                m['run_ms_total'] += run_ms
+                m['run_ms_max'] = max(m['run_ms_max'], run_ms)
+                m['completed'] += 1
+                if failed:
+                    m['errors'] += 1
+            else:
+                # Cancelled before a worker picked it up
+                m['queued'] -= 1
+
+
+def db_route(database: str = 'main'):
+    """Decorator turning a blocking route function into an async one that uses `run_in_db`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await run_in_db(fn, *args, database=database, **kwargs)
+        return wrapper
+    return decorator
+
+
+def executor_stats() -> dict:
+    with _metrics_lock:
+        databases = {}
+        for name, m in _metrics.items():
+            out = {k: (round(v, 2) if isinstance(v, float) else v) for k, v in m.items()}
+            out['wait_ms_avg'] = round(m['wait_ms_total'] / m['completed'], 2) if m['completed'] else 0.0
+            out['run_ms_avg'] = round(m['run_ms_total'] / m['completed'], 2) if m['completed'] else 0.0
+            databases[name] = out
+    return {
+        'workers': DB_EXECUTOR_WORKERS,
+        'concurrency_per_database': DB_CONCURRENCY_PER_DB,
+        'queue_depth': sum(m['queued'] for m in databases.values()),
+        'databases': databases,
+    }
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        ex, _executor = _executor, None
+    if ex is not None:
+        ex.shutdown(wait=False)
@@ -0,0 +1,347 @@
+"""Bounded, thread-safe pyodbc connection pools.
+
+Every SQL Server helper (`db_connection.get_sqlserver_connection`,
+`api._get_definitions_conn`, `api._get_report_data_conn`, ...) borrows a
+connection from here instead of doing a full ODBC handshake per call.
+
+Pools are keyed by the normalized connection string, so two databases (or two
+drivers for the same database) never share or evict each other's pool; the
+(server, database, auth) `pool_key` only labels a pool in stats and errors.
+Connection-setting changes close every pool (`close_all`). The object handed out is a
+`PooledConnection` proxy: it behaves like a pyodbc connection, but `close()`
+returns it to its pool, so existing `try/finally: conn.close()` call sites keep
+working unchanged.
+
+The connect function is injectable (`ConnectionPool(..., connect=fake)` or
+`set_connect_factory(fake)`) so the pool can be exercised against a fake pyodbc
+stand-in without a SQL Server or an ODBC driver.
+"""
+import os
+import threading
+import time
+import logging
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '10'))
+DEFAULT_MAX_IDLE_SECONDS = float(os.environ.get('DB_POOL_MAX_IDLE', '300'))
+# Borrowed connections idle for longer than this are pinged before use
+DEFAULT_VALIDATE_AFTER_SECONDS = float(os.environ.get('DB_POOL_VALIDATE_AFTER', '10'))
+DEFAULT_CHECKOUT_TIMEOUT = float(os.environ.get('DB_POOL_CHECKOUT_TIMEOUT', '30'))
+
+
+class PoolExhaustedError(Exception):
+    """Raised when no connection could be borrowed within the checkout timeout."""
+
+
+def _default_connect(conn_str: str, timeout: int):
+    import pyodbc
+    return pyodbc.connect(conn_str, timeout=timeout)
+
+
+_connect_factory: Callable = _default_connect
+
+
+def set_connect_factory(factory: Optional[Callable]):
+    """Override how raw connections are opened (e.g. a fake pyodbc in tests).
+
+    Passing None restores the real `pyodbc.connect`. Existing pools are closed
+    so new connections come from the new factory.
+    """
+    global _connect_factory
+    _connect_factory = factory or _default_connect
+    close_all()
+
+
+def parse_conn_str(conn_str: str) -> Dict[str, str]:
+    """Split an ODBC connection string into an upper-cased key/value dict."""
+    out = {}
+    for part in (conn_str or '').split(';'):
+        if '=' not in part:
+            continue
+        k, v = part.split('=', 1)
+        out[k.strip().upper()] = v.strip()
+    return out
+
+
+def normalize_conn_str(conn_str: str) -> Tuple[Tuple[str, str], ...]:
+    """Order- and case-insensitive form of a connection string, used as the pool registry key."""
+    return tuple(sorted((k, v.lower() if k in ('DRIVER', 'SERVER', 'DATABASE') else v)
+                        for k, v in parse_conn_str(conn_str).items()))
+
+
+def pool_key(conn_str: str) -> Tuple[str, str, str]:
+    """(server, database, auth) label of a connection string, for pool stats and errors."""
+    p = parse_conn_str(conn_str)
+    if (p.get('TRUSTED_CONNECTION') or '').lower() == 'yes':
+        auth = 'trusted'
+    else:
+        auth = 'uid:' + (p.get('UID') or '')
+    return (p.get('SERVER', '').lower(), p.get('DATABASE', '').lower(), auth)
+
+
+class PooledConnection:
+    """Proxy around a raw connection; `close()` checks it back into the pool."""
+
+    def __init__(self, pool: 'ConnectionPool', raw):
+        self._pool = pool
+        self._raw = raw
+        self._cursors = []
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def cursor(self):
+        if self._raw is None:
+            raise RuntimeError('Connection has been returned to the pool')
+        cur = self._raw.cursor()
+        self._cursors.append(cur)
+        return cur
+
+    def close(self):
+        # Idempotent: existing call sites frequently close twice
+        raw, self._raw = self._raw, None
+        if raw is None:
+            return
+        cursors, self._cursors = self._cursors, []
+        for cur in cursors:
+            try:
+                cur.close()
+            except Exception:
+                pass
+        self._pool.checkin(raw)
+
+    def discard(self):
+        """Close the underlying connection instead of returning it (e.g. after a fatal error)."""
+        raw, self._raw = self._raw, None
+        self._cursors = []
+        if raw is not None:
+            self._pool.checkin(raw, broken=True)
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get('_raw')
+        if raw is None:
+            raise RuntimeError('Connection has been returned to the pool')
+        return getattr(raw, name)
+
+    def __setattr__(self, name, value):
+        # Attributes such as `timeout` or `autocommit` belong to the raw connection
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+            return
+        raw = self.__dict__.get('_raw')
+        if raw is None:
+            raise RuntimeError('Connection has been returned to the pool')
+        setattr(raw, name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """A bounded LIFO pool of raw connections for one connection string."""
+
+    def __init__(self, conn_str: str, max_size: int = DEFAULT_POOL_SIZE,
+                 max_idle_seconds: float = DEFAULT_MAX_IDLE_SECONDS,
+                 validate_after_seconds: float = DEFAULT_VALIDATE_AFTER_SECONDS,
+                 connect_timeout: int = 5, connect: Optional[Callable] = None):
+        self.conn_str = conn_str
+        self.key = pool_key(conn_str)
+        self.max_size = max(1, int(max_size))
+        self.max_idle_seconds = max_idle_seconds
+        self.validate_after_seconds = validate_after_seconds
+        self.connect_timeout = connect_timeout
+        self._connect = connect
+        self._idle = []  # list of (raw, returned_at); most recently returned last
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'checkouts': 0,
+            'health_check_failures': 0,
+            'evicted_idle': 0,
+            'discarded': 0,
+            'waits': 0,
+            'timeouts': 0,
+        }
+
+    def _open(self, connect_timeout: Optional[int] = None):
+        connect = self._connect or _connect_factory
+        raw = connect(self.conn_str, self.connect_timeout if connect_timeout is None else connect_timeout)
+        with self._cond:
+            self._stats['created'] += 1
+        return raw
+
+    @staticmethod
+    def _close_raw(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _is_alive(raw) -> bool:
+        try:
+            cur = raw.cursor()
+            try:
+                cur.execute('SELECT 1')
+                cur.fetchone()
+            finally:
+                cur.close()
+            return True
+        except Exception:
+            return False
+
+    def _evict_idle_locked(self, now: float):
+        keep = []
+        for raw, returned_at in self._idle:
+            if self.max_idle_seconds and now - returned_at > self.max_idle_seconds:
+                self._close_raw(raw)
+                self._stats['evicted_idle'] += 1
+            else:
+                keep.append((raw, returned_at))
+        self._idle = keep
+
+    def checkout(self, timeout: Optional[float] = None, connect_timeout: Optional[int] = None) -> PooledConnection:
+        """Borrow a connection, opening a new one while under `max_size`.
+
+        `timeout` bounds the wait for a free slot; `connect_timeout` is the login
+        timeout if a new connection has to be opened (default: the pool's).
+        """
+        deadline = time.monotonic() + (DEFAULT_CHECKOUT_TIMEOUT if timeout is None else timeout)
+        while True:
+            candidate = None
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError('Connection pool is closed')
+                now = time.monotonic()
+                self._evict_idle_locked(now)
+                if self._idle:
+                    candidate = self._idle.pop()
+                    self._in_use += 1
+                elif self._in_use < self.max_size:
+                    self._in_use += 1
+                else:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolExhaustedError(
+                            f'No connection available for {self.key[1]} on {self.key[0]} '
+                            f'(pool size {self.max_size})'
+                        )
+                    self._stats['waits'] += 1
+                    self._cond.wait(remaining)
+                    continue
+
+            if candidate is not None:
+                raw, returned_at = candidate
+                if time.monotonic() - returned_at >= self.validate_after_seconds and not self._is_alive(raw):
+                    self._close_raw(raw)
+                    with self._cond:
+                        self._in_use -= 1
+                        self._stats['health_check_failures'] += 1
+                        self._cond.notify()
+                    continue
+                with self._cond:
+                    self._stats['reused'] += 1
+                    self._stats['checkouts'] += 1
+                return PooledConnection(self, raw)
+
+            try:
+                raw = self._open(connect_timeout)
+            except Exception:
+                with self._cond:
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats['checkouts'] += 1
+            return PooledConnection(self, raw)
+
+    def checkin(self, raw, broken: bool = False):
+        """Return a raw connection. Open transactions are rolled back and the query timeout cleared."""
+        if not broken:
+            try:
+                raw.rollback()
+                if getattr(raw, 'timeout', 0):
+                    raw.timeout = 0
+            except Exception:
+                broken = True
+        with self._cond:
+            self._in_use = max(0, self._in_use - 1)
+            if broken or self._closed:
+                self._stats['discarded'] += 1
+                self._close_raw(raw)
+            else:
+                self._idle.append((raw, time.monotonic()))
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for raw, _ in idle:
+            self._close_raw(raw)
+
+    def stats(self) -> dict:
+        with self._cond:
+            out = dict(self._stats)
+            out.update({
+                'server': self.key[0],
+                'database': self.key[1],
+                'auth': self.key[2],
+                'max_size': self.max_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+            })
+        return out
+
+
+_pools: Dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(conn_str: str) -> ConnectionPool:
+    """Return the pool for `conn_str`, creating it on first use."""
+    key = normalize_conn_str(conn_str)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(conn_str)
+            _pools[key] = pool
+        return pool
+
+
+def connect(conn_str: str, timeout: Optional[float] = None, connect_timeout: Optional[int] = None) -> PooledConnection:
+    """Borrow a pooled connection for `conn_str`. Raises like `pyodbc.connect` on failure."""
+    return get_pool(conn_str).checkout(timeout=timeout, connect_timeout=connect_timeout)
+
+
+def pool_stats() -> list:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [p.stats() for p in pools]
+
+
+def close_all():
+    """Close every pool (used on shutdown and when connection settings change)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for p in pools:
+        p.close()
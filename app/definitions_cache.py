@@ -0,0 +1,167 @@
+"""In-process cache of `dbo.report_definitions`.
+
+All definitions are loaded in one query and their `parameters`/`options` JSON
+parsed once. Readers are served from memory; at most every
+`DEFINITIONS_POLL_SECONDS` a cheap signature query (row count, max id, max
+`updated_at`, checksum of id/active) detects edits made by other processes, and
+writes through this process call `invalidate()`.
+
+`version` increases whenever the cached contents change, so callers can use it
+as a validator (e.g. for ETags).
+
+The `CREATE TABLE IF NOT EXISTS` check runs once per definitions connection
+string instead of on every request.
+"""
+import os
+import json
+import time
+import copy
+import threading
+import logging
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFINITIONS_POLL_SECONDS = float(os.environ.get('DEFINITIONS_POLL_SECONDS', '5'))
+
+_SIGNATURE_SQL = (
+    "SELECT COUNT(*), MAX(id), MAX(updated_at), CHECKSUM_AGG(BINARY_CHECKSUM(id, active)) "
+    "FROM dbo.report_definitions"
+)
+_LOAD_SQL = (
+    "SELECT id, report_name, stored_procedure, parameters, active, options, updated_at "
+    "FROM dbo.report_definitions ORDER BY report_name"
+)
+
+
+class DefinitionsUnavailable(Exception):
+    """The definitions database could not be reached and nothing is cached yet."""
+
+
+def _parse_json(raw, default):
+    if not raw:
+        return default
+    try:
+        value = json.loads(raw)
+    except Exception:
+        return default
+    return value if isinstance(value, type(default)) else default
+
+
+class DefinitionsCache:
+    def __init__(self, connect: Callable, ensure_table: Callable, conn_key: Callable = lambda: ''):
+        """`connect()` returns a definitions DB connection (or None), `ensure_table(conn)`
+        creates/migrates the table, and `conn_key()` identifies the current database so the
+        table check re-runs after the connection settings change."""
+        self._connect = connect
+        self._ensure_table = ensure_table
+        self._conn_key = conn_key
+        self._lock = threading.RLock()
+        self._ensured_for = None
+        self._items = None  # list of definition dicts ordered by report_name
+        self._by_id = {}
+        self._signature = None
+        self._checked_at = 0.0
+        self._stale = True
+        self.version = 0
+        self._stats = {'loads': 0, 'polls': 0, 'hits': 0}
+
+    def ensure_table(self, conn):
+        """Run the table check for `conn` once per connection string."""
+        key = self._conn_key()
+        if self._ensured_for == key:
+            return
+        self._ensure_table(conn)
+        self._ensured_for = key
+
+    def invalidate(self):
+        """Force a reload on next access (call after writes through this process)."""
+        with self._lock:
+            self._stale = True
+
+    def _signature_of(self, conn):
+        cur = conn.cursor()
+        try:
+            cur.execute(_SIGNATURE_SQL)
+            row = cur.fetchone()
+            return tuple(str(v) for v in row) if row else None
+        finally:
+            cur.close()
+
+    def _load(self, conn, signature):
+        cur = conn.cursor()
+        try:
+            cur.execute(_LOAD_SQL)
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+        items = []
+        for r in rows:
+            items.append({
+                'id': r[0],
+                'report_name': r[1],
+                'stored_procedure': r[2],
+                'parameters': _parse_json(r[3], []),
+                'active': bool(r[4]),
+                'options': _parse_json(r[5], {}),
+                'updated_at': r[6],
+            })
+        self._items = items
+        self._by_id = {d['id']: d for d in items}
+        self._signature = signature
+        self._stale = False
+        self.version += 1
+        self._stats['loads'] += 1
+
+    def _refresh(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._items is not None and not self._stale and now - self._checked_at < DEFINITIONS_POLL_SECONDS:
+                self._stats['hits'] += 1
+                return
+            conn = self._connect()
+            if not conn:
+                if self._items is not None:
+                    logger.warning("Definitions DB unavailable; serving cached definitions")
+                    return
+                raise DefinitionsUnavailable('Definitions DB connection unavailable')
+            try:
+                self.ensure_table(conn)
+                signature = self._signature_of(conn)
+                self._stats['polls'] += 1
+                if self._items is None or self._stale or signature != self._signature:
+                    self._load(conn, signature)
+                self._checked_at = now
+            except Exception:
+                if self._items is None:
+                    raise
+                logger.warning("Refreshing report definitions failed; serving cached copy", exc_info=True)
+            finally:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+    def all(self) -> list:
+        """All definitions (copies), ordered by report name."""
+        self._refresh()
+        with self._lock:
+            return copy.deepcopy(self._items)
+
+    def get(self, def_id: int) -> Optional[dict]:
+        self._refresh()
+        with self._lock:
+            d = self._by_id.get(int(def_id))
+            return copy.deepcopy(d) if d is not None else None
+
+    def current_version(self) -> int:
+        """Version after a (rate-limited) freshness check."""
+        self._refresh()
+        return self.version
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out.update({'version': self.version, 'items': len(self._items or []),
+                        'poll_seconds': DEFINITIONS_POLL_SECONDS})
+        return out
@@ -0,0 +1,60 @@
+"""Strong ETags and `If-None-Match` handling for read-mostly JSON endpoints.
+
+Endpoints either derive the tag from a version counter they already track
+(`/report/definitions` uses the definitions cache version) or from a hash of the
+JSON body. Responses carry `Cache-Control: private, no-cache`, so clients
+always revalidate and receive `304 Not Modified` when nothing changed.
+"""
+import json
+import uuid
+import hashlib
+from typing import Any, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+# Distinguishes version-based tags across restarts, when counters start over
+_BOOT_ID = uuid.uuid4().hex[:12]
+
+CACHE_CONTROL = 'private, no-cache'
+
+
+def version_etag(name: str, version: Any) -> str:
+    return f'"{name}-{_BOOT_ID}-{version}"'
+
+
+def content_etag(payload: Any) -> str:
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(',', ':'))
+    return '"' + hashlib.sha256(body.encode('utf-8')).hexdigest()[:32] + '"'
+
+
+def matches(request: Optional[Request], etag: str) -> bool:
+    """True if the request's If-None-Match covers `etag` (weak comparison, as RFC 9110 requires)."""
+    if request is None:
+        return False
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    bare = etag[2:] if etag.startswith('W/') else etag
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': CACHE_CONTROL})
+
+
+def json_response(request: Optional[Request], payload: Any, etag: Optional[str] = None) -> Response:
+    """Return `payload` as JSON with an ETag, or a bare 304 if the client already has it."""
+    etag = etag or content_etag(payload)
+    if matches(request, etag):
+        return not_modified(etag)
+    return JSONResponse(jsonable_encoder(payload), headers={'ETag': etag, 'Cache-Control': CACHE_CONTROL})
@@ -0,0 +1,195 @@
+"""Streaming access to uploaded Excel workbooks.
+
+`.xlsx` files are opened with openpyxl `read_only=True`, which parses sheet XML
+lazily as rows are iterated. Sheet names, headers and preview rows therefore
+cost only the rows actually read, and `ExcelChunks` streams a whole sheet as
+DataFrames of `chunk_rows` rows, so memory does not grow with the sheet size.
+Cells keep the types openpyxl gives them (int, float, datetime, bool, str).
+
+Legacy `.xls` workbooks cannot be streamed. They go through `pandas.read_excel`
+(xlrd) as before, with the same interface.
+
+The first row is the header, as with `pandas.read_excel`. Blank header cells
+are unnamed and get `Column_<n>` names from `import_pipeline.sanitize_columns`.
+Repeated headers are numbered like pandas does (`a`, `a.1`, ...). Unnamed
+columns that are empty in the first chunk are dropped.
+"""
+import logging
+from typing import Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+EXCEL_STREAM_EXTENSIONS = ('.xlsx', '.xlsm')
+
+
+def _is_streamable(source, ext: Optional[str]) -> bool:
+    if ext:
+        return ext.lower() in EXCEL_STREAM_EXTENSIONS
+    return str(source).lower().endswith(EXCEL_STREAM_EXTENSIONS)
+
+
+def _open(source):
+    import openpyxl
+    return openpyxl.load_workbook(source, read_only=True, data_only=True)
+
+
+def _worksheet(wb, sheet_name: Optional[str]):
+    if not sheet_name:
+        return wb.worksheets[0]
+    if sheet_name not in wb.sheetnames:
+        raise ValueError(f"Worksheet named '{sheet_name}' not found")
+    return wb[sheet_name]
+
+
+def _header_name(value, idx: int):
+    if value is None or str(value).strip() == '':
+        return f"Unnamed: {idx}"
+    return str(value)
+
+
+def _header(row) -> list:
+    """Column names for a header row: blanks unnamed, duplicates numbered as pandas does."""
+    seen = set()
+    out = []
+    for idx, value in enumerate(row):
+        name = candidate = _header_name(value, idx)
+        n = 0
+        while candidate in seen:
+            n += 1
+            candidate = f"{name}.{n}"
+        seen.add(candidate)
+        out.append(candidate)
+    return out
+
+
+def sheet_names(source, ext: Optional[str] = None) -> list:
+    """Sheet names of a workbook (path or file object) without loading any cells."""
+    if not _is_streamable(source, ext):
+        return pd.ExcelFile(source).sheet_names
+    wb = _open(source)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+def read_head(source, sheet_name: Optional[str] = None, max_rows: int = 10, ext: Optional[str] = None) -> pd.DataFrame:
+    """Header plus at most `max_rows` data rows of a sheet, as `pandas.read_excel(nrows=...)` would return."""
+    if not _is_streamable(source, ext):
+        return pd.read_excel(source, sheet_name=sheet_name or 0, nrows=max_rows)
+    wb = _open(source)
+    try:
+        rows = _worksheet(wb, sheet_name).iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame()
+        columns = _header(header)
+        data = []
+        for row in rows:
+            if len(data) >= max_rows:
+                break
+            data.append(_fit(row, len(columns)))
+        return _frame(data, columns)
+    finally:
+        wb.close()
+
+
+def row_count(source, sheet_name: Optional[str] = None, ext: Optional[str] = None) -> Optional[int]:
+    """Data rows in a sheet from its stored dimensions (None if the workbook has none)."""
+    if not _is_streamable(source, ext):
+        return len(pd.read_excel(source, sheet_name=sheet_name or 0))
+    wb = _open(source)
+    try:
+        max_row = _worksheet(wb, sheet_name).max_row
+        return max(max_row - 1, 0) if max_row else None
+    finally:
+        wb.close()
+
+
+def _fit(row, width: int) -> tuple:
+    row = tuple(row)
+    if len(row) < width:
+        return row + (None,) * (width - len(row))
+    return row[:width]
+
+
+def _frame(data: list, columns: list) -> pd.DataFrame:
+    frame = pd.DataFrame.from_records(data, columns=range(len(columns)), coerce_float=True) if data \
+        else pd.DataFrame(columns=range(len(columns)))
+    frame.columns = columns
+    frame = frame.infer_objects()
+    for idx in range(frame.shape[1]):
+        series = frame.iloc[:, idx]
+        if series.dtype == object:
+            # Mixed cells (numbers next to text, bools next to blanks) -> text, nulls kept
+            frame.isetitem(idx, series.map(str, na_action='ignore'))
+    return frame
+
+
+class ExcelChunks:
+    """Iterate one sheet as DataFrame chunks with sanitized column names (cf. `import_pipeline.CsvChunks`).
+
+    The first chunk is read on construction so `columns` is known before anything
+    is inserted.
+    """
+
+    def __init__(self, source, sheet_name: Optional[str] = None, chunk_rows: int = 50000, ext: Optional[str] = None):
+        from .import_pipeline import sanitize_columns, frame_chunks, _unnamed
+        self.chunk_rows = chunk_rows
+        self._wb = None
+        if _is_streamable(source, ext):
+            self._wb = _open(source)
+            self._rows = _worksheet(self._wb, sheet_name).iter_rows(values_only=True)
+            header = next(self._rows, None) or ()
+            self._raw = _header(header)
+            self._chunks = self._stream()
+        else:
+            df = pd.read_excel(source, sheet_name=sheet_name or 0)
+            self._raw = [str(c) for c in df.columns]
+            df.columns = self._raw
+            self._chunks = frame_chunks(df, chunk_rows)
+        self._first = next(self._chunks, None)
+        # Columns are selected by position so repeated names can never select several at once
+        self._keep_idx = [i for i, c in enumerate(self._raw)
+                          if not (_unnamed(c) and (self._first is None or self._first.iloc[:, i].isna().all()))]
+        self._keep = [self._raw[i] for i in self._keep_idx]
+        self.columns = sanitize_columns(self._keep)
+        # dtypes of the first chunk, for the import log
+        self.dtypes = [str(self._first.iloc[:, i].dtype) if self._first is not None else 'object'
+                       for i in self._keep_idx]
+
+    def _stream(self):
+        width = len(self._raw)
+        batch = []
+        for row in self._rows:
+            batch.append(_fit(row, width))
+            if len(batch) >= self.chunk_rows:
+                yield _frame(batch, self._raw)
+                batch = []
+        if batch:
+            yield _frame(batch, self._raw)
+
+    def _clean(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        chunk = chunk.iloc[:, self._keep_idx]
+        chunk.columns = self.columns
+        return chunk.dropna(axis=0, how='all')
+
+    def __iter__(self):
+        try:
+            if self._first is not None:
+                first, self._first = self._first, None
+                yield self._clean(first)
+            for chunk in self._chunks:
+                yield self._clean(chunk)
+        finally:
+            self.close()
+
+    def close(self):
+        if self._wb is not None:
+            try:
+                self._wb.close()
+            except Exception:
+                pass
+            self._wb = None
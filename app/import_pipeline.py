@@ -0,0 +1,311 @@
+"""Streaming ingestion for `/import-data` uploads.
+
+Uploads are spooled to a temporary file `IMPORT_SPOOL_CHUNK_BYTES` at a time
+instead of being read into memory with `await f.read()`. CSV files are then
+parsed `IMPORT_CSV_CHUNK_ROWS` rows at a time. Each chunk is cleaned, inserted
+through `bulk_loader.BulkLoader` and committed before the next one is read, so
+peak memory depends on the chunk size, not the file size. After every chunk the caller's `on_progress(rows)` is
+called with the number of rows inserted so far.
+
+Column names are sanitized once from the header with the same rules as
+`/create-table`. CSV values are read as text (`dtype=str`), with empty fields
+as nulls. Columns without a header that are empty in the first chunk are
+dropped, since trailing delimiters in CSVs exported from Excel produce them.
+
+`normalize_frame` prepares every chunk (CSV or Excel) for the loader in one
+pass. Nulls become None (SQL NULL, not ''). Numeric and date columns keep their
+values when the target column has a matching type. Otherwise they are
+converted to text only where they are not null.
+"""
+import os
+import re
+import itertools
+import tempfile
+import logging
+from decimal import Decimal
+from typing import Callable, Optional
+
+import pandas as pd
+
+from .bulk_loader import BulkLoader
+from .schema_inference import SchemaInference, coerce_frame, create_table_sql
+
+logger = logging.getLogger(__name__)
+
+IMPORT_SPOOL_DIR = os.environ.get('IMPORT_SPOOL_DIR') or None
+IMPORT_SPOOL_CHUNK_BYTES = int(os.environ.get('IMPORT_SPOOL_CHUNK_BYTES', str(1024 * 1024)))
+IMPORT_CSV_CHUNK_ROWS = int(os.environ.get('IMPORT_CSV_CHUNK_ROWS', '50000'))
+
+
+async def spool_upload(upload, suffix: str = '') -> tuple:
+    """Copy an UploadFile to a temp file piece by piece; return (path, size in bytes)."""
+    size = 0
+    fd, path = tempfile.mkstemp(prefix='import_', suffix=suffix, dir=IMPORT_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                block = await upload.read(IMPORT_SPOOL_CHUNK_BYTES)
+                if not block:
+                    break
+                out.write(block)
+                size += len(block)
+    except Exception:
+        remove(path)
+        raise
+    return path, size
+
+
+def remove(path: Optional[str]):
+    if not path:
+        return
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Could not delete spooled upload {path}: {e}")
+
+
+def _unnamed(col) -> bool:
+    return pd.isna(col) or str(col).strip() == '' or str(col).startswith('Unnamed:')
+
+
+def sanitize_name(name) -> str:
+    """Non-word characters -> '_'; a leading non-letter gets 'col_' (shared with `/create-table`)."""
+    name = re.sub(r'[^a-zA-Z0-9_]', '_', str(name))
+    if name and not name[0].isalpha():
+        name = 'col_' + name
+    return name
+
+
+def sanitize_columns(columns) -> list:
+    """Column names as `/create-table` would create them (`sanitize_name`); unnamed
+    columns become Column_<n> and duplicates get a _<n> suffix."""
+    out = []
+    counts = {}
+    for idx, col in enumerate(columns):
+        name = sanitize_name(f"Column_{idx+1}" if _unnamed(col) else str(col).strip())
+        if name in counts:
+            counts[name] += 1
+            out.append(f"{name}_{counts[name]}")
+        else:
+            counts[name] = 0
+            out.append(name)
+    return out
+
+
+def clean_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Drop empty columns and rows and sanitize the column names of a fully loaded sheet."""
+    df = df.dropna(axis=1, how='all').dropna(axis=0, how='all').reset_index(drop=True)
+    df.columns = sanitize_columns(df.columns)
+    return df
+
+
+def _value_kind(series: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return 'bool'
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return 'int'
+    if pd.api.types.is_float_dtype(series.dtype):
+        return 'float'
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return 'datetime'
+    if series.dtype == object:
+        first = series.first_valid_index()
+        if first is not None and isinstance(series[first], Decimal):
+            return 'decimal'
+    return 'text'
+
+
+def _keeps_kind(kind: str, family: str) -> bool:
+    """Whether values of `kind` can be bound as-is to a column of type `family`."""
+    if kind in ('int', 'float', 'bool', 'decimal'):
+        return family in ('integer', 'decimal', 'float', 'bit')
+    if kind == 'datetime':
+        return family in ('date', 'datetime')
+    return True
+
+
+def normalize_frame(frame: pd.DataFrame, target_families: Optional[dict] = None) -> tuple:
+    """Return (object frame with None for nulls, value kind per column) ready for `BulkLoader.load`.
+
+    `target_families` maps column -> `bulk_loader.type_family` of the target column;
+    a typed value whose target cannot take it is converted to text.
+    """
+    target_families = target_families or {}
+    columns = {}
+    kinds = []
+    for name in frame.columns:
+        series = frame[name]
+        kind = _value_kind(series)
+        family = target_families.get(name, 'text')
+        if not _keeps_kind(kind, family):
+            series = series.astype(str).where(series.notna())
+            kind = 'text'
+        elif kind == 'datetime' and family == 'date':
+            series = series.dt.date
+        columns[name] = series
+        kinds.append(kind)
+    out = pd.DataFrame(columns, index=frame.index).astype(object)
+    return out.where(out.notna(), None), kinds
+
+
+def quote_name(name: str) -> str:
+    return '[' + str(name).replace(']', ']]') + ']'
+
+
+class CsvChunks:
+    """Iterate a CSV file as cleaned DataFrame chunks with sanitized column names.
+
+    The first chunk is read on construction so `columns` is known up front (for
+    the import log and table creation) before anything is inserted.
+    """
+
+    def __init__(self, path: str, chunk_rows: int = IMPORT_CSV_CHUNK_ROWS):
+        self.chunk_rows = chunk_rows
+        self._reader = pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False, na_values=[''])
+        try:
+            self._first = next(self._reader)
+        except StopIteration:
+            self._first = None
+        raw = list(self._first.columns) if self._first is not None else []
+        self._keep = [c for c in raw if not (_unnamed(c) and self._first[c].isna().all())]
+        self.columns = sanitize_columns(self._keep)
+
+    def _clean(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        chunk = chunk.reindex(columns=self._keep)
+        chunk.columns = self.columns
+        return chunk.dropna(axis=0, how='all')
+
+    def __iter__(self):
+        try:
+            if self._first is not None:
+                first, self._first = self._first, None
+                yield self._clean(first)
+            for chunk in self._reader:
+                yield self._clean(chunk)
+        finally:
+            self.close()
+
+    def close(self):
+        try:
+            self._reader.close()
+        except Exception:
+            pass
+
+
+def count_csv_rows(source, chunk_rows: int = IMPORT_CSV_CHUNK_ROWS) -> int:
+    """Data rows in a CSV (path or file object), parsed a chunk at a time with only the first column kept."""
+    return sum(len(chunk) for chunk in pd.read_csv(source, chunksize=chunk_rows, usecols=[0], dtype=str))
+
+
+def _table_columns(cur, table: str) -> list:
+    cur.execute("SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = ? ORDER BY ORDINAL_POSITION", (table,))
+    return [r[0] for r in cur.fetchall()]
+
+
+def prepare_table(conn, table: str, columns: list, if_exists: str, column_types: Optional[dict] = None) -> tuple:
+    """Create or reuse `table` for an import; return (file columns that will be inserted,
+    CREATE TABLE statement or None when an existing table is reused).
+
+    'replace' drops and recreates the table with the types in `column_types`
+    (NVARCHAR(MAX) for the rest). 'append' creates it if missing, otherwise keeps
+    only the columns the table already has.
+    """
+    column_types = column_types or {}
+    cur = conn.cursor()
+    try:
+        existing = [] if if_exists == 'replace' else _table_columns(cur, table)
+        if existing:
+            matching = [c for c in columns if c in existing]
+            skipped = [c for c in columns if c not in existing]
+            if skipped:
+                logger.warning(f"Columns in file but not in table (will be skipped): {skipped}")
+            if not matching:
+                raise ValueError(f"No matching columns between file and table. File has: {columns}, Table has: {existing}")
+            return matching, None
+        if if_exists == 'replace':
+            cur.execute(f"IF OBJECT_ID(?, 'U') IS NOT NULL DROP TABLE {quote_name(table)}", (table,))
+        ddl = create_table_sql(table, {c: column_types.get(c, 'NVARCHAR(MAX)') for c in columns}, quote_name)
+        logger.info(ddl)
+        cur.execute(ddl)
+        conn.commit()
+        return list(columns), ddl
+    finally:
+        cur.close()
+
+
+def _widen_columns(conn, table: str, changed: dict):
+    cur = conn.cursor()
+    try:
+        for column, sql_type in changed.items():
+            logger.info(f"Widening {table}.{column} to {sql_type}")
+            cur.execute(f"ALTER TABLE {quote_name(table)} ALTER COLUMN {quote_name(column)} {sql_type} NULL")
+        conn.commit()
+    finally:
+        cur.close()
+
+
+def frame_chunks(df: pd.DataFrame, chunk_rows: int = IMPORT_CSV_CHUNK_ROWS):
+    """Slice an in-memory DataFrame into chunks for `load_frames`."""
+    for i in range(0, len(df), chunk_rows):
+        yield df.iloc[i:i + chunk_rows]
+
+
+def load_frames(conn, frames, columns: list, table: str, if_exists: str, extra: Optional[dict] = None,
+                on_progress: Optional[Callable[[int], None]] = None, strategy: Optional[str] = None,
+                column_types: Optional[dict] = None) -> dict:
+    """Insert every DataFrame in `frames` (all with `columns`) into `table`, committing per chunk.
+
+    When the table is created, its column types are inferred from the first
+    `IMPORT_INFER_SAMPLE_ROWS` rows (`schema_inference`), `column_types` overriding
+    any column, and widened with ALTER COLUMN if a later chunk does not fit.
+    `extra` maps additional column names to a constant value for every row (e.g.
+    `_import_id`); each is only written if the target table has or gets that column.
+    Returns {'rows', 'seconds', 'rows_per_second', 'strategy', 'column_types', 'ddl'};
+    `strategy` is the `bulk_loader` strategy actually used, `ddl` is None for an
+    existing table.
+    """
+    extra = dict(extra or {})
+    schema = SchemaInference(columns, column_types)
+    frames = iter(frames)
+    sampled = schema.sample(frames)
+    types = schema.types()
+    all_columns = list(columns) + [c for c in extra if c not in columns]
+    create_types = dict(types, **{c: 'BIGINT' for c, v in extra.items() if isinstance(v, int)})
+    insert_columns, ddl = prepare_table(conn, table, all_columns, if_exists, create_types)
+    if ddl is None:
+        schema = None  # existing table: bind to its own column types
+    file_columns = [c for c in insert_columns if c in columns]
+    constants = [(c, extra[c]) for c in insert_columns if c not in columns]
+    loader = BulkLoader(conn, table, file_columns + [c for c, _ in constants], strategy)
+    try:
+        for i, frame in enumerate(itertools.chain(sampled, frames)):
+            if frame.empty:
+                continue
+            frame = frame[file_columns]
+            if schema is not None:
+                if i >= len(sampled):
+                    schema.update(frame)
+                    changed = schema.widened()
+                    if changed:
+                        _widen_columns(conn, table, changed)
+                        loader.refresh_types()
+                        types.update(changed)
+                frame = coerce_frame(frame, types, schema.formats())
+            frame, kinds = normalize_frame(frame, loader.target_families)
+            rows = frame.to_numpy().tolist()
+            if constants:
+                tail = [value for _, value in constants]
+                rows = [row + tail for row in rows]
+                kinds = kinds + [_value_kind(pd.Series([value])) for _, value in constants]
+            loader.load(rows, kinds)
+            conn.commit()
+            logger.info(f"Imported {loader.rows} rows into {table} ({loader.strategy})")
+            if on_progress:
+                on_progress(loader.rows)
+    finally:
+        loader.close()
+    return {'rows': loader.rows, 'seconds': round(loader.seconds, 3),
+            'rows_per_second': loader.rows_per_second, 'strategy': loader.strategy,
+            'column_types': types if ddl else None, 'ddl': ddl}
@@ -2,6 +2,11 @@ from fastapi import FastAPI, Response, Request, Depends, HTTPException
 from fastapi.staticfiles import StaticFiles
 from . import api, db
 from . import db_connection as dbc
+from . import db_pool
+from . import db_executor
+from . import result_sessions
+from . import report_jobs
+from . import audit_log
 import os
 from fastapi.responses import FileResponse
 
@@ -33,11 +38,18 @@ app.include_router(api.router)
 @app.on_event('startup')
 async def startup():
     await db.init_db()
+    # One-time definitions table check and cache warm-up
+    await db_executor.run_in_db(api.warm_definitions_cache, database='definitions')
 
 
 @app.on_event('shutdown')
 async def shutdown():
     await db.shutdown_db()
+    report_jobs.shutdown()
+    result_sessions.close_all()
+    audit_log.shutdown()
+    db_executor.shutdown()
+    db_pool.close_all()
 
 
 @app.get('/')
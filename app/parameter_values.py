@@ -0,0 +1,160 @@
+"""Cached lookup lists for report parameter dropdowns.
+
+A parameter object in a definition's `parameters` JSON may carry a
+`values_query`; its first column is the list of choices. Lists are loaded once
+(up to `PARAMETER_VALUES_MAX_ROWS` values) and cached under (definition id,
+parameter name, query hash) for the parameter's `cache_ttl_seconds`, falling
+back to `PARAMETER_VALUES_DEFAULT_TTL`. Searching (`q`) and paging
+(`offset`/`limit`) run against the cached list, so long lists stay usable
+without re-running the query.
+
+A `values_query` may contain `?` placeholders bound to other parameters listed
+in `depends_on` (cascading dropdowns), e.g.
+`{"name": "p_property_id", "values_query": "SELECT id FROM dbo.properties
+WHERE owner_id = ?", "depends_on": ["p_owner_id"]}`. Such lists are cached per
+tuple of dependency values and are only loaded once every dependency is set.
+
+Storage is a `report_cache.ResultCache` bounded by
+`PARAMETER_VALUES_CACHE_MAX_BYTES`.
+"""
+import os
+import hashlib
+import logging
+from typing import Optional
+
+from .report_cache import ResultCache, estimate_size
+
+logger = logging.getLogger(__name__)
+
+PARAMETER_VALUES_DEFAULT_TTL = float(os.environ.get('PARAMETER_VALUES_DEFAULT_TTL', '300'))
+PARAMETER_VALUES_MAX_ROWS = int(os.environ.get('PARAMETER_VALUES_MAX_ROWS', '100000'))
+PARAMETER_VALUES_CACHE_MAX_BYTES = int(os.environ.get('PARAMETER_VALUES_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+PARAMETER_VALUES_PAGE_SIZE = 1000
+PARAMETER_VALUES_MAX_PAGE = 5000
+
+MATCH_MODES = ('contains', 'prefix')
+
+_FETCH_BATCH = 5000
+
+
+def param_name(p) -> Optional[str]:
+    if isinstance(p, str):
+        return p
+    if isinstance(p, dict):
+        return p.get('name') or p.get('param') or p.get('parameter')
+    return None
+
+
+def find_parameter(parameters: list, name: str) -> Optional[dict]:
+    """The parameter object called `name`, or None (also for plain-string parameters)."""
+    for p in parameters or []:
+        if param_name(p) == name:
+            return p if isinstance(p, dict) else None
+    return None
+
+
+def dependencies(param: Optional[dict]) -> list:
+    """Names of the parameters bound, in order, to the `?` placeholders of `values_query`."""
+    deps = (param or {}).get('depends_on') or []
+    if isinstance(deps, str):
+        deps = [deps]
+    return [str(d) for d in deps if d]
+
+
+def dependency_args(param: Optional[dict], supplied) -> tuple:
+    """Return (args, missing): the bound values taken from the mapping `supplied`, and the
+    dependencies that were not given (blank counts as missing)."""
+    args = []
+    missing = []
+    for dep in dependencies(param):
+        v = supplied.get(dep)
+        if isinstance(v, str):
+            v = v.strip()
+        if v is None or v == '':
+            missing.append(dep)
+        args.append(v)
+    return tuple(args), missing
+
+
+def make_key(definition_id: int, name: str, query: str, args: tuple = ()) -> tuple:
+    digest = hashlib.sha256((query or '').strip().encode('utf-8')).hexdigest()[:16]
+    return (int(definition_id), name, digest, tuple(str(a) for a in args))
+
+
+def ttl_for(param: Optional[dict]) -> float:
+    try:
+        ttl = (param or {}).get('cache_ttl_seconds')
+        return max(0.0, float(ttl)) if ttl is not None else PARAMETER_VALUES_DEFAULT_TTL
+    except (TypeError, ValueError):
+        return PARAMETER_VALUES_DEFAULT_TTL
+
+
+class ValueList:
+    """Loaded choices plus their case-folded text, precomputed for searching."""
+
+    def __init__(self, values: list, truncated: bool = False):
+        self.values = values
+        self.folded = [('' if v is None else str(v)).casefold() for v in values]
+        self.truncated = truncated
+
+    def search(self, q: Optional[str] = None, match: str = 'contains', offset: int = 0,
+               limit: int = PARAMETER_VALUES_PAGE_SIZE) -> tuple:
+        """Return (page, total matches) for an optional search term."""
+        if q:
+            needle = q.casefold()
+            if match == 'prefix':
+                hits = [i for i, f in enumerate(self.folded) if f.startswith(needle)]
+            else:
+                hits = [i for i, f in enumerate(self.folded) if needle in f]
+            return [self.values[i] for i in hits[offset:offset + limit]], len(hits)
+        return self.values[offset:offset + limit], len(self.values)
+
+
+def load(conn, query: str, args: tuple = ()) -> ValueList:
+    """Run `query` (binding `args`) and collect its first column, up to PARAMETER_VALUES_MAX_ROWS values."""
+    cur = conn.cursor()
+    try:
+        if args:
+            cur.execute(query, args)
+        else:
+            cur.execute(query)
+        values = []
+        truncated = False
+        while True:
+            rows = cur.fetchmany(_FETCH_BATCH)
+            if not rows:
+                break
+            values.extend(r[0] for r in rows if r and len(r) > 0)
+            if len(values) >= PARAMETER_VALUES_MAX_ROWS:
+                truncated = len(values) > PARAMETER_VALUES_MAX_ROWS or bool(cur.fetchmany(1))
+                del values[PARAMETER_VALUES_MAX_ROWS:]
+                break
+        if truncated:
+            logger.warning("values_query returned more than %d values; list truncated", PARAMETER_VALUES_MAX_ROWS)
+        return ValueList(values, truncated)
+    finally:
+        try:
+            cur.close()
+        except Exception:
+            pass
+
+
+_cache = ResultCache(PARAMETER_VALUES_CACHE_MAX_BYTES, PARAMETER_VALUES_CACHE_MAX_BYTES // 2)
+
+
+def get(key) -> Optional[ValueList]:
+    return _cache.get(key)
+
+
+def put(key, value_list: ValueList, ttl: float) -> bool:
+    return _cache.put(key, value_list, ttl, estimate_size(value_list.values))
+
+
+def invalidate(definition_id: Optional[int] = None) -> int:
+    return _cache.invalidate(definition_id)
+
+
+def stats() -> dict:
+    out = _cache.stats()
+    out['default_ttl'] = PARAMETER_VALUES_DEFAULT_TTL
+    return out
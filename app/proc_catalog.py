@@ -0,0 +1,170 @@
+"""In-process cache of stored procedure metadata from the report data DB.
+
+Every procedure and its parameters are loaded with one
+`INFORMATION_SCHEMA.ROUTINES`/`PARAMETERS` query and indexed by name, instead of
+one catalog query per procedure. At most every `PROC_CATALOG_POLL_SECONDS` a
+cheap query over `sys.objects` (procedure count and latest `modify_date`)
+detects created, altered or dropped procedures and triggers a reload. Changing
+the report DB connection settings also reloads.
+
+Names are matched case-insensitively, as SQL Server does by default. `search`
+uses a sorted name index, so prefix lookups for the procedure picker do not
+scan the whole list.
+"""
+import os
+import time
+import bisect
+import threading
+import logging
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+PROC_CATALOG_POLL_SECONDS = float(os.environ.get('PROC_CATALOG_POLL_SECONDS', '30'))
+
+_SIGNATURE_SQL = "SELECT COUNT(*), MAX(modify_date) FROM sys.objects WHERE type IN ('P', 'PC')"
+_LOAD_SQL = """
+    SELECT r.SPECIFIC_SCHEMA, r.SPECIFIC_NAME, p.PARAMETER_NAME, p.DATA_TYPE,
+           p.CHARACTER_MAXIMUM_LENGTH, p.NUMERIC_PRECISION, p.NUMERIC_SCALE, p.PARAMETER_MODE
+    FROM INFORMATION_SCHEMA.ROUTINES r
+    LEFT JOIN INFORMATION_SCHEMA.PARAMETERS p
+        ON p.SPECIFIC_SCHEMA = r.SPECIFIC_SCHEMA AND p.SPECIFIC_NAME = r.SPECIFIC_NAME
+    WHERE r.ROUTINE_TYPE = 'PROCEDURE'
+    ORDER BY r.SPECIFIC_NAME, r.SPECIFIC_SCHEMA, p.ORDINAL_POSITION
+"""
+
+
+class CatalogUnavailable(Exception):
+    """The report data database could not be reached and nothing is cached yet."""
+
+
+def _split_name(name: str) -> tuple:
+    """'schema.proc' / '[schema].[proc]' / 'proc' -> (schema or None, proc)."""
+    parts = [p.strip().strip('[]') for p in (name or '').split('.')]
+    if len(parts) >= 2:
+        return parts[-2], parts[-1]
+    return None, parts[0]
+
+
+class ProcedureCatalog:
+    def __init__(self, connect: Callable, conn_key: Callable = lambda: ''):
+        """`connect()` returns a report data DB connection (or None); `conn_key()` identifies
+        the current database so a settings change reloads the catalog."""
+        self._connect = connect
+        self._conn_key = conn_key
+        self._lock = threading.RLock()
+        self._procs = None  # list of {'schema', 'name', 'parameters'} ordered by name
+        self._by_name = {}  # lower-case name -> [procs across schemas]
+        self._names = []  # sorted lower-case names, for prefix search
+        self._loaded_for = None
+        self._signature = None
+        self._checked_at = 0.0
+        self._stale = True
+        self.version = 0
+        self._stats = {'loads': 0, 'polls': 0, 'hits': 0}
+
+    def invalidate(self):
+        with self._lock:
+            self._stale = True
+
+    def _signature_of(self, conn):
+        cur = conn.cursor()
+        try:
+            cur.execute(_SIGNATURE_SQL)
+            row = cur.fetchone()
+            return tuple(str(v) for v in row) if row else None
+        finally:
+            cur.close()
+
+    def _load(self, conn, signature, key):
+        cur = conn.cursor()
+        try:
+            cur.execute(_LOAD_SQL)
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+        procs = []
+        current = None
+        for schema, name, pname, ptype, max_length, precision, scale, mode in rows:
+            if current is None or current['schema'] != schema or current['name'] != name:
+                current = {'schema': schema, 'name': name, 'parameters': []}
+                procs.append(current)
+            if pname:
+                current['parameters'].append({'name': pname, 'type': ptype, 'max_length': max_length,
+                                              'precision': precision, 'scale': scale, 'mode': mode})
+        by_name = {}
+        for p in procs:
+            by_name.setdefault(p['name'].lower(), []).append(p)
+        self._procs = procs
+        self._by_name = by_name
+        self._names = sorted(by_name)
+        self._signature = signature
+        self._loaded_for = key
+        self._stale = False
+        self.version += 1
+        self._stats['loads'] += 1
+
+    def _refresh(self):
+        now = time.monotonic()
+        key = self._conn_key()
+        with self._lock:
+            fresh = self._procs is not None and not self._stale and self._loaded_for == key
+            if fresh and now - self._checked_at < PROC_CATALOG_POLL_SECONDS:
+                self._stats['hits'] += 1
+                return
+            conn = self._connect()
+            if not conn:
+                if self._procs is not None:
+                    logger.warning("Report DB unavailable; serving cached procedure catalog")
+                    return
+                raise CatalogUnavailable('Report DB connection unavailable')
+            try:
+                signature = self._signature_of(conn)
+                self._stats['polls'] += 1
+                if not fresh or signature != self._signature:
+                    self._load(conn, signature, key)
+                self._checked_at = now
+            except Exception:
+                if self._procs is None:
+                    raise
+                logger.warning("Refreshing the procedure catalog failed; serving cached copy", exc_info=True)
+            finally:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+    def get(self, name: str) -> Optional[dict]:
+        """Metadata for `name` ('proc' or 'schema.proc'); an unqualified name prefers dbo."""
+        self._refresh()
+        schema, proc = _split_name(name)
+        with self._lock:
+            matches = self._by_name.get(proc.lower(), [])
+            if schema:
+                matches = [p for p in matches if p['schema'].lower() == schema.lower()]
+            else:
+                matches = sorted(matches, key=lambda p: p['schema'].lower() != 'dbo')
+            return matches[0] if matches else None
+
+    def search(self, prefix: str = '', schema: Optional[str] = 'dbo', limit: Optional[int] = None) -> list:
+        """Procedures whose name starts with `prefix` (case-insensitive), ordered by name."""
+        self._refresh()
+        prefix = (prefix or '').lower()
+        out = []
+        with self._lock:
+            i = bisect.bisect_left(self._names, prefix)
+            while i < len(self._names) and self._names[i].startswith(prefix):
+                for p in self._by_name[self._names[i]]:
+                    if schema is None or p['schema'].lower() == schema.lower():
+                        out.append(p)
+                if limit is not None and len(out) >= limit:
+                    return out[:limit]
+                i += 1
+        return out
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out.update({'version': self.version, 'procedures': len(self._procs or []),
+                        'poll_seconds': PROC_CATALOG_POLL_SECONDS})
+        return out
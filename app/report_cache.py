@@ -0,0 +1,154 @@
+"""In-process cache of complete `/report/run` result sets.
+
+Entries are keyed by (definition id, stored procedure, normalized parameter
+values, definition `updated_at`), so editing a definition naturally misses the
+old entries. Each entry carries the TTL from the definition's
+`options.cache_ttl_seconds` (falling back to `REPORT_CACHE_DEFAULT_TTL`; 0
+disables caching). The cache is an LRU bounded by the approximate JSON size of
+the cached rows (`REPORT_CACHE_MAX_BYTES`); results larger than
+`REPORT_CACHE_MAX_ENTRY_BYTES` are never cached.
+"""
+import os
+import json
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+REPORT_CACHE_MAX_BYTES = int(os.environ.get('REPORT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+REPORT_CACHE_MAX_ENTRY_BYTES = int(os.environ.get('REPORT_CACHE_MAX_ENTRY_BYTES', str(REPORT_CACHE_MAX_BYTES // 4)))
+REPORT_CACHE_DEFAULT_TTL = float(os.environ.get('REPORT_CACHE_DEFAULT_TTL', '0'))
+
+
+def _normalize_value(v):
+    if isinstance(v, str):
+        v = v.strip()
+        return v if v != '' else None
+    return v
+
+
+def make_key(definition_id: int, stored_procedure: str, values: dict, updated_at=None) -> tuple:
+    """Cache key for one run; blank strings and None are treated alike."""
+    params = tuple(sorted((str(k), json.dumps(_normalize_value(v), default=str)) for k, v in (values or {}).items()))
+    return (int(definition_id), (stored_procedure or '').lower(), params, str(updated_at) if updated_at else '')
+
+
+def ttl_for(options: Optional[dict]) -> float:
+    """TTL in seconds for a definition, from its options or the global default."""
+    try:
+        ttl = (options or {}).get('cache_ttl_seconds')
+        return max(0.0, float(ttl)) if ttl is not None else REPORT_CACHE_DEFAULT_TTL
+    except (TypeError, ValueError):
+        return REPORT_CACHE_DEFAULT_TTL
+
+
+def estimate_size(rows: list) -> int:
+    return len(json.dumps(rows, default=str))
+
+
+class RowsCursor:
+    """Minimal cursor over already-fetched rows, optionally continuing into a live cursor.
+
+    Lets a cached (or partially prefetched) result be paged through
+    `result_sessions` exactly like a live pyodbc cursor.
+    """
+
+    def __init__(self, rows: list, cursor=None):
+        self._rows = rows
+        self._pos = 0
+        self._cursor = cursor
+
+    def fetchmany(self, size: int = 1) -> list:
+        out = self._rows[self._pos:self._pos + size]
+        self._pos += len(out)
+        if len(out) < size and self._cursor is not None:
+            out = list(out) + list(self._cursor.fetchmany(size - len(out)))
+        return out
+
+    def close(self):
+        cur, self._cursor = self._cursor, None
+        self._rows = []
+        if cur is not None:
+            cur.close()
+
+
+class ResultCache:
+    """Byte-bounded LRU with per-entry expiry."""
+
+    def __init__(self, max_bytes: int = REPORT_CACHE_MAX_BYTES, max_entry_bytes: int = REPORT_CACHE_MAX_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'expired': 0, 'invalidated': 0}
+
+    def _drop_locked(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if entry[2] <= time.monotonic():
+                self._drop_locked(key)
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[0]
+
+    def put(self, key, value, ttl: float, size: int) -> bool:
+        if ttl <= 0 or size > self.max_entry_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._drop_locked(key)
+            self._entries[key] = (value, size, time.monotonic() + ttl)
+            self._bytes += size
+            self._stats['stores'] += 1
+            while self._bytes > self.max_bytes and self._entries:
+                self._drop_locked(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+        return True
+
+    def invalidate(self, definition_id: Optional[int] = None) -> int:
+        """Drop every entry, or only those for `definition_id`. Returns the count removed."""
+        with self._lock:
+            keys = [k for k in self._entries if definition_id is None or k[0] == int(definition_id)]
+            for k in keys:
+                self._drop_locked(k)
+            self._stats['invalidated'] += len(keys)
+        return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out.update({'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes})
+        return out
+
+
+_cache = ResultCache()
+
+
+def get(key):
+    return _cache.get(key)
+
+
+def put(key, value, ttl: float, size: int) -> bool:
+    return _cache.put(key, value, ttl, size)
+
+
+def invalidate(definition_id: Optional[int] = None) -> int:
+    return _cache.invalidate(definition_id)
+
+
+def stats() -> dict:
+    return _cache.stats()
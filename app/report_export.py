@@ -0,0 +1,280 @@
+"""Encoders for streaming a full stored-procedure result set to the client.
+
+`/report/run/{definition_id}/export` pulls the cursor in `fetchmany` batches and
+feeds each batch through an encoder from `make_encoder`, so only one batch is
+ever held in memory regardless of how many rows the procedure returns.
+
+Text formats (CSV/TSV/NDJSON) convert cells with `_safe_cell`. The columnar
+formats (Arrow IPC stream, Parquet) keep native types: the Arrow schema is
+derived from the pyodbc `cursor.description` type codes and every batch becomes
+one record batch / row group. pyarrow is only needed for the columnar formats.
+"""
+import io
+import os
+import csv
+import json
+import time
+import uuid
+import decimal
+import datetime
+import logging
+from typing import Callable, Iterable, List, Optional
+
+from .config import INSTANCE_PATH
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 2000
+# Record batch / row group size for Arrow and Parquet output
+ARROW_BATCH_ROWS = int(os.environ.get('EXPORT_ARROW_BATCH_ROWS', '20000'))
+EXPORT_SPOOL_TTL = float(os.environ.get('EXPORT_SPOOL_TTL', '86400'))
+EXPORT_SPOOL_DIR = os.path.join(INSTANCE_PATH, 'results', 'exports')
+
+# format -> (media type, file extension)
+TEXT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'tsv': ('text/tab-separated-values; charset=utf-8', 'tsv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+COLUMNAR_FORMATS = {
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrow'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+EXPORT_FORMATS = dict(TEXT_FORMATS, **COLUMNAR_FORMATS)
+
+
+class ExportUnavailableError(Exception):
+    """The requested export format needs an optional dependency that is not installed."""
+
+
+def _delimited(rows: Iterable[list], delimiter: str) -> str:
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=delimiter, lineterminator='\r\n')
+    for r in rows:
+        writer.writerow(['' if v is None else v for v in r])
+    return buf.getvalue()
+
+
+def encode_header(fmt: str, columns: List[str]) -> bytes:
+    """Bytes written before the first batch (the header row for CSV/TSV)."""
+    if fmt == 'csv':
+        # BOM so Excel opens UTF-8 CSV files correctly
+        return ('\ufeff' + _delimited([columns], ',')).encode('utf-8')
+    if fmt == 'tsv':
+        return _delimited([columns], '\t').encode('utf-8')
+    return b''
+
+
+def encode_batch(fmt: str, columns: List[str], batch: Iterable, convert: Callable) -> bytes:
+    """Convert one `fetchmany` batch with `convert` and encode it as `fmt`."""
+    rows = ([convert(v) for v in r] for r in batch)
+    if fmt == 'csv':
+        return _delimited(rows, ',').encode('utf-8')
+    if fmt == 'tsv':
+        return _delimited(rows, '\t').encode('utf-8')
+    if fmt == 'ndjson':
+        return ''.join(json.dumps(dict(zip(columns, r)), default=str) + '\n' for r in rows).encode('utf-8')
+    raise ValueError(f'Unsupported export format: {fmt}')
+
+
+class TextEncoder:
+    batch_size = EXPORT_BATCH_SIZE
+
+    def __init__(self, fmt: str, description, convert: Callable):
+        self.fmt = fmt
+        self.columns = [c[0] for c in description] if description else []
+        self.convert = convert
+
+    def header(self) -> bytes:
+        return encode_header(self.fmt, self.columns)
+
+    def encode(self, batch) -> bytes:
+        return encode_batch(self.fmt, self.columns, batch, self.convert)
+
+    def finish(self) -> bytes:
+        return b''
+
+
+class _DrainableSink:
+    """Write-only file object whose buffered bytes are handed out by `drain()`."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        b = bytes(data)
+        self._chunks.append(b)
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def drain(self) -> bytes:
+        out, self._chunks = b''.join(self._chunks), []
+        return out
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+        return pyarrow
+    except ImportError:
+        raise ExportUnavailableError('Arrow/Parquet export requires the pyarrow package')
+
+
+def arrow_schema(description):
+    """Map pyodbc `cursor.description` type codes to an Arrow schema."""
+    pa = _import_pyarrow()
+    fields = []
+    for col in description or []:
+        name, type_code = col[0], col[1]
+        precision, scale = (col[4], col[5]) if len(col) > 5 else (None, None)
+        if type_code is bool:
+            t = pa.bool_()
+        elif type_code is int:
+            t = pa.int64()
+        elif type_code is float:
+            t = pa.float64()
+        elif type_code is decimal.Decimal:
+            if precision and 0 < precision <= 38 and scale is not None and 0 <= scale <= precision:
+                t = pa.decimal128(precision, scale)
+            else:
+                t = pa.float64()
+        elif type_code is datetime.datetime:
+            t = pa.timestamp('us')
+        elif type_code is datetime.date:
+            t = pa.date32()
+        elif type_code is datetime.time:
+            t = pa.time64('us')
+        elif type_code in (bytes, bytearray):
+            t = pa.binary()
+        else:
+            # str, uuid.UUID and anything unrecognised
+            t = pa.string()
+        fields.append(pa.field(name, t, nullable=True))
+    return pa.schema(fields)
+
+
+class ColumnarEncoder:
+    """Encodes fetchmany batches as Arrow IPC stream messages or Parquet row groups."""
+
+    batch_size = ARROW_BATCH_ROWS
+
+    def __init__(self, fmt: str, description):
+        pa = _import_pyarrow()
+        self._pa = pa
+        self.fmt = fmt
+        self.schema = arrow_schema(description)
+        self._sink = _DrainableSink()
+        if fmt == 'arrow':
+            self._writer = pa.ipc.new_stream(self._sink, self.schema)
+        else:
+            self._writer = pa.parquet.ParquetWriter(pa.PythonFile(self._sink, mode='w'), self.schema)
+
+    def _column(self, values: list, field):
+        pa = self._pa
+        try:
+            return pa.array(values, type=field.type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+            if pa.types.is_string(field.type):
+                return pa.array([None if v is None else str(v) for v in values], type=field.type)
+            raise
+
+    def header(self) -> bytes:
+        return self._sink.drain()
+
+    def encode(self, batch) -> bytes:
+        pa = self._pa
+        columns = list(zip(*batch)) if batch else [[] for _ in self.schema]
+        arrays = [self._column(list(values), field) for values, field in zip(columns, self.schema)]
+        record_batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if self.fmt == 'arrow':
+            self._writer.write_batch(record_batch)
+        else:
+            self._writer.write_batch(record_batch, row_group_size=len(batch) or None)
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+def make_encoder(fmt: str, description, convert: Callable):
+    if fmt in TEXT_FORMATS:
+        return TextEncoder(fmt, description, convert)
+    if fmt in COLUMNAR_FORMATS:
+        return ColumnarEncoder(fmt, description)
+    raise ValueError(f'Unsupported export format: {fmt}')
+
+
+def check_format_available(fmt: str):
+    """Raise ExportUnavailableError before running a report whose format cannot be produced."""
+    if fmt in COLUMNAR_FORMATS:
+        _import_pyarrow()
+
+
+def new_spool_file(ext: str, owner: str):
+    """Return (file_id, open binary file) for keeping a copy of an export on disk.
+
+    `owner` is written next to it (`<file_id>.owner`); only they can download it.
+    """
+    sweep_spool()
+    os.makedirs(EXPORT_SPOOL_DIR, exist_ok=True)
+    file_id = f'{uuid.uuid4().hex}.{ext}'
+    path = os.path.join(EXPORT_SPOOL_DIR, file_id)
+    with open(path + '.owner', 'w', encoding='utf-8') as fh:
+        fh.write(owner)
+    return file_id, open(path, 'wb')
+
+
+def spool_path(file_id: str, owner: Optional[str] = None):
+    """Path of a spooled export, or None for unknown/unsafe ids or one spooled by someone other than `owner`.
+
+    `owner=None` skips the owner check (admins).
+    """
+    if not file_id or os.path.basename(file_id) != file_id:
+        return None
+    path = os.path.join(EXPORT_SPOOL_DIR, file_id)
+    if not os.path.isfile(path):
+        return None
+    if owner is not None:
+        try:
+            with open(path + '.owner', encoding='utf-8') as fh:
+                if fh.read() != owner:
+                    return None
+        except OSError:
+            return None
+    return path
+
+
+def sweep_spool():
+    """Delete spooled exports older than EXPORT_SPOOL_TTL."""
+    try:
+        names = os.listdir(EXPORT_SPOOL_DIR)
+    except OSError:
+        return
+    cutoff = time.time() - EXPORT_SPOOL_TTL
+    for name in names:
+        path = os.path.join(EXPORT_SPOOL_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+        except OSError:
+            pass
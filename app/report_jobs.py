@@ -0,0 +1,216 @@
+"""Background execution of long-running report runs.
+
+`POST /report/jobs` returns a job id straight away and the stored procedure runs
+on a small dedicated worker pool (`REPORT_JOB_WORKERS`), separate from the DB
+executor so long jobs cannot starve interactive requests. At most
+`REPORT_JOB_QUEUE_MAX` jobs may wait for a worker. The result is spooled to disk
+through a `result_sessions.ResultSession` and paged from there; finished jobs
+and their spool files are dropped `REPORT_JOB_TTL` seconds after completion.
+
+Job state lives in memory; the API mirrors it into `dbo.report_log`.
+"""
+import os
+import time
+import uuid
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+REPORT_JOB_WORKERS = int(os.environ.get('REPORT_JOB_WORKERS', '4'))
+REPORT_JOB_QUEUE_MAX = int(os.environ.get('REPORT_JOB_QUEUE_MAX', '50'))
+REPORT_JOB_TTL = float(os.environ.get('REPORT_JOB_TTL', '3600'))
+
+TERMINAL_STATUSES = ('success', 'error', 'timeout', 'cancelled')
+
+
+class JobQueueFull(Exception):
+    """Raised when `REPORT_JOB_QUEUE_MAX` jobs are already waiting for a worker."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's worker once cancellation has been requested."""
+
+
+class Job:
+    def __init__(self, owner: str, definition_id: int, report_name: str, log_id: Optional[int] = None):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.definition_id = definition_id
+        self.report_name = report_name
+        self.log_id = log_id
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.columns = []
+        self.rows_fetched = 0
+        self.total_rows = None
+        self.error = None
+        self.session = None  # ResultSession holding the spooled rows
+        self.cursor = None  # set while the statement runs so it can be cancelled
+        self.cancel_requested = False
+        self.version = 0  # bumped on every change; lets SSE streams detect updates
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def update(self, **fields):
+        with self._lock:
+            for k, v in fields.items():
+                setattr(self, k, v)
+            self.version += 1
+
+    def transition(self, from_status: str, to_status: str, **fields) -> bool:
+        """Atomically move from `from_status` to `to_status`; False if the job was elsewhere."""
+        with self._lock:
+            if self.status != from_status:
+                return False
+            self.status = to_status
+            for k, v in fields.items():
+                setattr(self, k, v)
+            self.version += 1
+            return True
+
+    def check_cancelled(self):
+        if self.cancel_requested:
+            raise JobCancelled('Report job was cancelled')
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            elapsed = None
+            if self.started_at:
+                elapsed = round(((self.finished_at or time.time()) - self.started_at) * 1000)
+            return {
+                'job_id': self.id,
+                'definition_id': self.definition_id,
+                'report_name': self.report_name,
+                'report_log_id': self.log_id,
+                'status': self.status,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'elapsed_ms': elapsed,
+                'columns': self.columns,
+                'rows_fetched': self.rows_fetched,
+                'total_rows': self.total_rows,
+                'error': self.error,
+            }
+
+
+_jobs: Dict[str, Job] = {}
+_jobs_lock = threading.Lock()
+_executor = None
+_queued = 0
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _jobs_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=REPORT_JOB_WORKERS, thread_name_prefix='report-job')
+        return _executor
+
+
+def _run(job: Job, fn: Callable):
+    global _queued
+    with _jobs_lock:
+        _queued -= 1
+    if not job.transition('queued', 'running', started_at=time.time()):
+        # Cancelled while it was waiting for a worker
+        return
+    try:
+        fn(job)
+        if not job.finished:
+            job.update(status='success', finished_at=time.time())
+    except JobCancelled:
+        job.update(status='cancelled', finished_at=time.time())
+    except Exception as e:
+        logger.warning("Report job %s failed: %s", job.id, e)
+        job.update(status='error', error=str(e), finished_at=time.time())
+
+
+def submit(job: Job, fn: Callable) -> Job:
+    """Queue `fn(job)` on the worker pool. `fn` fills in the job's result fields."""
+    global _queued
+    sweep()
+    with _jobs_lock:
+        if _queued >= REPORT_JOB_QUEUE_MAX:
+            raise JobQueueFull(f'Too many queued report jobs (limit {REPORT_JOB_QUEUE_MAX})')
+        _queued += 1
+        _jobs[job.id] = job
+    try:
+        _get_executor().submit(_run, job, fn)
+    except Exception:
+        with _jobs_lock:
+            _queued -= 1
+            _jobs.pop(job.id, None)
+        raise
+    return job
+
+
+def cancel(job: Job) -> bool:
+    """Request cancellation. A queued job is cancelled at once (returns True);
+    a running job has its in-flight statement cancelled via `cursor.cancel()`.
+    """
+    job.cancel_requested = True
+    if job.transition('queued', 'cancelled', finished_at=time.time()):
+        return True
+    cur = job.cursor
+    if cur is not None:
+        try:
+            cur.cancel()
+        except Exception:
+            logger.debug("cursor.cancel() failed for job %s", job.id, exc_info=True)
+    return False
+
+
+def get(job_id: str) -> Optional[Job]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def list_jobs(owner: Optional[str] = None) -> list:
+    with _jobs_lock:
+        jobs = [j for j in _jobs.values() if owner is None or j.owner == owner]
+    return sorted(jobs, key=lambda j: j.created_at, reverse=True)
+
+
+def _discard(job: Job):
+    if job.session is not None:
+        job.session.close()
+
+
+def sweep():
+    """Forget finished jobs older than REPORT_JOB_TTL and delete their spool files."""
+    cutoff = time.time() - REPORT_JOB_TTL
+    with _jobs_lock:
+        expired = [j for j in _jobs.values() if j.finished and (j.finished_at or 0) < cutoff]
+        for j in expired:
+            _jobs.pop(j.id, None)
+    for j in expired:
+        _discard(j)
+
+
+def stats() -> dict:
+    with _jobs_lock:
+        counts = {}
+        for j in _jobs.values():
+            counts[j.status] = counts.get(j.status, 0) + 1
+        return {'workers': REPORT_JOB_WORKERS, 'queue_max': REPORT_JOB_QUEUE_MAX, 'queued': _queued, 'jobs': counts}
+
+
+def shutdown():
+    global _executor
+    with _jobs_lock:
+        ex, _executor = _executor, None
+        jobs = list(_jobs.values())
+        _jobs.clear()
+    if ex is not None:
+        ex.shutdown(wait=False, cancel_futures=True)
+    for j in jobs:
+        _discard(j)
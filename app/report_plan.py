@@ -0,0 +1,327 @@
+"""Compiled execution plans for report definitions.
+
+A definition's `parameters` JSON is compiled once per definition version into
+a `ReportPlan`. The plan holds ordered `ParamSpec`s, a converter for each
+declared `type`, the prepared `EXEC dbo.[proc] ?, ...` text and the ODBC input
+sizes. Form values are converted and validated before any DB work. Bad input
+raises `PlanError` listing every problem. Typed values (and `setinputsizes`
+where the driver supports it) bind as int/bit/date/... instead of strings, so
+SQL Server skips implicit conversions and reuses the cached plan.
+
+Parameter objects may declare `type` (SQL Server type name such as `int`,
+`bit`, `date`, `datetime2`, `decimal`, `varchar`), `max_length`, `precision`,
+`scale` and `required`. Plain-string parameters and unknown types are passed
+through unchanged, as before.
+"""
+import re
+import datetime
+import threading
+import logging
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+_TRUE = ('1', 'true', 'yes', 'y', 'on')
+_FALSE = ('0', 'false', 'no', 'n', 'off')
+
+_INT_RANGES = {
+    'tinyint': (0, 255),
+    'smallint': (-2 ** 15, 2 ** 15 - 1),
+    'int': (-2 ** 31, 2 ** 31 - 1),
+    'bigint': (-2 ** 63, 2 ** 63 - 1),
+}
+_STRING_TYPES = ('varchar', 'nvarchar', 'char', 'nchar', 'text', 'ntext', 'sysname', 'string')
+_DECIMAL_TYPES = ('decimal', 'numeric', 'money', 'smallmoney')
+_MONEY_SIZES = {'money': (19, 4), 'smallmoney': (10, 4)}
+_FLOAT_TYPES = ('float', 'real')
+_DATETIME_TYPES = ('datetime', 'datetime2', 'smalldatetime', 'datetimeoffset')
+
+
+class PlanError(ValueError):
+    """Form input does not fit the definition's declared parameter types."""
+
+    def __init__(self, errors: list):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+
+def _int_converter(sql_type: str) -> Callable:
+    low, high = _INT_RANGES[sql_type]
+
+    def convert(raw: str):
+        try:
+            value = int(raw)
+        except ValueError:
+            raise ValueError('expected an integer')
+        if not low <= value <= high:
+            raise ValueError(f'out of range for {sql_type}')
+        return value
+    return convert
+
+
+def _bit(raw: str):
+    folded = raw.lower()
+    if folded in _TRUE:
+        return True
+    if folded in _FALSE:
+        return False
+    raise ValueError('expected true/false or 1/0')
+
+
+def _decimal_converter(precision: Optional[int], scale: Optional[int]) -> Callable:
+    def convert(raw: str):
+        try:
+            value = Decimal(raw.replace(',', ''))
+        except InvalidOperation:
+            raise ValueError('expected a number')
+        if not value.is_finite():
+            raise ValueError('expected a number')
+        if precision and value and value.adjusted() + 1 > precision - (scale or 0):
+            raise ValueError(f'too many digits for decimal({precision},{scale or 0})')
+        return value
+    return convert
+
+
+def _float(raw: str):
+    try:
+        return float(raw)
+    except ValueError:
+        raise ValueError('expected a number')
+
+
+def _date(raw: str):
+    try:
+        return datetime.date.fromisoformat(raw[:10])
+    except ValueError:
+        raise ValueError('expected a date (YYYY-MM-DD)')
+
+
+def _datetime(raw: str):
+    try:
+        return datetime.datetime.fromisoformat(raw.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError('expected a date/time (YYYY-MM-DDTHH:MM[:SS])')
+
+
+def _time(raw: str):
+    try:
+        return datetime.time.fromisoformat(raw)
+    except ValueError:
+        raise ValueError('expected a time (HH:MM[:SS])')
+
+
+def _string_converter(max_length: Optional[int]) -> Callable:
+    def convert(raw: str):
+        if max_length and max_length > 0 and len(raw) > max_length:
+            raise ValueError(f'longer than {max_length} characters')
+        return raw
+    return convert
+
+
+def _as_int(v) -> Optional[int]:
+    try:
+        return int(v) if v is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _base_type(declared) -> tuple:
+    """'varchar(50)' -> ('varchar', 50); 'decimal(10,2)' -> ('decimal', (10, 2))."""
+    m = re.match(r'^\s*([a-zA-Z0-9_]+)\s*(?:\(\s*([^)]*)\))?', str(declared or ''))
+    if not m:
+        return '', None
+    args = [a.strip() for a in (m.group(2) or '').split(',') if a.strip()]
+    if not args:
+        return m.group(1).lower(), None
+    if args[0].lower() == 'max':
+        return m.group(1).lower(), -1
+    if len(args) == 2:
+        return m.group(1).lower(), (_as_int(args[0]), _as_int(args[1]))
+    return m.group(1).lower(), _as_int(args[0])
+
+
+class ParamSpec:
+    def __init__(self, name: str, sql_type: str = '', max_length: Optional[int] = None,
+                 precision: Optional[int] = None, scale: Optional[int] = None, required: bool = False):
+        self.name = name
+        self.sql_type = sql_type
+        self.max_length = max_length
+        self.precision = precision
+        self.scale = scale
+        self.required = required
+        self.typed = True
+        if sql_type in _INT_RANGES:
+            self.convert = _int_converter(sql_type)
+        elif sql_type == 'bit':
+            self.convert = _bit
+        elif sql_type in _DECIMAL_TYPES:
+            self.convert = _decimal_converter(precision, scale)
+        elif sql_type in _FLOAT_TYPES:
+            self.convert = _float
+        elif sql_type == 'date':
+            self.convert = _date
+        elif sql_type in _DATETIME_TYPES:
+            self.convert = _datetime
+        elif sql_type == 'time':
+            self.convert = _time
+        elif sql_type in _STRING_TYPES:
+            self.convert = _string_converter(max_length)
+        else:
+            # Undeclared/unknown type: hand the raw form value to the driver as before
+            self.typed = False
+            self.convert = None
+
+    @classmethod
+    def from_definition(cls, p) -> Optional['ParamSpec']:
+        if isinstance(p, str):
+            return cls(p) if p else None
+        if not isinstance(p, dict):
+            return None
+        name = p.get('name') or p.get('param') or p.get('parameter') or p.get('parameter_name')
+        if not name:
+            return None
+        sql_type, args = _base_type(p.get('type') or p.get('data_type'))
+        max_length = _as_int(p.get('max_length', p.get('length')))
+        precision, scale = _as_int(p.get('precision')), _as_int(p.get('scale'))
+        if isinstance(args, tuple):
+            precision, scale = precision or args[0], scale if scale is not None else args[1]
+        elif args is not None:
+            if sql_type in _DECIMAL_TYPES:
+                precision = precision or args
+                scale = 0 if scale is None else scale  # decimal(p) means decimal(p, 0)
+            elif max_length is None:
+                max_length = args
+        return cls(str(name), sql_type, max_length, precision, scale, bool(p.get('required')))
+
+    def bind(self, raw):
+        """Convert one form value; raises ValueError with a short reason."""
+        value = raw.strip() if isinstance(raw, str) else raw
+        if value is None or value == '':
+            if self.required:
+                raise ValueError('is required')
+            return raw if not self.typed else None
+        if not self.typed:
+            return raw
+        return self.convert(value if isinstance(value, str) else str(value))
+
+    def input_size(self, odbc):
+        """(sql_type, size, decimal_digits) for `cursor.setinputsizes`, or None to let the driver pick."""
+        t = self.sql_type
+        if t in ('tinyint', 'smallint', 'int'):
+            return (odbc.SQL_INTEGER, 0, 0)
+        if t == 'bigint':
+            return (odbc.SQL_BIGINT, 0, 0)
+        if t == 'bit':
+            return (odbc.SQL_BIT, 0, 0)
+        if t in _DECIMAL_TYPES:
+            precision, scale = _MONEY_SIZES.get(t, (self.precision, self.scale))
+            if scale is None:
+                # Binding an unknown scale as 0 would cut off the fraction
+                return None
+            return (odbc.SQL_DECIMAL, precision or 38, scale)
+        if t in _FLOAT_TYPES:
+            return (odbc.SQL_DOUBLE, 0, 0)
+        if t == 'date':
+            return (odbc.SQL_TYPE_DATE, 0, 0)
+        if t in ('datetime', 'smalldatetime'):
+            return (odbc.SQL_TYPE_TIMESTAMP, 23, 3)
+        if t in ('datetime2', 'datetimeoffset'):
+            return (odbc.SQL_TYPE_TIMESTAMP, 27, 7)
+        if t in _STRING_TYPES:
+            size = self.max_length if self.max_length and self.max_length > 0 else 0
+            return (odbc.SQL_WVARCHAR, size if size <= 4000 else 0, 0)
+        return None
+
+
+class ReportPlan:
+    def __init__(self, definition_id: int, stored_procedure: str, params: list, version=None):
+        self.definition_id = definition_id
+        self.stored_procedure = stored_procedure
+        self.params = params
+        self.version = version
+        self.names = [p.name for p in params]
+        placeholders = ', '.join(['?'] * len(params))
+        self.exec_sql = f"EXEC dbo.[{stored_procedure}]" + (f" {placeholders}" if placeholders else '')
+        self._input_sizes = None
+        self._input_sizes_done = False
+
+    def bind(self, form) -> tuple:
+        """Return (values_dict, ordered_values) from `param_<name>` form fields, or raise PlanError."""
+        values = {}
+        errors = []
+        for spec in self.params:
+            try:
+                raw = form.get(f'param_{spec.name}')
+            except Exception:
+                raw = None
+            try:
+                values[spec.name] = spec.bind(raw)
+            except ValueError as e:
+                errors.append(f'{spec.name}: {e}')
+        if errors:
+            raise PlanError(errors)
+        return values, [values[n] for n in self.names]
+
+    def input_sizes(self) -> Optional[list]:
+        """Per-parameter ODBC input sizes, or None when any parameter is untyped or pyodbc lacks them."""
+        if not self._input_sizes_done:
+            try:
+                import pyodbc
+                sizes = [spec.input_size(pyodbc) for spec in self.params]
+                self._input_sizes = sizes if sizes and all(s is not None for s in sizes) else None
+            except Exception:
+                self._input_sizes = None
+            self._input_sizes_done = True
+        return self._input_sizes
+
+    def execute(self, cur, ordered_values: list):
+        """Run the prepared EXEC on `cur` with typed bindings."""
+        if not ordered_values:
+            return cur.execute(self.exec_sql)
+        sizes = self.input_sizes()
+        if sizes and hasattr(cur, 'setinputsizes'):
+            try:
+                cur.setinputsizes(sizes)
+            except Exception:
+                logger.debug("setinputsizes not supported; binding by value type", exc_info=True)
+        return cur.execute(self.exec_sql, ordered_values)
+
+
+def compile_plan(definition: dict) -> ReportPlan:
+    params = [s for s in (ParamSpec.from_definition(p) for p in definition.get('parameters') or []) if s]
+    return ReportPlan(definition['id'], definition['stored_procedure'], params, definition.get('updated_at'))
+
+
+_plans = {}
+_plans_lock = threading.Lock()
+_stats = {'compiled': 0, 'hits': 0}
+
+
+def plan_for(definition: dict) -> ReportPlan:
+    """The compiled plan for a definition, recompiled only when its `updated_at` changes."""
+    def_id = definition['id']
+    version = (definition.get('updated_at'), definition.get('stored_procedure'))
+    with _plans_lock:
+        entry = _plans.get(def_id)
+        if entry is not None and entry[0] == version:
+            _stats['hits'] += 1
+            return entry[1]
+    plan = compile_plan(definition)
+    with _plans_lock:
+        _plans[def_id] = (version, plan)
+        _stats['compiled'] += 1
+    return plan
+
+
+def invalidate(definition_id: Optional[int] = None):
+    with _plans_lock:
+        if definition_id is None:
+            _plans.clear()
+        else:
+            _plans.pop(int(definition_id), None)
+
+
+def stats() -> dict:
+    with _plans_lock:
+        return dict(_stats, plans=len(_plans))
@@ -0,0 +1,287 @@
+"""Cursor-backed, paginated result sets for `/report/run`.
+
+Instead of `fetchall()` on a stored procedure result, `run_report` opens a
+`ResultSession` around the live cursor and only fetches the first page with
+`fetchmany`. Further pages are pulled from the cursor on demand and spooled to
+a JSON-lines file, so clients can page backwards as well as forwards
+(`offset`/`limit` or a continuation token) without the rows ever being held in
+Python memory all at once.
+
+The pooled connection stays pinned to the session until the cursor is
+exhausted. At most `MAX_LIVE_RESULT_SESSIONS` sessions hold one at a time:
+`release_connections` (called before a report borrows a connection) drains the
+least recently used of them to its spool file, which returns its connection to
+the pool. Idle sessions are closed after `RESULT_SESSION_TTL` seconds and the
+least recently used session is closed when more than `MAX_RESULT_SESSIONS` are
+open.
+
+If fetching from the cursor fails, the error is kept on the session. Rows
+spooled before it can still be read; any request that needs more raises
+`ResultFetchError`.
+"""
+import os
+import json
+import time
+import uuid
+import base64
+import threading
+import logging
+from typing import Callable, Optional
+
+from . import db_pool
+from .config import INSTANCE_PATH
+
+logger = logging.getLogger(__name__)
+
+RESULT_PAGE_SIZE = int(os.environ.get('RESULT_PAGE_SIZE', '100'))
+RESULT_MAX_PAGE_SIZE = int(os.environ.get('RESULT_MAX_PAGE_SIZE', '5000'))
+RESULT_SESSION_TTL = float(os.environ.get('RESULT_SESSION_TTL', '600'))
+MAX_RESULT_SESSIONS = int(os.environ.get('MAX_RESULT_SESSIONS', '50'))
+# Sessions allowed to keep a pooled connection; must stay below the pool size
+MAX_LIVE_RESULT_SESSIONS = int(os.environ.get('MAX_LIVE_RESULT_SESSIONS', str(max(1, db_pool.DEFAULT_POOL_SIZE // 2))))
+RESULTS_DIR = os.path.join(INSTANCE_PATH, 'results')
+SPOOL_DIR = os.path.join(RESULTS_DIR, 'sessions')
+
+# A byte offset is remembered every CHECKPOINT_ROWS rows of the spool file
+CHECKPOINT_ROWS = 1000
+FETCH_BATCH = 500
+
+
+class ResultSessionError(Exception):
+    """Unknown/expired result id or a token that does not match it."""
+
+
+def encode_token(result_id: str, offset: int) -> str:
+    raw = f'{result_id}:{int(offset)}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_token(token: str):
+    """Return (result_id, offset) from a continuation token."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        result_id, offset = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8').rsplit(':', 1)
+        return result_id, int(offset)
+    except Exception:
+        raise ResultSessionError('Invalid continuation token')
+
+
+class ResultFetchError(Exception):
+    """Reading more rows failed; raised on every later request that needs them."""
+
+
+class ResultSession:
+    """One stored-procedure result set: a live cursor plus its on-disk spool."""
+
+    def __init__(self, owner: str, columns: list, conn, cursor, convert: Callable):
+        self.result_id = uuid.uuid4().hex
+        self.owner = owner
+        self.columns = columns
+        self.created_at = time.time()
+        self.last_access = time.monotonic()
+        self.total_rows = None  # known once the cursor is exhausted
+        self.error = None  # exception raised by the cursor while fetching
+        self._conn = conn
+        self._cursor = cursor
+        self._convert = convert
+        self._lock = threading.Lock()
+        self._spooled = 0
+        self._bytes = 0
+        self._checkpoints = [0]
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        self.spool_path = os.path.join(SPOOL_DIR, f'{self.result_id}.jsonl')
+        self._writer = open(self.spool_path, 'wb')
+
+    @property
+    def exhausted(self) -> bool:
+        return self._cursor is None
+
+    @property
+    def holds_connection(self) -> bool:
+        return self._conn is not None
+
+    def _release_cursor(self):
+        cur, self._cursor = self._cursor, None
+        conn, self._conn = self._conn, None
+        if cur is not None:
+            try:
+                cur.close()
+            except Exception:
+                pass
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _spool_until(self, needed: int):
+        while self._cursor is not None and self._spooled < needed:
+            want = max(FETCH_BATCH, needed - self._spooled)
+            try:
+                batch = self._cursor.fetchmany(want)
+            except Exception as e:
+                logger.warning("Result cursor failed after %d rows; closing it", self._spooled, exc_info=True)
+                self.error = e
+                self._release_cursor()
+                break
+            for r in batch:
+                line = (json.dumps([self._convert(x) for x in r], default=str) + '\n').encode('utf-8')
+                self._writer.write(line)
+                self._bytes += len(line)
+                self._spooled += 1
+                if self._spooled % CHECKPOINT_ROWS == 0:
+                    self._checkpoints.append(self._bytes)
+            if len(batch) < want:
+                self.total_rows = self._spooled
+                self._release_cursor()
+        self._writer.flush()
+        if self.error is not None and self._spooled < needed:
+            self._raise_error()
+
+    def _raise_error(self):
+        raise ResultFetchError(f'Fetching the result failed after {self._spooled} rows: {self.error}') from self.error
+
+    def spool_all(self, progress: Optional[Callable] = None):
+        """Drain the cursor into the spool (used by background jobs); `progress(rows)` after each batch."""
+        with self._lock:
+            while self._cursor is not None:
+                self._spool_until(self._spooled + FETCH_BATCH)
+                if progress is not None:
+                    progress(self._spooled)
+            if self.error is not None:
+                self._raise_error()
+        return self.total_rows
+
+    def _read_spool(self, offset: int, limit: int) -> list:
+        end = min(offset + limit, self._spooled)
+        if offset >= end:
+            return []
+        rows = []
+        with open(self.spool_path, 'rb') as f:
+            ck = offset // CHECKPOINT_ROWS
+            f.seek(self._checkpoints[ck])
+            for _ in range(offset - ck * CHECKPOINT_ROWS):
+                f.readline()
+            for _ in range(end - offset):
+                rows.append(json.loads(f.readline()))
+        return rows
+
+    def page(self, offset: int, limit: int) -> dict:
+        offset = max(0, int(offset or 0))
+        limit = max(1, min(int(limit or RESULT_PAGE_SIZE), RESULT_MAX_PAGE_SIZE))
+        with self._lock:
+            self.last_access = time.monotonic()
+            # One extra row tells us whether another page exists
+            self._spool_until(offset + limit + 1)
+            rows = self._read_spool(offset, limit)
+            has_more = self._spooled > offset + len(rows)
+            return {
+                'result_id': self.result_id,
+                'columns': self.columns,
+                'rows': rows,
+                'offset': offset,
+                'limit': limit,
+                'rows_returned': len(rows),
+                'total_rows': self.total_rows,
+                'has_more': has_more,
+                'next_token': encode_token(self.result_id, offset + len(rows)) if has_more else None,
+            }
+
+    def close(self):
+        with self._lock:
+            self._release_cursor()
+            try:
+                self._writer.close()
+            except Exception:
+                pass
+            try:
+                os.unlink(self.spool_path)
+            except OSError:
+                pass
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _sweep():
+    now = time.monotonic()
+    expired = []
+    with _sessions_lock:
+        for rid, s in list(_sessions.items()):
+            if now - s.last_access > RESULT_SESSION_TTL:
+                expired.append(_sessions.pop(rid))
+        if len(_sessions) > MAX_RESULT_SESSIONS:
+            by_age = sorted(_sessions.values(), key=lambda s: s.last_access)
+            for s in by_age[:len(_sessions) - MAX_RESULT_SESSIONS]:
+                expired.append(_sessions.pop(s.result_id))
+    for s in expired:
+        s.close()
+
+
+def open_session(owner: str, columns: list, conn, cursor, convert: Callable,
+                 first_page: int = RESULT_PAGE_SIZE) -> dict:
+    """Take ownership of `conn`/`cursor` and return the first page.
+
+    When the whole result fits in the first page the cursor is released straight
+    away and no session is kept (`result_id` is None).
+    """
+    _sweep()
+    session = ResultSession(owner, columns, conn, cursor, convert)
+    try:
+        page = session.page(0, first_page)
+    except Exception:
+        session.close()
+        raise
+    if not page['has_more']:
+        session.close()
+        page['result_id'] = None
+        return page
+    with _sessions_lock:
+        _sessions[session.result_id] = session
+    _sweep()
+    return page
+
+
+def get_page(result_id: str, owner: str, offset: int = 0, limit: int = RESULT_PAGE_SIZE) -> dict:
+    _sweep()
+    with _sessions_lock:
+        session = _sessions.get(result_id)
+    if session is None or session.owner != owner:
+        raise ResultSessionError('Result set not found or expired')
+    return session.page(offset, limit)
+
+
+def close_session(result_id: str, owner: str) -> bool:
+    with _sessions_lock:
+        session = _sessions.get(result_id)
+        if session is None or session.owner != owner:
+            return False
+        _sessions.pop(result_id, None)
+    session.close()
+    return True
+
+
+def release_connections(limit: int = None):
+    """Drain least recently used sessions to disk until fewer than `limit` hold a connection.
+
+    Called before a report run borrows a connection, so open result sessions can
+    never take every connection in the pool.
+    """
+    limit = MAX_LIVE_RESULT_SESSIONS if limit is None else limit
+    with _sessions_lock:
+        live = sorted((s for s in _sessions.values() if s.holds_connection), key=lambda s: s.last_access)
+    for session in live[:max(0, len(live) - limit + 1)]:
+        logger.info("Spooling result %s to disk to release its connection", session.result_id)
+        try:
+            session.spool_all()
+        except ResultFetchError:
+            pass  # kept on the session and raised to whoever pages it next
+
+
+def close_all():
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for s in sessions:
+        s.close()
@@ -0,0 +1,255 @@
+"""Column type inference for imported files.
+
+`SchemaInference` looks at a file's values chunk by chunk and picks a SQL
+Server type per column: BIT (true/false), INT, BIGINT, DECIMAL(p,s), DATE,
+DATETIME or NVARCHAR(n). Tables created by an import use these types instead
+of all-NVARCHAR(MAX). Values are judged by their text (a typed Excel column is
+formatted first), so CSV and Excel files infer the same way. Integers with
+leading zeros (zip codes, account numbers) stay text.
+
+The first `IMPORT_INFER_SAMPLE_ROWS` rows choose the initial types for the
+CREATE TABLE. Every later chunk is checked too. When a chunk does not fit, the
+type is widened, e.g. INT -> BIGINT -> DECIMAL -> NVARCHAR, DATE -> DATETIME,
+or NVARCHAR(50) -> NVARCHAR(255), and `widened()` reports the columns to ALTER
+before that chunk is inserted. NVARCHAR lengths are rounded up to
+`NVARCHAR_SIZES`.
+
+Callers can pin types with an override map (`{"column": "DECIMAL(18,2)"}`).
+Overridden columns are never widened. `valid_type` is the allow-list for
+override and `/create-table` types.
+"""
+import os
+import re
+import logging
+from decimal import Decimal
+from typing import Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+IMPORT_INFER_SAMPLE_ROWS = int(os.environ.get('IMPORT_INFER_SAMPLE_ROWS', '10000'))
+
+NVARCHAR_SIZES = (50, 100, 255, 500, 1000, 4000)
+
+_INT_RE = r'^[+-]?(?:0|[1-9]\d*)$'
+_DECIMAL_RE = r'^[+-]?(?:0|[1-9]\d*)?\.\d+$|^[+-]?(?:0|[1-9]\d*)\.$'
+_BIT_VALUES = ('true', 'false')
+# Formats tried for date columns, in order; SQL Server's default language reads m/d/Y
+_DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y')
+_DATETIME_FORMATS = ('ISO8601', '%m/%d/%Y %H:%M', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %I:%M:%S %p')
+_INT_MAX = 2 ** 31 - 1
+_BIGINT_MAX = 2 ** 63 - 1
+
+_TYPE_RE = re.compile(
+    r'^(?:TINYINT|SMALLINT|INT|BIGINT|BIT|FLOAT|REAL|DATE|DATETIME|DATETIME2|TEXT|'
+    r'(?:DECIMAL|NUMERIC)\(\s*\d{1,2}\s*,\s*\d{1,2}\s*\)|N?VARCHAR\(\s*(?:\d{1,4}|MAX)\s*\))$', re.IGNORECASE)
+
+
+def valid_type(sql_type: Optional[str]) -> bool:
+    return bool(sql_type) and bool(_TYPE_RE.match(sql_type.strip()))
+
+
+def _nvarchar(length: int) -> str:
+    for size in NVARCHAR_SIZES:
+        if length <= size:
+            return f'NVARCHAR({size})'
+    return 'NVARCHAR(MAX)'
+
+
+def _as_text(series: pd.Series) -> pd.Series:
+    """Non-null values of `series` as stripped strings."""
+    series = series.dropna()
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return series.map({True: 'true', False: 'false'})
+    if pd.api.types.is_float_dtype(series.dtype):
+        # Whole floats (ints read next to blanks) should look like ints
+        text = series.astype(str)
+        whole = (series % 1 == 0) & (series.abs() < 2 ** 63)
+        if whole.any():
+            text[whole] = series[whole].astype('int64').astype(str)
+        return text
+    return series.astype(str).str.strip()
+
+
+class ColumnStats:
+    """What one column's values seen so far allow."""
+
+    def __init__(self, override: Optional[str] = None):
+        self.override = override.upper().strip() if override else None
+        self.seen = 0
+        self.max_len = 0
+        self.candidates = {'bit', 'integer', 'decimal', 'date', 'datetime'}
+        self.max_abs_int = 0
+        self.int_digits = 1
+        self.scale = 0
+        self.date_format = None
+        self.datetime_format = None
+
+    def _parses(self, text: pd.Series, formats: tuple, current: Optional[str]) -> Optional[str]:
+        for fmt in ((current,) if current else formats):
+            parsed = pd.to_datetime(text, format=fmt, errors='coerce')
+            if parsed.notna().all() and (parsed.dt.year >= 1753).all():
+                return fmt
+        return None
+
+    def update(self, series: pd.Series):
+        text = _as_text(series)
+        text = text[text != '']
+        if text.empty:
+            return
+        self.seen += len(text)
+        self.max_len = max(self.max_len, int(text.str.len().max()))
+        if self.override:
+            return
+        c = self.candidates
+        if 'bit' in c and not text.str.lower().isin(_BIT_VALUES).all():
+            c.discard('bit')
+        if 'integer' in c or 'decimal' in c:
+            is_int = text.str.match(_INT_RE)
+            if not is_int.all():
+                c.discard('integer')
+            if 'decimal' in c and not (is_int | text.str.match(_DECIMAL_RE)).all():
+                c.discard('decimal')
+            if c & {'integer', 'decimal'}:
+                unsigned = text.str.lstrip('+-')
+                whole = unsigned.str.split('.', n=1).str[0]
+                frac = unsigned.str.split('.', n=1).str[1].fillna('')
+                self.int_digits = max(self.int_digits, int(whole.str.lstrip('0').str.len().max() or 1))
+                self.scale = max(self.scale, int(frac.str.len().max()))
+                if 'integer' in c:
+                    if self.int_digits > 19:
+                        c.discard('integer')
+                    else:
+                        self.max_abs_int = max(self.max_abs_int, int(pd.to_numeric(whole).max()))
+                if self.int_digits + self.scale > 38:
+                    c.discard('decimal')
+        if 'date' in c:
+            self.date_format = self._parses(text, _DATE_FORMATS, self.date_format)
+            if not self.date_format:
+                c.discard('date')
+        if 'datetime' in c:
+            self.datetime_format = self._parses(text, _DATETIME_FORMATS, self.datetime_format)
+            if not self.datetime_format:
+                c.discard('datetime')
+
+    def sql_type(self) -> str:
+        if self.override:
+            return self.override
+        c = self.candidates
+        if not self.seen:
+            return _nvarchar(self.max_len)
+        if 'bit' in c:
+            return 'BIT'
+        if 'integer' in c:
+            if self.max_abs_int <= _INT_MAX:
+                return 'INT'
+            if self.max_abs_int <= _BIGINT_MAX:
+                return 'BIGINT'
+        if 'decimal' in c or 'integer' in c:
+            return f'DECIMAL({max(18, self.int_digits + self.scale)},{self.scale})'
+        if 'date' in c:
+            return 'DATE'
+        if 'datetime' in c:
+            return 'DATETIME'
+        return _nvarchar(self.max_len)
+
+    def parse_format(self) -> Optional[str]:
+        """The date/datetime format the values were read with, for coercion."""
+        t = self.sql_type()
+        if t == 'DATE':
+            return self.date_format
+        if t == 'DATETIME':
+            return self.datetime_format
+        return None
+
+
+class SchemaInference:
+    """Inferred column types for a file, widened as chunks are seen."""
+
+    def __init__(self, columns: list, overrides: Optional[dict] = None):
+        overrides = overrides or {}
+        self.columns = list(columns)
+        self.stats = {c: ColumnStats(overrides.get(c)) for c in self.columns}
+        self._reported = {}
+
+    def update(self, frame: pd.DataFrame):
+        for c in self.columns:
+            if c in frame.columns:
+                self.stats[c].update(frame[c])
+
+    def sample(self, frames) -> list:
+        """Update from frames until `IMPORT_INFER_SAMPLE_ROWS` rows are seen; return the frames consumed."""
+        taken = []
+        rows = 0
+        for frame in frames:
+            taken.append(frame)
+            self.update(frame)
+            rows += len(frame)
+            if rows >= IMPORT_INFER_SAMPLE_ROWS:
+                break
+        return taken
+
+    def types(self) -> dict:
+        out = {c: self.stats[c].sql_type() for c in self.columns}
+        self._reported = dict(out)
+        return out
+
+    def widened(self) -> dict:
+        """Columns whose type changed since the last `types()`/`widened()` call -> new type."""
+        changed = {}
+        for c in self.columns:
+            t = self.stats[c].sql_type()
+            if self._reported.get(c) != t:
+                changed[c] = t
+                self._reported[c] = t
+        return changed
+
+    def formats(self) -> dict:
+        return {c: self.stats[c].parse_format() for c in self.columns}
+
+
+def create_table_sql(table: str, types: dict, quote=lambda n: '[' + str(n).replace(']', ']]') + ']') -> str:
+    defs = ', '.join(f"{quote(c)} {t} NULL" for c, t in types.items())
+    return f"CREATE TABLE {quote(table)} ({defs})"
+
+
+def infer_types(frame: pd.DataFrame, overrides: Optional[dict] = None) -> dict:
+    """Column -> SQL type for a single (sample) frame."""
+    inference = SchemaInference(list(frame.columns), overrides)
+    inference.update(frame.head(IMPORT_INFER_SAMPLE_ROWS))
+    return inference.types()
+
+
+def coerce_frame(frame: pd.DataFrame, types: dict, formats: dict) -> pd.DataFrame:
+    """Convert text columns to the values their inferred type binds as (ints, Decimals,
+    bools, datetimes), with blank or whitespace-only cells as nulls; columns that are
+    already typed or stay text are left alone."""
+    columns = {}
+    for name in frame.columns:
+        series = frame[name]
+        sql_type = (types.get(name) or '').upper()
+        if series.dtype != object and not pd.api.types.is_string_dtype(series.dtype):
+            if sql_type in ('INT', 'BIGINT') and pd.api.types.is_float_dtype(series.dtype) \
+                    and (series.dropna() % 1 == 0).all():
+                # Excel integers read next to blank cells come back as floats
+                series = series.astype('Int64')
+            columns[name] = series
+            continue
+        text = series.where(series.isna(), series.astype(str).str.strip())
+        # Blank cells are NULL for a typed column (inference ignores them too)
+        text = text.where(text != '')
+        try:
+            if sql_type in ('INT', 'BIGINT'):
+                series = pd.to_numeric(text).astype('Int64')
+            elif sql_type.startswith(('DECIMAL', 'NUMERIC')):
+                series = text.map(Decimal, na_action='ignore')
+            elif sql_type == 'BIT':
+                series = text.str.lower().map({'true': True, 'false': False}).astype('boolean')
+            elif sql_type in ('DATE', 'DATETIME') and formats.get(name):
+                series = pd.to_datetime(text, format=formats[name])
+        except (ValueError, TypeError, ArithmeticError):
+            # Overridden type the text does not parse as: let the server convert it
+            logger.debug(f"Leaving column {name} as text for {sql_type}", exc_info=True)
+        columns[name] = series
+    return pd.DataFrame(columns, index=frame.index)
@@ -0,0 +1,82 @@
+"""Coalesce identical concurrent work onto one in-flight execution.
+
+The first caller for a key becomes the leader and does the work (usually on the
+DB executor); callers arriving while it runs await the leader's published value
+instead of repeating the work. Followers wait on an asyncio future, so they do
+not hold a DB executor slot while waiting.
+
+The leader decides what to share: it calls `Flight.publish(value)` from any
+thread, and `None` means "nothing shareable" (followers then run the work
+themselves). A flight ends when it is published; later callers start a new one.
+"""
+import asyncio
+import threading
+from typing import Any, Dict, Hashable, Tuple
+
+
+class Flight:
+    def __init__(self, group: 'SingleFlight', key: Hashable, loop: asyncio.AbstractEventLoop):
+        self._group = group
+        self._key = key
+        self._loop = loop
+        self._future = loop.create_future()
+        self._published = False
+        # Incremented on the event loop, read by the leader's worker thread
+        self.waiters = 0
+
+    @property
+    def published(self) -> bool:
+        return self._published
+
+    def _set(self, value):
+        if not self._future.done():
+            self._future.set_result(value)
+        self._group._forget(self._key, self)
+
+    def publish(self, value: Any = None):
+        """Hand `value` to every waiting follower. Safe to call from worker threads; only the first call counts."""
+        if self._published:
+            return
+        self._published = True
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._set(value)
+        else:
+            self._loop.call_soon_threadsafe(self._set, value)
+
+    async def wait(self):
+        return await asyncio.shield(self._future)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: Dict[Hashable, Flight] = {}
+        self._lock = threading.Lock()
+        self._stats = {'leaders': 0, 'coalesced': 0}
+
+    def join(self, key: Hashable) -> Tuple[Flight, bool]:
+        """Return (flight, is_leader) for `key`. Must be called on the event loop."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self._stats['coalesced'] += 1
+                return flight, False
+            flight = Flight(self, key, asyncio.get_running_loop())
+            self._flights[key] = flight
+            self._stats['leaders'] += 1
+            return flight, True
+
+    def _forget(self, key: Hashable, flight: Flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out['in_flight'] = len(self._flights)
+        return out
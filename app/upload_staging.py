@@ -0,0 +1,345 @@
+"""Server-side staging of import files.
+
+The import wizard asks for sheet names, column headers, a preview and finally
+the import itself, and used to upload and parse the file for every step.
+`POST /import/stage` now uploads it once. The file goes to
+`IMPORT_STAGING_DIR/<staged_file_id>/` and the id is returned. `/get-sheet-names`,
+`/get-columns`, `/import-preview` and `/import-data` accept `staged_file_id`
+instead of the file.
+
+Each staged file has a `meta.json` next to its data. Parse results (sheet list,
+headers, inferred types, preview rows) are stored there under a key through
+`StagedFile.cached`, so each is computed once per file. The id is only usable
+by the user who staged it. A staged file expires `IMPORT_STAGING_TTL` seconds
+after it was last used and is deleted by the next sweep.
+
+Large files can be uploaded in pieces instead (`/import/uploads`):
+
+- `init_upload` creates an incomplete staged file with the declared size.
+- `write_chunk` appends one chunk at the offset the client sends, streamed from
+  the request body to disk. The offset must equal the bytes already received, so
+  after a dropped connection the client asks for `upload_status` and continues
+  from its `offset`. A chunk sent with its SHA-256 is checked and discarded on a
+  mismatch. Only one chunk of an upload is written at a time; a second one
+  arriving meanwhile (e.g. a client retry) is refused as a conflict.
+- `finalize_upload` checks the size and the SHA-256 of the whole file, read
+  back in `IMPORT_SPOOL_CHUNK_BYTES` blocks, and marks the file complete. It
+  is then a normal staged file, and `/import-data` reads it in place.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+import logging
+from typing import Callable, Optional
+
+from .config import INSTANCE_PATH
+from .import_pipeline import IMPORT_SPOOL_CHUNK_BYTES
+
+logger = logging.getLogger(__name__)
+
+IMPORT_STAGING_DIR = os.environ.get('IMPORT_STAGING_DIR') or os.path.join(INSTANCE_PATH, 'staging')
+IMPORT_STAGING_TTL = float(os.environ.get('IMPORT_STAGING_TTL', '3600'))
+STAGED_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+# Chunk size suggested to chunked-upload clients, and the largest file accepted
+IMPORT_UPLOAD_CHUNK_BYTES = int(os.environ.get('IMPORT_UPLOAD_CHUNK_BYTES', str(8 * 1024 * 1024)))
+IMPORT_UPLOAD_MAX_BYTES = int(os.environ.get('IMPORT_UPLOAD_MAX_BYTES', str(10 * 1024 ** 3)))
+
+# Expired files are looked for at most this often
+SWEEP_INTERVAL = 60
+
+_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+_locks = {}
+_locks_lock = threading.Lock()
+# Uploads with a chunk being written right now
+_writing = set()
+_last_sweep = 0.0
+
+
+class StagingError(Exception):
+    """Unknown, expired or foreign staged file id."""
+
+
+class UploadError(Exception):
+    """A chunk or finalize request that does not match the upload; `offset` is the bytes received so far."""
+
+    def __init__(self, message: str, offset: Optional[int] = None, conflict: bool = False):
+        super().__init__(message)
+        self.offset = offset
+        self.conflict = conflict
+
+
+def _lock_for(staged_file_id: str) -> threading.Lock:
+    with _locks_lock:
+        return _locks.setdefault(staged_file_id, threading.Lock())
+
+
+def _dir_for(staged_file_id: str) -> str:
+    return os.path.join(IMPORT_STAGING_DIR, staged_file_id)
+
+
+def _write_meta(directory: str, meta: dict):
+    tmp = os.path.join(directory, 'meta.json.tmp')
+    with open(tmp, 'w', encoding='utf-8') as out:
+        json.dump(meta, out, default=str)
+    os.replace(tmp, os.path.join(directory, 'meta.json'))
+
+
+class StagedFile:
+    """A staged upload: its data file plus the metadata and parse cache in meta.json."""
+
+    def __init__(self, staged_file_id: str, meta: dict):
+        self.staged_file_id = staged_file_id
+        self.meta = meta
+        self.directory = _dir_for(staged_file_id)
+
+    @property
+    def filename(self) -> str:
+        return self.meta['filename']
+
+    @property
+    def ext(self) -> str:
+        return self.meta['ext']
+
+    @property
+    def size(self) -> int:
+        return self.meta['size']
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, 'data' + self.ext)
+
+    @property
+    def complete(self) -> bool:
+        return self.meta.get('complete', True)
+
+    @property
+    def received(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def save(self):
+        _write_meta(self.directory, self.meta)
+
+    def cached(self, key: str, compute: Callable):
+        """Return the cached value for `key`, computing and storing it on first use."""
+        with _lock_for(self.staged_file_id):
+            cache = self.meta.setdefault('cache', {})
+            if key not in cache:
+                cache[key] = compute()
+                _write_meta(self.directory, self.meta)
+            return cache[key]
+
+    def info(self) -> dict:
+        return {
+            'staged_file_id': self.staged_file_id,
+            'filename': self.filename,
+            'size': self.size,
+            'expires_in': IMPORT_STAGING_TTL,
+        }
+
+
+def _check_filename(filename: str) -> tuple:
+    filename = os.path.basename(filename or '')
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in STAGED_EXTENSIONS:
+        raise ValueError(f"Unsupported file type: {ext or filename}. Please upload CSV or Excel.")
+    return filename, ext
+
+
+def _new_staged(owner: str, filename: str, ext: str, **meta) -> StagedFile:
+    staged_file_id = uuid.uuid4().hex
+    os.makedirs(_dir_for(staged_file_id))
+    return StagedFile(staged_file_id, dict(
+        {'owner': owner, 'filename': filename, 'ext': ext, 'size': 0, 'created_at': time.time(), 'cache': {}}, **meta))
+
+
+def _sweep(force: bool = False):
+    global _last_sweep
+    now = time.time()
+    if not force and now - _last_sweep < SWEEP_INTERVAL:
+        return
+    _last_sweep = now
+    try:
+        names = os.listdir(IMPORT_STAGING_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        directory = os.path.join(IMPORT_STAGING_DIR, name)
+        try:
+            last_used = os.path.getmtime(os.path.join(directory, 'meta.json'))
+        except OSError:
+            last_used = os.path.getmtime(directory)
+        if now - last_used > IMPORT_STAGING_TTL:
+            logger.info(f"Removing expired staged file {name}")
+            shutil.rmtree(directory, ignore_errors=True)
+            with _locks_lock:
+                _locks.pop(name, None)
+
+
+async def stage_upload(upload, owner: str) -> StagedFile:
+    """Copy an UploadFile into a new staging directory piece by piece."""
+    _sweep()
+    filename, ext = _check_filename(upload.filename)
+    staged = _new_staged(owner, filename, ext)
+    directory, meta = staged.directory, staged.meta
+    try:
+        with open(staged.path, 'wb') as out:
+            while True:
+                block = await upload.read(IMPORT_SPOOL_CHUNK_BYTES)
+                if not block:
+                    break
+                out.write(block)
+                meta['size'] += len(block)
+        _write_meta(directory, meta)
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    logger.info(f"Staged {filename} ({meta['size']} bytes) as {staged.staged_file_id}")
+    return staged
+
+
+def _load(staged_file_id: Optional[str], owner: str) -> StagedFile:
+    _sweep()
+    if not staged_file_id or not _ID_RE.match(staged_file_id):
+        raise StagingError('Staged file not found or expired')
+    directory = _dir_for(staged_file_id)
+    meta_path = os.path.join(directory, 'meta.json')
+    try:
+        with _lock_for(staged_file_id):
+            if time.time() - os.path.getmtime(meta_path) > IMPORT_STAGING_TTL:
+                raise FileNotFoundError(meta_path)
+            with open(meta_path, encoding='utf-8') as fh:
+                meta = json.load(fh)
+            os.utime(meta_path)
+    except (OSError, ValueError):
+        raise StagingError('Staged file not found or expired')
+    if meta.get('owner') != owner:
+        raise StagingError('Staged file not found or expired')
+    return StagedFile(staged_file_id, meta)
+
+
+def get(staged_file_id: Optional[str], owner: str) -> StagedFile:
+    """Load a complete staged file of `owner` and extend its lifetime."""
+    staged = _load(staged_file_id, owner)
+    if not staged.complete:
+        raise StagingError('Upload of this file has not been finalized')
+    return staged
+
+
+def init_upload(filename: str, size: int, owner: str, sha256: Optional[str] = None) -> StagedFile:
+    """Start a chunked upload of `size` bytes; the returned file is incomplete until `finalize_upload`."""
+    _sweep()
+    filename, ext = _check_filename(filename)
+    if size < 0 or size > IMPORT_UPLOAD_MAX_BYTES:
+        raise ValueError(f"File size must be between 0 and {IMPORT_UPLOAD_MAX_BYTES} bytes")
+    staged = _new_staged(owner, filename, ext, size=size, complete=False, sha256=(sha256 or '').lower() or None)
+    open(staged.path, 'wb').close()
+    staged.save()
+    logger.info(f"Started chunked upload {staged.staged_file_id} of {filename} ({size} bytes)")
+    return staged
+
+
+def _uploading(staged_file_id: str, owner: str) -> StagedFile:
+    staged = _load(staged_file_id, owner)
+    if staged.complete:
+        raise UploadError('Upload is already finalized', staged.received, conflict=True)
+    return staged
+
+
+def upload_status(staged_file_id: str, owner: str) -> dict:
+    """Where to resume: bytes received so far (`offset`) out of `size`."""
+    staged = _load(staged_file_id, owner)
+    return {'staged_file_id': staged.staged_file_id, 'filename': staged.filename, 'size': staged.size,
+            'offset': staged.received if not staged.complete else staged.size, 'complete': staged.complete,
+            'chunk_size': IMPORT_UPLOAD_CHUNK_BYTES}
+
+
+async def write_chunk(staged_file_id: str, owner: str, offset: int, blocks, sha256: Optional[str] = None) -> int:
+    """Append the byte blocks of one chunk (an async iterable) at `offset`; return the new offset.
+
+    A partly written chunk (dropped connection) is kept; the client resumes from
+    `upload_status`. A chunk that fails its `sha256` or overruns the declared size
+    is cut off again.
+    """
+    staged = _uploading(staged_file_id, owner)
+    with _locks_lock:
+        if staged_file_id in _writing:
+            raise UploadError('Another chunk of this upload is being written', staged.received, conflict=True)
+        _writing.add(staged_file_id)
+    try:
+        return await _write_chunk(staged, offset, blocks, sha256)
+    finally:
+        with _locks_lock:
+            _writing.discard(staged_file_id)
+
+
+async def _write_chunk(staged: StagedFile, offset: int, blocks, sha256: Optional[str]) -> int:
+    received = staged.received
+    if offset != received:
+        raise UploadError(f"Expected offset {received}, got {offset}", received, conflict=True)
+    digest = hashlib.sha256()
+    written = 0
+    with open(staged.path, 'r+b') as out:
+        out.seek(offset)
+        try:
+            async for block in blocks:
+                if offset + written + len(block) > staged.size:
+                    raise UploadError(f"Chunk runs past the declared size of {staged.size} bytes")
+                out.write(block)
+                digest.update(block)
+                written += len(block)
+            if sha256 and digest.hexdigest() != sha256.lower():
+                raise UploadError('Chunk SHA-256 does not match; send it again')
+        except UploadError as e:
+            out.truncate(offset)
+            e.offset = offset
+            raise
+    os.utime(os.path.join(staged.directory, 'meta.json'))
+    return offset + written
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(IMPORT_SPOOL_CHUNK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def finalize_upload(staged_file_id: str, owner: str, sha256: Optional[str] = None) -> StagedFile:
+    """Verify size and SHA-256 (given here or at init) and mark the upload complete."""
+    staged = _uploading(staged_file_id, owner)
+    with _locks_lock:
+        if staged_file_id in _writing:
+            raise UploadError('A chunk of this upload is still being written', staged.received, conflict=True)
+    received = staged.received
+    if received != staged.size:
+        raise UploadError(f"Received {received} of {staged.size} bytes", received, conflict=True)
+    expected = (sha256 or staged.meta.get('sha256') or '').lower()
+    actual = _file_sha256(staged.path)
+    if expected and actual != expected:
+        # Some chunk was corrupted without being detected; the upload has to start over
+        discard(staged_file_id, owner)
+        raise UploadError('File SHA-256 does not match; upload it again')
+    staged.meta.update(complete=True, sha256=actual)
+    staged.save()
+    logger.info(f"Finalized chunked upload {staged_file_id} ({received} bytes, sha256 {actual})")
+    return staged
+
+
+def discard(staged_file_id: str, owner: str) -> bool:
+    try:
+        staged = _load(staged_file_id, owner)
+    except StagingError:
+        return False
+    shutil.rmtree(staged.directory, ignore_errors=True)
+    with _locks_lock:
+        _locks.pop(staged_file_id, None)
+    return True
@@ -20,7 +20,7 @@ async function loadReportDefinitions() {
   if (!listEl) return;
   listEl.innerHTML = '<div style="font-size:12px; color:#666;">Loading...</div>';
   try {
-    const r = await fetch('/report/definitions', { headers: { 'Authorization': 'Bearer ' + token } });
+    const r = await (window.revalidatingFetch || fetch)('/report/definitions', { headers: { 'Authorization': 'Bearer ' + token } });
     const data = await r.json();
     if (!r.ok) throw new Error(data.detail || 'Failed to load');
     listEl.innerHTML = '';
@@ -283,7 +283,7 @@ async function loadCurrentUser(){
     // Prefetch report definitions for quick availability check right after login.
     // Store a small flag and optional cached list in sessionStorage so other UI flows can consult it.
     try {
-      const defsRes = await fetch('/report/definitions', { headers: { 'Authorization': 'Bearer ' + token } });
+      const defsRes = await (window.revalidatingFetch || fetch)('/report/definitions', { headers: { 'Authorization': 'Bearer ' + token } });
       if (defsRes.ok) {
         const defsPayload = await defsRes.json();
         const items = Array.isArray(defsPayload.items) ? defsPayload.items.filter(it => it && it.active) : [];
@@ -322,7 +322,7 @@ if (goReportBtn) {
 
     // Check whether the current user has any allowed report definitions.
     try {
-      const res = await fetch('/report/definitions', { headers: { 'Authorization': 'Bearer ' + token } });
+      const res = await (window.revalidatingFetch || fetch)('/report/definitions', { headers: { 'Authorization': 'Bearer ' + token } });
       if (!res.ok) {
         // If the user can't be authenticated against the API for some reason, redirect to login
         if (res.status === 401 || res.status === 403) {
@@ -400,7 +400,7 @@ async function loadAdminSettings(){
 async function loadUsers(){
   const token = sessionStorage.getItem('token');
   try{
-    const r = await fetch('/users', { headers: token ? { 'Authorization': 'Bearer ' + token } : {} });
+    const r = await (window.revalidatingFetch || fetch)('/users', { headers: token ? { 'Authorization': 'Bearer ' + token } : {} });
     if (!r.ok) {
       console.warn('Failed to load users for datalist:', await r.text());
       return;
@@ -1305,7 +1305,7 @@ if (createUserBtn) {
 async function loadUsers() {
   try {
     const token = sessionStorage.getItem('token');
-    const res = await fetch('/users', {
+    const res = await (window.revalidatingFetch || fetch)('/users', {
       headers: token ? {'Authorization': 'Bearer ' + token} : {}
     });
     const listEl = document.getElementById('usersList');
@@ -1675,7 +1675,7 @@ async function updateDbBanner() {
         const role = sessionStorage.getItem('role');
         if (role === 'admin') {
           try {
-            const usersRes = await fetch('/users', { headers: token ? { 'Authorization': 'Bearer ' + token } : {} });
+            const usersRes = await (window.revalidatingFetch || fetch)('/users', { headers: token ? { 'Authorization': 'Bearer ' + token } : {} });
             if (usersRes.ok) {
               const users = await usersRes.json();
               userCount = users.length;
@@ -2104,7 +2104,7 @@ if (testConnectionBtn) testConnectionBtn.onclick = async () => {
 async function loadTables() {
   try {
     const token = sessionStorage.getItem('token');
-    const res = await fetch('/tables', {
+    const res = await (window.revalidatingFetch || fetch)('/tables', {
       headers: token ? {'Authorization': 'Bearer ' + token} : {}
     });
     
@@ -2338,6 +2338,7 @@ function renderParamRows(params) {
     row.style.alignItems = 'center';
     row.dataset.paramMode = mode || '';
     row.dataset.paramType = dtype || '';
+    row.dataset.paramSizes = JSON.stringify(paramSizes(p));
     const nameInput = document.createElement('input');
     nameInput.placeholder = 'Parameter name';
     nameInput.value = name;
@@ -2369,6 +2370,19 @@ function renderParamRows(params) {
   });
 }
 
+// Declared length/precision/scale, so typed report plans bind decimals with the right scale
+const PARAM_SIZE_KEYS = ['max_length', 'precision', 'scale'];
+
+function paramSizes(p) {
+  const sizes = {};
+  if (p && typeof p === 'object') {
+    PARAM_SIZE_KEYS.forEach((key) => {
+      if (p[key] !== undefined && p[key] !== null && p[key] !== '') sizes[key] = p[key];
+    });
+  }
+  return sizes;
+}
+
 function collectParamRows() {
   const rows = [];
   if (!paramsEditorList) return rows;
@@ -2385,6 +2399,7 @@ function collectParamRows() {
     if (values_query) payload.values_query = values_query;
     if (mode) payload.mode = mode;
     if (dtype) payload.type = dtype;
+    try { Object.assign(payload, JSON.parse((child.dataset && child.dataset.paramSizes) || '{}')); } catch (e) { /* ignore */ }
     if (Object.keys(payload).length === 1) rows.push(name);
     else rows.push(payload);
   }
@@ -2424,7 +2439,11 @@ function mergeProcedureParameters(fetched, existing) {
     if (existingItem) {
       const mergedItem = { ...existingItem, name: existingItem.name || rawName };
       if (meta.mode) mergedItem.mode = meta.mode;
-      if (meta.type) mergedItem.type = meta.type;
+      if (meta.type) {
+        mergedItem.type = meta.type;
+        PARAM_SIZE_KEYS.forEach((key) => { delete mergedItem[key]; });
+        Object.assign(mergedItem, paramSizes(meta));
+      }
       if (mergedItem.values_query) {
         merged.push(mergedItem);
       } else if (Object.keys(mergedItem).length === 1) {
@@ -2436,6 +2455,7 @@ function mergeProcedureParameters(fetched, existing) {
       const newItem = { name: rawName };
       if (meta.mode) newItem.mode = meta.mode;
       if (meta.type) newItem.type = meta.type;
+      Object.assign(newItem, paramSizes(meta));
       if (Object.keys(newItem).length === 1) merged.push(rawName);
       else merged.push(newItem);
     }
@@ -2508,7 +2528,7 @@ if (loadProcParamsBtn) {
       const r = await fetch('/report/proc-parameters?name=' + encodeURIComponent(currentStoredProcName), { headers: token ? { 'Authorization': 'Bearer ' + token } : {} });
       const data = await r.json();
       if (!r.ok) throw new Error(data.detail || 'Failed to load parameters');
-      const fetched = (data.parameters || []).map((p) => ({ name: p.name, mode: p.mode, type: p.type }));
+      const fetched = (data.parameters || []).map((p) => ({ name: p.name, mode: p.mode, type: p.type, ...paramSizes(p) }));
       if (!fetched.length) {
         if (msgEl) { msgEl.textContent = 'No parameters were exposed for ' + currentStoredProcName + '.'; msgEl.style.color = '#b91c1c'; }
         return;
@@ -2618,6 +2638,100 @@ if (paramEditorModal) {
   });
 }
 
+// ===== Stored procedure picker (prefix search served from the procedure catalog cache) =====
+async function searchStoredProcedures(prefix, limit) {
+  const token = sessionStorage.getItem('token');
+  const query = new URLSearchParams({ q: prefix || '', limit: String(limit), parameters: 'false' });
+  const r = await fetch('/report/stored-procedures?' + query.toString(), { headers: { 'Authorization': 'Bearer ' + token } });
+  const data = await r.json();
+  if (!r.ok) throw new Error(data.detail || 'Failed to search stored procedures');
+  return (data.procedures || []).map((p) => p.name);
+}
+
+function chooseStoredProcedure(name) {
+  if (storedProcInput) {
+    storedProcInput.value = name;
+    storedProcInput.dispatchEvent(new Event('input', { bubbles: true }));
+  }
+  if (storedProcSearchModal) storedProcSearchModal.style.display = 'none';
+}
+
+if (storedProcInput && storedProcOptions) {
+  storedProcInput.addEventListener('input', () => {
+    clearTimeout(storedProcLookupTimer);
+    storedProcLookupTimer = setTimeout(async () => {
+      const mine = ++storedProcLookupSeq;
+      try {
+        const names = await searchStoredProcedures(storedProcInput.value.trim(), 50);
+        if (mine !== storedProcLookupSeq) return;
+        storedProcOptions.innerHTML = '';
+        names.forEach((name) => {
+          const opt = document.createElement('option');
+          opt.value = name;
+          storedProcOptions.appendChild(opt);
+        });
+      } catch (e) {
+        // suggestions are optional (the endpoint is admin-only)
+      }
+    }, 200);
+  });
+}
+
+async function renderStoredProcSearchResults() {
+  if (!storedProcSearchResults) return;
+  const mine = ++storedProcModalSeq;
+  const term = storedProcSearchInput ? storedProcSearchInput.value.trim() : '';
+  try {
+    const names = await searchStoredProcedures(term, 200);
+    if (mine !== storedProcModalSeq) return;
+    storedProcSearchResults.innerHTML = '';
+    if (!names.length) {
+      storedProcSearchResults.innerHTML = '<div style="font-size: 13px; color: #64748b;">No stored procedures match.</div>';
+      return;
+    }
+    names.forEach((name) => {
+      const btn = document.createElement('button');
+      btn.type = 'button';
+      btn.textContent = name;
+      btn.style.cssText = 'text-align:left; padding:10px 14px; border:1px solid #e2e8f0; border-radius:10px; background:#f8fafc; cursor:pointer; font-size:14px;';
+      btn.onclick = () => chooseStoredProcedure(name);
+      storedProcSearchResults.appendChild(btn);
+    });
+  } catch (e) {
+    if (mine !== storedProcModalSeq) return;
+    storedProcSearchResults.innerHTML = '';
+    const msg = document.createElement('div');
+    msg.style.cssText = 'font-size: 13px; color: #b91c1c;';
+    msg.textContent = e.message;
+    storedProcSearchResults.appendChild(msg);
+  }
+}
+
+if (openStoredProcSearchBtn && storedProcSearchModal) {
+  openStoredProcSearchBtn.onclick = () => {
+    storedProcSearchModal.style.display = 'block';
+    if (storedProcSearchInput) {
+      storedProcSearchInput.value = storedProcInput ? storedProcInput.value.trim() : '';
+      storedProcSearchInput.focus();
+    }
+    renderStoredProcSearchResults();
+  };
+}
+
+if (storedProcSearchInput) {
+  storedProcSearchInput.addEventListener('input', () => {
+    clearTimeout(storedProcModalTimer);
+    storedProcModalTimer = setTimeout(renderStoredProcSearchResults, 200);
+  });
+}
+
+if (closeStoredProcSearchBtn && storedProcSearchModal) {
+  closeStoredProcSearchBtn.onclick = () => { storedProcSearchModal.style.display = 'none'; };
+  window.addEventListener('click', (event) => {
+    if (event.target === storedProcSearchModal) storedProcSearchModal.style.display = 'none';
+  });
+}
+
 if (closeImportBtn && importModal) {
   closeImportBtn.onclick = () => {
     importModal.style.display = 'none';
@@ -3072,7 +3186,7 @@ async function loadPowerBIReportsList() {
   
   try {
     const token = sessionStorage.getItem('token');
-    const res = await fetch('/powerbi/reports', {
+    const res = await (window.revalidatingFetch || fetch)('/powerbi/reports', {
       headers: token ? {'Authorization': 'Bearer ' + token} : {}
     });
     
@@ -0,0 +1,42 @@
+// Conditional GETs for read-mostly API listings.
+// Responses that carry an ETag are remembered per URL in sessionStorage; later GETs
+// send it back as If-None-Match and a 304 is answered from the stored body.
+(function(){
+  const PREFIX = 'etag-cache:';
+
+  function readEntry(url){
+    try {
+      return JSON.parse(sessionStorage.getItem(PREFIX + url) || 'null');
+    } catch (_e) {
+      return null;
+    }
+  }
+
+  function writeEntry(url, etag, body){
+    try {
+      sessionStorage.setItem(PREFIX + url, JSON.stringify({ etag: etag, body: body }));
+    } catch (_e) {}
+  }
+
+  async function revalidatingFetch(url, options){
+    const opts = options ? Object.assign({}, options) : {};
+    const method = (opts.method || 'GET').toUpperCase();
+    if (method !== 'GET') return fetch(url, opts);
+    const cached = readEntry(url);
+    const headers = new Headers(opts.headers || {});
+    if (cached && cached.etag) headers.set('If-None-Match', cached.etag);
+    opts.headers = headers;
+    const res = await fetch(url, opts);
+    if (res.status === 304 && cached) {
+      return new Response(cached.body, { status: 200, statusText: 'OK', headers: { 'Content-Type': 'application/json', 'ETag': cached.etag } });
+    }
+    const etag = res.headers.get('ETag');
+    if (res.ok && etag) {
+      const body = await res.clone().text();
+      writeEntry(url, etag, body);
+    }
+    return res;
+  }
+
+  window.revalidatingFetch = revalidatingFetch;
+})();
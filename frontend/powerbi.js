@@ -23,7 +23,7 @@
   async function loadReports(){
     try {
       msgEl.innerHTML = '<div class="spinner"></div>';
-      const res = await fetch('/powerbi/reports', {
+      const res = await (window.revalidatingFetch || fetch)('/powerbi/reports', {
         headers: { 'Authorization': 'Bearer ' + token }
       });
       
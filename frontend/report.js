@@ -16,7 +16,7 @@
     const opts = options ? Object.assign({}, options) : {};
     const headers = Object.assign({}, opts.headers || {}, getAuthHeaders());
     opts.headers = headers;
-    const res = await fetch(url, opts);
+    const res = await (window.revalidatingFetch || fetch)(url, opts);
     if (res.status === 401) {
       try {
         sessionStorage.removeItem('token');
@@ -71,6 +71,7 @@
   const popupCards = Array.from(document.querySelectorAll('[data-popup-card]'));
 
   let lastResultData = null;
+  let lastRunRequest = null;
   let currentResultView = 'table';
   let currentDefinitionName = '';
   let currentStoredProcedure = '';
@@ -398,26 +399,133 @@
     }
   }
 
-  async function populateParameterValues(defId, paramName, container){
+  function parameterValuesUrl(defId, paramName, query){
+    let url = '/report/parameter-values/' + encodeURIComponent(defId) + '/' + encodeURIComponent(paramName);
+    if (query) url += '?' + new URLSearchParams(query).toString();
+    return url;
+  }
+
+  // Put a fresh text input back in place of a previous select/suggestion list
+  function resetParameterInput(paramName, container){
+    const input = document.createElement('input');
+    input.id = 'param_' + paramName;
+    input.placeholder = paramName;
+    const existing = container.querySelector('#param_' + paramName);
+    if (existing) container.replaceChild(input, existing);
+    const oldList = container.querySelector('#param_values_' + paramName);
+    if (oldList) oldList.remove();
+    return input;
+  }
+
+  // Lists longer than one page stay a free-text input whose suggestions are searched server-side
+  function attachValueSearch(defId, paramName, container, firstValues, baseQuery){
+    const input = container.querySelector('#param_' + paramName);
+    if (!input) return;
+    const list = document.createElement('datalist');
+    list.id = 'param_values_' + paramName;
+    const fill = values => {
+      list.innerHTML = '';
+      values.forEach(v => {
+        const opt = document.createElement('option');
+        opt.value = v;
+        list.appendChild(opt);
+      });
+    };
+    fill(firstValues);
+    input.setAttribute('list', list.id);
+    input.placeholder = paramName + ' (type to search)';
+    container.appendChild(list);
+    let timer = null;
+    let seq = 0;
+    input.addEventListener('input', () => {
+      clearTimeout(timer);
+      timer = setTimeout(async () => {
+        const mine = ++seq;
+        try {
+          const query = Object.assign({}, baseQuery || {}, { q: input.value.trim(), limit: 100 });
+          const res = await authFetch(parameterValuesUrl(defId, paramName, query));
+          if (!res.ok || mine !== seq) return;
+          const payload = await res.json();
+          if (mine === seq && Array.isArray(payload.values)) fill(payload.values);
+        } catch (_err) {
+          // keep the previous suggestions
+        }
+      }, 250);
+    });
+  }
+
+  function applyParameterValues(defId, paramName, container, payload, baseQuery){
+    resetParameterInput(paramName, container);
+    if (!payload || !Array.isArray(payload.values) || payload.values.length === 0) return;
+    if (payload.has_more) {
+      attachValueSearch(defId, paramName, container, payload.values, baseQuery);
+      return;
+    }
+    const select = document.createElement('select');
+    select.id = 'param_' + paramName;
+    const emptyOpt = document.createElement('option');
+    emptyOpt.value = '';
+    emptyOpt.textContent = '(choose)';
+    select.appendChild(emptyOpt);
+    payload.values.forEach(v => {
+      const opt = document.createElement('option');
+      opt.value = v;
+      opt.textContent = v;
+      select.appendChild(opt);
+    });
+    const existing = container.querySelector('#param_' + paramName);
+    if (existing) container.replaceChild(select, existing);
+  }
+
+  // Values of the parameters a cascading list is bound to, or null while any is blank
+  function dependencyQuery(dependsOn){
+    const query = {};
+    for (const dep of dependsOn) {
+      const el = document.getElementById('param_' + dep);
+      const value = el ? el.value.trim() : '';
+      if (!value) return null;
+      query[dep] = value;
+    }
+    return query;
+  }
+
+  async function refreshDependentValues(defId, paramName, container, dependsOn){
+    const mine = (container._valuesSeq = (container._valuesSeq || 0) + 1);
+    const query = dependencyQuery(dependsOn);
+    let payload = null;
+    if (query) {
+      try {
+        const res = await authFetch(parameterValuesUrl(defId, paramName, query));
+        if (res.ok) payload = await res.json();
+      } catch (_err) {
+        payload = null;
+      }
+    }
+    if (mine !== container._valuesSeq) return;
+    applyParameterValues(defId, paramName, container, payload, query);
+    // Let parameters that cascade from this one refresh as well
+    const el = container.querySelector('#param_' + paramName);
+    if (el) el.dispatchEvent(new Event('change', { bubbles: true }));
+  }
+
+  // One request resolves every dropdown of the definition
+  async function populateParameterValues(defId, containers){
     try {
-      const res = await authFetch('/report/parameter-values/' + encodeURIComponent(defId) + '/' + encodeURIComponent(paramName));
+      const res = await authFetch('/report/parameter-values/' + encodeURIComponent(defId));
       if (!res.ok) return;
       const payload = await res.json();
-      if (!payload.values || !Array.isArray(payload.values) || payload.values.length === 0) return;
-      const select = document.createElement('select');
-      select.id = 'param_' + paramName;
-      const emptyOpt = document.createElement('option');
-      emptyOpt.value = '';
-      emptyOpt.textContent = '(choose)';
-      select.appendChild(emptyOpt);
-      payload.values.forEach(v => {
-        const opt = document.createElement('option');
-        opt.value = v;
-        opt.textContent = v;
-        select.appendChild(opt);
+      const lists = payload.parameters || {};
+      Object.keys(lists).forEach(name => {
+        const container = containers[name];
+        if (!container) return;
+        const dependsOn = lists[name].depends_on || [];
+        dependsOn.forEach(dep => {
+          if (containers[dep]) {
+            containers[dep].addEventListener('change', () => refreshDependentValues(defId, name, container, dependsOn));
+          }
+        });
+        if (lists[name].cache !== 'skipped') applyParameterValues(defId, name, container, lists[name]);
       });
-      const existing = container.querySelector('#param_' + paramName);
-      if (existing) container.replaceChild(select, existing);
     } catch (err) {
       // ignore lookup failures
     }
@@ -448,6 +556,7 @@
       if (params.length) {
         const grid = document.createElement('div');
         grid.className = 'row';
+        const containers = {};
         params.forEach(paramObj => {
           const wrap = document.createElement('div');
           wrap.className = 'param-item';
@@ -462,9 +571,10 @@
           wrap.appendChild(label);
           wrap.appendChild(input);
           grid.appendChild(wrap);
-          populateParameterValues(selectedId, paramObj.name, wrap);
+          containers[paramObj.name] = wrap;
         });
         defParamsContainer.appendChild(grid);
+        populateParameterValues(selectedId, containers);
       } else {
         const msg = document.createElement('div');
         msg.textContent = 'This definition does not declare parameters.';
@@ -518,19 +628,12 @@
       thead.appendChild(headRow);
       table.appendChild(thead);
       const tbody = document.createElement('tbody');
-      rows.forEach(row => {
-        const tr = document.createElement('tr');
-        row.forEach(cell => {
-          const td = document.createElement('td');
-          td.textContent = cell === null || cell === undefined ? '' : String(cell);
-          tr.appendChild(td);
-        });
-        tbody.appendChild(tr);
-      });
+      appendResultRows(tbody, rows);
       table.appendChild(tbody);
       resultTableContainer.appendChild(table);
+      if (data.has_more && data.result_id) renderLoadMore(tbody);
       showResultView('table');
-      setResultStatus('Rows returned: ' + rows.length);
+      setResultStatus(describeRowCount());
       updateResultSummary('Table view ready. Switch to JSON for raw output.');
     } else {
       showResultView('json');
@@ -540,6 +643,65 @@
     }
   }
 
+  function appendResultRows(tbody, rows){
+    rows.forEach(row => {
+      const tr = document.createElement('tr');
+      row.forEach(cell => {
+        const td = document.createElement('td');
+        td.textContent = cell === null || cell === undefined ? '' : String(cell);
+        tr.appendChild(td);
+      });
+      tbody.appendChild(tr);
+    });
+  }
+
+  function describeRowCount(){
+    const shown = lastResultData && Array.isArray(lastResultData.rows) ? lastResultData.rows.length : 0;
+    const total = lastResultData ? lastResultData.total_rows : null;
+    if (total !== null && total !== undefined && total !== shown) return 'Rows shown: ' + shown + ' of ' + total;
+    if (lastResultData && lastResultData.has_more) return 'Rows shown: ' + shown + ' (more available)';
+    return 'Rows returned: ' + shown;
+  }
+
+  // The server keeps the rest of a large result set; fetch it a page at a time
+  function renderLoadMore(tbody){
+    const btn = document.createElement('button');
+    btn.type = 'button';
+    btn.className = 'btn btn-secondary';
+    btn.textContent = 'Load more rows';
+    btn.addEventListener('click', async () => {
+      if (!lastResultData || !lastResultData.result_id) return;
+      btn.disabled = true;
+      btn.textContent = '⏳ Loading...';
+      try {
+        const url = '/report/results/' + encodeURIComponent(lastResultData.result_id) + '?token=' + encodeURIComponent(lastResultData.next_token || '');
+        const res = await authFetch(url);
+        const parsed = await parseJsonSafe(res);
+        const page = parsed.data;
+        if (!res.ok || !page || !Array.isArray(page.rows)) {
+          throw new Error((page && page.detail) || res.statusText || 'Failed to load rows');
+        }
+        appendResultRows(tbody, page.rows);
+        lastResultData.rows = lastResultData.rows.concat(page.rows);
+        lastResultData.has_more = page.has_more;
+        lastResultData.next_token = page.next_token;
+        lastResultData.total_rows = page.total_rows;
+        setResultStatus(describeRowCount());
+        if (page.has_more) {
+          btn.disabled = false;
+          btn.textContent = 'Load more rows';
+        } else {
+          btn.remove();
+        }
+      } catch (err) {
+        btn.disabled = false;
+        btn.textContent = 'Load more rows';
+        pushJournalEntry('Loading more rows failed: ' + err.message, 'error');
+      }
+    });
+    resultTableContainer.appendChild(btn);
+  }
+
   function tableToArray(){
     if (lastResultData && Array.isArray(lastResultData.columns) && Array.isArray(lastResultData.rows)) {
       return { columns: lastResultData.columns, rows: lastResultData.rows };
@@ -611,10 +773,34 @@
     }
   }
 
+  // The browser only holds the pages it has loaded; let the server stream the full result instead
+  function needsServerExport(){
+    return !!(lastRunRequest && lastResultData && lastResultData.has_more);
+  }
+
+  async function exportFromServer(format, ext){
+    const form = new FormData();
+    lastRunRequest.params.forEach(([k, v]) => form.append(k, v));
+    pushJournalEntry('Exporting full result as ' + format.toUpperCase() + '...', 'info');
+    try {
+      const res = await authFetch('/report/run/' + encodeURIComponent(lastRunRequest.definitionId) + '/export?format=' + format, { method: 'POST', body: form });
+      if (!res.ok) {
+        const parsed = await parseJsonSafe(res);
+        throw new Error((parsed.data && parsed.data.detail) || res.statusText || 'Export failed');
+      }
+      const blob = await res.blob();
+      downloadBlob(blob, makeExportFilename(ext), blob.type);
+      pushJournalEntry('Export downloaded.', 'success');
+    } catch (err) {
+      pushJournalEntry('Export failed: ' + err.message, 'error');
+    }
+  }
+
   function exportCurrent(format){
     const type = (format || '').toLowerCase();
     if (type === 'csv') {
-      exportCurrentAsCsv();
+      if (needsServerExport()) exportFromServer('csv', 'csv');
+      else exportCurrentAsCsv();
       return true;
     }
     if (type === 'xlsx' || type === 'excel') {
@@ -622,7 +808,8 @@
       return true;
     }
     if (type === 'txt' || type === 'text') {
-      exportCurrentAsTxt();
+      if (needsServerExport()) exportFromServer('tsv', 'txt');
+      else exportCurrentAsTxt();
       return true;
     }
     return false;
@@ -654,6 +841,7 @@
         const input = document.getElementById('param_' + name);
         if (input && input.value.trim()) form.append('param_' + name, input.value.trim());
       });
+      lastRunRequest = { definitionId: selectedId, params: Array.from(form.entries()).filter(([k]) => k !== 'definition_id') };
       const res = await authFetch('/report/run', { method: 'POST', body: form });
       const parsed = await parseJsonSafe(res);
       let data = parsed.data && typeof parsed.data === 'object' ? parsed.data : null;
@@ -664,7 +852,8 @@
       renderResult(data);
       const success = res.ok && (typeof data.ok !== 'boolean' || data.ok);
       if (!success) {
-        const errText = summarizeText(data.error || data.raw || data.httpStatusText || 'Execution failed');
+        const invalid = data.detail && Array.isArray(data.detail.errors) ? data.detail.errors.join('; ') : null;
+        const errText = summarizeText(invalid || data.error || data.raw || data.httpStatusText || 'Execution failed');
         if (extra) extra.textContent = 'Failed: ' + errText;
         updateResultSummary('Execution failed.');
         noteLastRun('Execution failed.', 'error');
@@ -0,0 +1,97 @@
+"""Micro-benchmark: per-column astype(str) cleaning vs import_pipeline.normalize_frame.
+
+Builds a mixed frame (default 1,000,000 rows x 50 columns: floats with nulls,
+ints, strings with nulls, datetimes) and times both ways of preparing it for
+the loader. Peak memory comes from a second, tracemalloc-instrumented pass
+(numpy/pandas buffers included). The full-size run needs several GB of RAM.
+
+    python scripts/bench_import_normalize.py [--rows N] [--cols N] [--no-memory]
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.import_pipeline import normalize_frame  # noqa: E402
+
+
+def build_frame(rows: int, cols: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    data = {}
+    for i in range(cols):
+        kind = i % 5
+        if kind in (0, 1):
+            values = rng.random(rows) * 1000
+            values[rng.random(rows) < 0.1] = np.nan
+            data[f'f{i}'] = values
+        elif kind == 2:
+            data[f'i{i}'] = rng.integers(0, 1_000_000, rows)
+        elif kind == 3:
+            values = pd.Series(rng.integers(0, 1000, rows)).map('item-{}'.format)
+            values[rng.random(rows) < 0.1] = None
+            data[f's{i}'] = values
+        else:
+            data[f'd{i}'] = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 86400 * 365, rows), unit='s')
+    return pd.DataFrame(data)
+
+
+def old_cleaning(df: pd.DataFrame) -> list:
+    """What /import-data did before: stringify every column, then rows as tuples."""
+    df = df.copy()
+    for col in df.columns:
+        df[col] = df[col].astype(str).replace('nan', '').replace('None', '').replace('NaT', '')
+    return list(df.itertuples(index=False, name=None))
+
+
+def new_text_target(df: pd.DataFrame) -> list:
+    frame, _ = normalize_frame(df)
+    return frame.to_numpy().tolist()
+
+
+def new_typed_target(df: pd.DataFrame) -> list:
+    families = {}
+    for col in df.columns:
+        families[col] = {'f': 'float', 'i': 'integer', 'd': 'datetime'}.get(col[0], 'text')
+    frame, _ = normalize_frame(df, families)
+    return frame.to_numpy().tolist()
+
+
+def measure(name: str, fn, df: pd.DataFrame, memory: bool):
+    start = time.perf_counter()
+    rows = fn(df)
+    elapsed = time.perf_counter() - start
+    count = len(rows)
+    del rows
+    peak = ''
+    if memory:
+        # Separate pass: tracemalloc slows down allocation-heavy code
+        tracemalloc.start()
+        rows = fn(df)
+        peak = f"   peak {tracemalloc.get_traced_memory()[1] / 1024 / 1024:9.1f} MiB"
+        tracemalloc.stop()
+        del rows
+    print(f"{name:<32} {elapsed:8.2f} s{peak}   ({count} rows)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--cols', type=int, default=50)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    args = parser.parse_args()
+
+    df = build_frame(args.rows, args.cols)
+    print(f"Frame: {args.rows} x {args.cols}, {df.memory_usage(deep=True).sum() / 1024 / 1024:.1f} MiB")
+    memory = not args.no_memory
+    measure('astype(str) loop (before)', old_cleaning, df, memory)
+    measure('normalize_frame, text target', new_text_target, df, memory)
+    measure('normalize_frame, typed target', new_typed_target, df, memory)
+
+
+if __name__ == '__main__':
+    main()
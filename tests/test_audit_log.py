@@ -0,0 +1,157 @@
+"""audit_log.AuditWriter batching against a fake connection that records statements."""
+import time
+
+import pytest
+
+from app import audit_log
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, sql, params=()):
+        if any(p == 'bad' for p in params):
+            raise ValueError('conversion failed')
+        self.db.pending.append((sql, list(params)))
+
+    def executemany(self, sql, rows):
+        for row in rows:
+            self.execute(sql, row)
+
+    def close(self):
+        pass
+
+
+class FakeDb:
+    def __init__(self):
+        self.committed = []
+        self.pending = []
+        self.available = True
+
+    def connect(self):
+        return FakeConn(self) if self.available else None
+
+
+class FakeConn:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+    def commit(self):
+        self.db.committed.extend(self.db.pending)
+        self.db.pending = []
+
+    def rollback(self):
+        self.db.pending = []
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(audit_log, 'AUDIT_MAX_RETRIES', 1)
+    monkeypatch.setattr(audit_log.time, 'sleep', lambda s: None)
+    return FakeDb()
+
+
+def _inserted_ids(db):
+    return [params[0] for sql, params in db.committed if 'INSERT' in sql]
+
+
+def test_failing_row_is_dropped_alone(db):
+    w = audit_log.AuditWriter('test', db.connect)
+    events = [('insert', 'dbo.report_log', i, {'status': 'bad' if i == 2 else 'ok'}) for i in range(1, 5)]
+    w._write_with_retry(events)
+    assert _inserted_ids(db) == [1, 3, 4]
+    assert w.stats()['dropped'] == 1 and w.stats()['retries'] == 1
+
+
+def test_unavailable_database_drops_batch_without_row_by_row(db):
+    db.available = False
+    calls = []
+    w = audit_log.AuditWriter('test', lambda: calls.append(1) or db.connect())
+    events = [('update', 'dbo.report_log', i, {'status': 'ok'}) for i in range(10)]
+    w._write_with_retry(events)
+    assert w.stats()['dropped'] == 10
+    assert len(calls) == audit_log.AUDIT_MAX_RETRIES + 2
+
+
+def test_flush_writes_queued_events_and_merges_updates(db):
+    w = audit_log.AuditWriter('test', db.connect)
+    w._put(('insert', 'dbo.import_log', 7, {'status': 'started'}))
+    w._put(('update', 'dbo.import_log', 7, {'status': 'success'}))
+    assert w.flush(timeout=5)
+    assert db.committed and db.committed[0][1] == [7, 'success']
+    assert w.stats()['merged'] == 1 and w.stats()['queued'] == 0
+    w.shutdown()
+
+
+def test_flush_keeps_queue_order_with_a_batch_in_progress(db, monkeypatch):
+    monkeypatch.setattr(audit_log, 'AUDIT_FLUSH_INTERVAL', 0.5)
+    w = audit_log.AuditWriter('test', db.connect)
+    w._put(('insert', 'dbo.import_log', 7, {'status': 'started'}))
+    time.sleep(0.1)  # the flusher thread now holds the insert while it waits for more events
+    w._put(('update', 'dbo.import_log', 7, {'status': 'success'}))
+    w._put(('insert', 'dbo.import_log', 8, {'status': 'started'}))
+    assert w.flush(timeout=5)
+    # One multi-row INSERT, with the update merged into row 7
+    assert [params for _, params in db.committed] == [[7, 'success', 8, 'started']]
+    w.shutdown()
+
+
+def test_shutdown_drains_the_queue(db):
+    w = audit_log.AuditWriter('test', db.connect)
+    w._ensure_thread = lambda: None  # nothing running: shutdown writes on the calling thread
+    w._put(('insert', 'dbo.import_log', 9, {'status': 'started'}))
+    w.shutdown()
+    assert db.committed[0][1] == [9, 'started']
+
+
+class _ReserveDb(FakeDb):
+    """Fails the id reservation with `error` while it is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.error = None
+
+    def connect(self):
+        conn = super().connect()
+        db = self
+
+        class Cursor(FakeCursor):
+            def execute(self, sql, params=()):
+                if db.error is not None:
+                    raise db.error
+                self.last = sql
+
+            def fetchone(self):
+                return (100,) if 'sp_sequence_get_range' in self.last else (5, 5)
+        conn.cursor = lambda: Cursor(db)
+        return conn
+
+
+def test_transient_reserve_failure_backs_off(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(audit_log.time, 'monotonic', lambda: now[0])
+    db = _ReserveDb()
+    db.error = RuntimeError('[40001] Transaction was deadlocked (1205)')
+    w = audit_log.AuditWriter('test', db.connect)
+    assert w._allocate('dbo.report_log') is None
+    db.error = None
+    assert w._allocate('dbo.report_log') is None  # still backing off
+    now[0] += audit_log.AUDIT_RESERVE_BACKOFF + 1
+    assert w._allocate('dbo.report_log') == 100
+    assert w._allocate('dbo.report_log') == 101
+    assert 'dbo.report_log' not in w._sync_tables
+
+
+def test_permission_error_switches_to_synchronous_inserts():
+    db = _ReserveDb()
+    db.error = RuntimeError("[42000] Cannot find the object because the current user is not the owner (8104)")
+    w = audit_log.AuditWriter('test', db.connect)
+    assert w._allocate('dbo.report_log') is None
+    assert 'dbo.report_log' in w._sync_tables
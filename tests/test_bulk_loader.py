@@ -0,0 +1,35 @@
+"""bulk_loader staging-file formatting and type mapping."""
+import datetime
+from decimal import Decimal
+
+import pandas as pd
+
+from app import bulk_loader
+from app.bulk_loader import _bcp_field
+
+
+def test_bcp_field_formats():
+    assert _bcp_field(None) == ''
+    assert _bcp_field(True) == '1' and _bcp_field(False) == '0'
+    assert _bcp_field(datetime.datetime(2024, 5, 6, 7, 8, 9, 123456)) == '2024-05-06 07:08:09.123'
+    assert _bcp_field(pd.Timestamp('2024-05-06 07:08:09')) == '2024-05-06 07:08:09.000'
+    assert _bcp_field(datetime.date(2024, 5, 6)) == '2024-05-06'
+    assert _bcp_field(Decimal('1E+3')) == '1000'
+    assert _bcp_field(Decimal('0.00001')) == '0.00001'
+    assert _bcp_field(1e-05) == '0.00001'
+    assert _bcp_field(2.5) == '2.5'
+    assert _bcp_field(42) == '42'
+
+
+def test_empty_string_chunk_falls_back(monkeypatch, tmp_path):
+    monkeypatch.setattr(bulk_loader, 'IMPORT_BULK_STAGING_DIR', str(tmp_path))
+    loader = bulk_loader.BulkLoader.__new__(bulk_loader.BulkLoader)
+    assert loader._bulk_insert([['a', 1], ['', 2]]) is False
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_type_family():
+    assert bulk_loader.type_family('BIGINT') == 'integer'
+    assert bulk_loader.type_family('numeric') == 'decimal'
+    assert bulk_loader.type_family('datetime2') == 'datetime'
+    assert bulk_loader.type_family('nvarchar') == 'text'
@@ -0,0 +1,13 @@
+import json
+
+from app import db_connection as dbc
+
+
+def test_main_and_definitions_share_one_connection_string(tmp_path, monkeypatch):
+    path = tmp_path / 'settings.json'
+    path.write_text(json.dumps({'host': 'srv', 'database': 'app'}))
+    monkeypatch.setattr(dbc, 'SETTINGS_PATH', str(path))
+    monkeypatch.setattr(dbc, '_drivers_cache', ['ODBC Driver 17 for SQL Server', 'ODBC Driver 18 for SQL Server'])
+    monkeypatch.setattr(dbc, '_snapshot', None)
+    assert dbc.get_connection_string('main') == dbc.get_connection_string('definitions')
+    assert 'DRIVER={ODBC Driver 18 for SQL Server}' in dbc.get_connection_string('main')
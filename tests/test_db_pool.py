@@ -0,0 +1,137 @@
+"""db_pool against a fake pyodbc connection (no SQL Server or ODBC driver needed)."""
+import pytest
+
+from app import db_pool
+
+CONN_MAIN = 'DRIVER={ODBC Driver 18 for SQL Server};SERVER=srv;DATABASE=main;Trusted_Connection=yes'
+CONN_DEFS = 'DRIVER={ODBC Driver 18 for SQL Server};SERVER=srv;DATABASE=defs;Trusted_Connection=yes'
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, *params):
+        if not self.conn.alive:
+            raise RuntimeError('connection is dead')
+        return self
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, conn_str, timeout):
+        self.conn_str = conn_str
+        self.login_timeout = timeout
+        self.alive = True
+        self.closed = False
+        self.rollbacks = 0
+        self.timeout = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def opened():
+    conns = []
+
+    def connect(conn_str, timeout):
+        conn = FakeConn(conn_str, timeout)
+        conns.append(conn)
+        return conn
+    db_pool.set_connect_factory(connect)
+    yield conns
+    db_pool.set_connect_factory(None)
+
+
+def test_checkin_reuses_the_same_raw_connection(opened):
+    conn = db_pool.connect(CONN_MAIN)
+    raw = conn.raw
+    conn.close()
+    conn.close()  # idempotent
+    again = db_pool.connect(CONN_MAIN)
+    assert again.raw is raw
+    assert len(opened) == 1
+    assert raw.rollbacks == 1
+    again.close()
+
+
+def test_checkin_clears_the_query_timeout(opened):
+    conn = db_pool.connect(CONN_MAIN)
+    conn.timeout = 30
+    raw = conn.raw
+    conn.close()
+    assert raw.timeout == 0
+
+
+def test_exhausted_pool_times_out():
+    pool = db_pool.ConnectionPool(CONN_MAIN, max_size=1, connect=FakeConn)
+    held = pool.checkout()
+    with pytest.raises(db_pool.PoolExhaustedError):
+        pool.checkout(timeout=0.05)
+    held.close()
+    pool.checkout(timeout=0.05).close()
+    assert pool.stats()['timeouts'] == 1
+
+
+def test_dead_idle_connection_is_replaced():
+    pool = db_pool.ConnectionPool(CONN_MAIN, validate_after_seconds=0, connect=FakeConn)
+    conn = pool.checkout()
+    raw = conn.raw
+    conn.close()
+    raw.alive = False
+    fresh = pool.checkout()
+    assert fresh.raw is not raw
+    assert raw.closed
+    assert pool.stats()['health_check_failures'] == 1
+
+
+def test_discard_closes_instead_of_returning():
+    pool = db_pool.ConnectionPool(CONN_MAIN, connect=FakeConn)
+    conn = pool.checkout()
+    raw = conn.raw
+    conn.discard()
+    assert raw.closed
+    assert pool.stats()['idle'] == 0
+
+
+def test_alternating_databases_keep_their_pools(opened):
+    for _ in range(5):
+        db_pool.connect(CONN_MAIN).close()
+        db_pool.connect(CONN_DEFS).close()
+    assert len(opened) == 2
+
+
+def test_same_database_with_another_driver_gets_its_own_pool(opened):
+    other_driver = CONN_MAIN.replace('18', '17')
+    for _ in range(3):
+        db_pool.connect(CONN_MAIN).close()
+        db_pool.connect(other_driver).close()
+    assert len(opened) == 2
+    assert db_pool.get_pool(CONN_MAIN) is db_pool.get_pool(CONN_MAIN.replace('srv', 'SRV'))
+
+
+def test_close_all_rebuilds_on_next_use(opened):
+    db_pool.connect(CONN_MAIN).close()
+    first = db_pool.get_pool(CONN_MAIN)
+    db_pool.close_all()
+    assert opened[0].closed
+    db_pool.connect(CONN_MAIN).close()
+    assert db_pool.get_pool(CONN_MAIN) is not first
+    assert len(opened) == 2
+
+
+def test_connect_timeout_is_the_login_timeout(opened):
+    db_pool.connect(CONN_MAIN, connect_timeout=12).close()
+    assert opened[0].login_timeout == 12
@@ -0,0 +1,49 @@
+"""excel_reader streaming of .xlsx sheets (workbooks built with openpyxl)."""
+import datetime
+
+import openpyxl
+import pytest
+
+from app import excel_reader
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    def build(rows, title='Data'):
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = title
+        for row in rows:
+            ws.append(row)
+        path = tmp_path / 'book.xlsx'
+        wb.save(path)
+        return str(path)
+    return build
+
+
+def test_read_head_and_sheet_names(workbook):
+    path = workbook([['Name', 'Amount', 'When'], ['a', 1, datetime.datetime(2024, 1, 2)], ['b', 2.5, None],
+                     ['c', 3, None]])
+    assert excel_reader.sheet_names(path) == ['Data']
+    head = excel_reader.read_head(path, 'Data', max_rows=2)
+    assert list(head.columns) == ['Name', 'Amount', 'When']
+    assert head['Amount'].tolist() == [1.0, 2.5]
+    assert excel_reader.row_count(path, 'Data') == 3
+
+
+def test_duplicate_headers_are_numbered(workbook):
+    path = workbook([['a', 'a', 'b', 'a.1'], [1, 2, 3, 4], [5, 6, 7, 8]])
+    assert list(excel_reader.read_head(path).columns) == ['a', 'a.1', 'b', 'a.1.1']
+    chunks = excel_reader.ExcelChunks(path, chunk_rows=1)
+    assert chunks.columns == ['a', 'a_1', 'b', 'a_1_1']
+    frames = list(chunks)
+    assert [f.to_numpy().tolist() for f in frames] == [[[1, 2, 3, 4]], [[5, 6, 7, 8]]]
+
+
+def test_unnamed_empty_columns_are_dropped(workbook):
+    path = workbook([['x', None, None, 'y'], [1, None, 'z', 2], [None, None, None, None], [3, None, None, 4]])
+    chunks = excel_reader.ExcelChunks(path, chunk_rows=10)
+    assert chunks.columns == ['x', 'Column_2', 'y']
+    frame = next(iter(chunks))
+    assert len(frame) == 2
+    assert frame['y'].tolist() == [2, 4]
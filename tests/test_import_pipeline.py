@@ -0,0 +1,52 @@
+"""import_pipeline: column sanitizing, frame normalization and CSV chunking."""
+import datetime
+from decimal import Decimal
+
+import pandas as pd
+
+from app import import_pipeline
+from app.import_pipeline import CsvChunks, normalize_frame, sanitize_columns
+
+
+def test_sanitize_columns():
+    assert sanitize_columns(['Name', 'Unnamed: 1', '1st', 'Name', 'a b']) == \
+        ['Name', 'Column_2', 'col_1st', 'Name_1', 'a_b']
+
+
+def test_normalize_frame_nulls_become_none():
+    frame = pd.DataFrame({'t': ['x', None], 'n': [1.5, float('nan')]})
+    out, kinds = normalize_frame(frame, {'n': 'float'})
+    assert kinds == ['text', 'float']
+    assert out.to_numpy().tolist() == [['x', 1.5], [None, None]]
+
+
+def test_normalize_frame_keeps_typed_values_for_matching_targets():
+    frame = pd.DataFrame({
+        'i': pd.Series([1, 2], dtype='int64'),
+        'd': [Decimal('1.10'), None],
+        'ts': pd.to_datetime(['2024-01-02 03:04:05', None]),
+        'b': [True, False],
+    })
+    out, kinds = normalize_frame(frame, {'i': 'integer', 'd': 'decimal', 'ts': 'date', 'b': 'bit'})
+    assert kinds == ['int', 'decimal', 'datetime', 'bool']
+    rows = out.to_numpy().tolist()
+    assert rows[0] == [1, Decimal('1.10'), datetime.date(2024, 1, 2), True]
+    assert rows[1][1] is None and rows[1][2] is None
+
+
+def test_normalize_frame_converts_to_text_for_text_targets():
+    frame = pd.DataFrame({'i': [1, 2], 'f': [0.5, None]})
+    out, kinds = normalize_frame(frame, {'i': 'text'})
+    assert kinds == ['text', 'text']
+    assert out.to_numpy().tolist() == [['1', '0.5'], ['2', None]]
+
+
+def test_csv_chunks_drop_unnamed_empty_columns(tmp_path, monkeypatch):
+    path = tmp_path / 'data.csv'
+    path.write_text('Name,Amount,\nA,1,\n,,\nB,2,\nC,3,\n', encoding='utf-8')
+    chunks = CsvChunks(str(path), chunk_rows=2)
+    assert chunks.columns == ['Name', 'Amount']
+    frames = list(chunks)
+    assert [len(f) for f in frames] == [1, 2]
+    assert frames[1].to_numpy().tolist() == [['B', '2'], ['C', '3']]
+    assert import_pipeline.count_csv_rows(str(path)) == 4
@@ -0,0 +1,78 @@
+"""report_cache: keys, TTLs, the byte-bounded LRU and RowsCursor."""
+from app import report_cache
+from app.report_cache import ResultCache, RowsCursor
+
+
+def test_make_key_treats_blank_and_none_alike():
+    a = report_cache.make_key(1, 'dbo.Sales', {'region': ' ', 'year': 2024}, '2024-01-01')
+    b = report_cache.make_key(1, 'DBO.SALES', {'year': 2024, 'region': None}, '2024-01-01')
+    assert a == b
+    assert a != report_cache.make_key(1, 'dbo.Sales', {'region': None, 'year': 2024}, '2024-02-01')
+
+
+def test_ttl_for_falls_back_to_default():
+    assert report_cache.ttl_for({'cache_ttl_seconds': '30'}) == 30.0
+    assert report_cache.ttl_for({'cache_ttl_seconds': -5}) == 0.0
+    assert report_cache.ttl_for({'cache_ttl_seconds': 'soon'}) == report_cache.REPORT_CACHE_DEFAULT_TTL
+    assert report_cache.ttl_for(None) == report_cache.REPORT_CACHE_DEFAULT_TTL
+
+
+def test_get_returns_stored_value_until_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(report_cache.time, 'monotonic', lambda: now[0])
+    cache = ResultCache(max_bytes=1000, max_entry_bytes=1000)
+    assert cache.put('k', {'rows': [1]}, ttl=10, size=10)
+    assert cache.get('k') == {'rows': [1]}
+    now[0] = 111.0
+    assert cache.get('k') is None
+    assert cache.stats()['expired'] == 1 and cache.stats()['bytes'] == 0
+
+
+def test_zero_ttl_and_oversized_entries_are_not_stored():
+    cache = ResultCache(max_bytes=100, max_entry_bytes=50)
+    assert not cache.put('a', 1, ttl=0, size=1)
+    assert not cache.put('b', 1, ttl=10, size=51)
+    assert cache.stats()['entries'] == 0
+
+
+def test_lru_eviction_by_bytes():
+    cache = ResultCache(max_bytes=100, max_entry_bytes=100)
+    cache.put('a', 'A', 60, 40)
+    cache.put('b', 'B', 60, 40)
+    cache.get('a')  # 'b' is now least recently used
+    cache.put('c', 'C', 60, 40)
+    assert cache.get('b') is None
+    assert cache.get('a') == 'A' and cache.get('c') == 'C'
+    assert cache.stats()['evictions'] == 1 and cache.stats()['bytes'] == 80
+
+
+def test_invalidate_by_definition():
+    cache = ResultCache()
+    cache.put(report_cache.make_key(1, 'p', {}), 'one', 60, 1)
+    cache.put(report_cache.make_key(2, 'p', {}), 'two', 60, 1)
+    assert cache.invalidate(1) == 1
+    assert cache.get(report_cache.make_key(1, 'p', {})) is None
+    assert cache.get(report_cache.make_key(2, 'p', {})) == 'two'
+
+
+class _Cursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.closed = False
+
+    def fetchmany(self, size):
+        out, self.rows = self.rows[:size], self.rows[size:]
+        return out
+
+    def close(self):
+        self.closed = True
+
+
+def test_rows_cursor_continues_into_live_cursor():
+    live = _Cursor([(3,), (4,), (5,)])
+    cur = RowsCursor([(1,), (2,)], live)
+    assert cur.fetchmany(3) == [(1,), (2,), (3,)]
+    assert cur.fetchmany(5) == [(4,), (5,)]
+    assert cur.fetchmany(5) == []
+    cur.close()
+    assert live.closed
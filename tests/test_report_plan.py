@@ -0,0 +1,26 @@
+"""report_plan parameter specs: conversion and ODBC input sizes."""
+from decimal import Decimal
+from types import SimpleNamespace
+
+from app.report_plan import ParamSpec
+
+ODBC = SimpleNamespace(SQL_INTEGER=4, SQL_BIGINT=-5, SQL_BIT=-7, SQL_DECIMAL=3, SQL_DOUBLE=8, SQL_TYPE_DATE=91,
+                       SQL_TYPE_TIMESTAMP=93, SQL_WVARCHAR=-9)
+
+
+def test_decimal_uses_declared_precision_and_scale():
+    spec = ParamSpec.from_definition({'name': 'amount', 'type': 'decimal', 'precision': 10, 'scale': 2})
+    assert spec.bind('12.34') == Decimal('12.34')
+    assert spec.input_size(ODBC) == (ODBC.SQL_DECIMAL, 10, 2)
+    assert ParamSpec.from_definition({'name': 'a', 'type': 'numeric(12,4)'}).input_size(ODBC) == (ODBC.SQL_DECIMAL, 12, 4)
+    assert ParamSpec.from_definition({'name': 'a', 'type': 'decimal(9)'}).input_size(ODBC) == (ODBC.SQL_DECIMAL, 9, 0)
+
+
+def test_decimal_without_scale_lets_the_driver_pick():
+    spec = ParamSpec.from_definition({'name': 'amount', 'type': 'decimal'})
+    assert spec.bind('12.34') == Decimal('12.34')
+    assert spec.input_size(ODBC) is None
+
+
+def test_money_has_a_fixed_scale():
+    assert ParamSpec.from_definition({'name': 'a', 'type': 'money'}).input_size(ODBC) == (ODBC.SQL_DECIMAL, 19, 4)
@@ -0,0 +1,103 @@
+"""result_sessions paging, fetch errors and connection release, against a fake cursor."""
+import pytest
+
+from app import result_sessions
+
+
+class FakeCursor:
+    def __init__(self, n, fail_after=None):
+        self.rows = [(i, f'row {i}') for i in range(n)]
+        self.pos = 0
+        self.fail_after = fail_after
+        self.closed = False
+
+    def fetchmany(self, size):
+        if self.fail_after is not None and self.pos >= self.fail_after:
+            raise RuntimeError('connection reset')
+        end = len(self.rows) if self.fail_after is None else min(len(self.rows), self.fail_after)
+        batch = self.rows[self.pos:min(self.pos + size, end)]
+        self.pos += len(batch)
+        return batch
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConn:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_sessions, 'SPOOL_DIR', str(tmp_path))
+    monkeypatch.setattr(result_sessions, 'FETCH_BATCH', 10)
+    yield
+    result_sessions.close_all()
+
+
+def _open(n, **kwargs):
+    conn, cur = FakeConn(), FakeCursor(n, **kwargs)
+    page = result_sessions.open_session('alice', ['id', 'name'], conn, cur, lambda x: x, first_page=5)
+    return page, conn, cur
+
+
+def test_pages_forward_and_back():
+    page, conn, _ = _open(23)
+    assert page['rows'][0] == [0, 'row 0'] and page['has_more']
+    rid = page['result_id']
+    last = result_sessions.get_page(rid, 'alice', 20, 5)
+    assert [r[0] for r in last['rows']] == [20, 21, 22]
+    assert last['total_rows'] == 23 and not last['has_more']
+    assert conn.closed
+    assert [r[0] for r in result_sessions.get_page(rid, 'alice', 5, 3)['rows']] == [5, 6, 7]
+
+
+def test_small_result_keeps_no_session():
+    page, conn, _ = _open(3)
+    assert page['result_id'] is None and page['total_rows'] == 3
+    assert conn.closed
+
+
+def test_foreign_owner_is_rejected():
+    page, _, _ = _open(23)
+    with pytest.raises(result_sessions.ResultSessionError):
+        result_sessions.get_page(page['result_id'], 'mallory', 0, 5)
+
+
+def test_fetch_error_is_raised_on_later_pages():
+    page, conn, _ = _open(100, fail_after=10)
+    rid = page['result_id']
+    with pytest.raises(result_sessions.ResultFetchError, match='after 10 rows'):
+        result_sessions.get_page(rid, 'alice', 5, 5)
+    # Rows spooled before the failure can still be read
+    assert [r[0] for r in result_sessions.get_page(rid, 'alice', 2, 3)['rows']] == [2, 3, 4]
+    assert conn.closed
+    with pytest.raises(result_sessions.ResultFetchError):
+        result_sessions.get_page(rid, 'alice', 5, 5)
+
+
+def test_spool_all_raises_fetch_error():
+    session = result_sessions.ResultSession('alice', ['id', 'name'], FakeConn(), FakeCursor(100, fail_after=30),
+                                            lambda x: x)
+    try:
+        with pytest.raises(result_sessions.ResultFetchError):
+            session.spool_all()
+        with pytest.raises(result_sessions.ResultFetchError):
+            session.spool_all()
+    finally:
+        session.close()
+
+
+def test_release_connections_spools_least_recently_used(monkeypatch):
+    monkeypatch.setattr(result_sessions, 'MAX_LIVE_RESULT_SESSIONS', 2)
+    first, conn1, _ = _open(50)
+    second, conn2, _ = _open(50)
+    result_sessions.get_page(first['result_id'], 'alice', 5, 5)  # second is now the oldest
+    result_sessions.release_connections()
+    assert conn2.closed and not conn1.closed
+    page = result_sessions.get_page(second['result_id'], 'alice', 45, 10)
+    assert [r[0] for r in page['rows']] == [45, 46, 47, 48, 49] and page['total_rows'] == 50
@@ -0,0 +1,56 @@
+"""schema_inference: type inference, widening and coercion of text columns."""
+from decimal import Decimal
+
+import pandas as pd
+
+from app.schema_inference import SchemaInference, coerce_frame, infer_types, valid_type
+
+
+def _frame(**columns):
+    return pd.DataFrame({k: pd.Series(v, dtype=object) for k, v in columns.items()})
+
+
+def test_infer_types():
+    frame = _frame(
+        i=['1', '-2', None], big=['3000000000', '1', '2'], d=['1.5', '2', '-0.25'],
+        zip=['01234', '12345', '99999'], flag=['true', 'FALSE', ''], day=['2024-01-02', '2024-12-31', None],
+        ts=['2024-01-02 03:04:05', '2024-01-02', None], name=['x' * 60, 'y', None],
+    )
+    assert infer_types(frame) == {
+        'i': 'INT', 'big': 'BIGINT', 'd': 'DECIMAL(18,2)', 'zip': 'NVARCHAR(50)', 'flag': 'BIT',
+        'day': 'DATE', 'ts': 'DATETIME', 'name': 'NVARCHAR(100)',
+    }
+
+
+def test_overrides_win():
+    assert infer_types(_frame(a=['1', '2']), {'a': 'decimal(10,2)'}) == {'a': 'DECIMAL(10,2)'}
+    assert valid_type('NVARCHAR(MAX)') and not valid_type('INT; DROP TABLE x')
+
+
+def test_widened_reports_changed_columns():
+    schema = SchemaInference(['a', 'b'])
+    schema.update(_frame(a=['1', '2'], b=['x', 'y']))
+    assert schema.types() == {'a': 'INT', 'b': 'NVARCHAR(50)'}
+    schema.update(_frame(a=['1.5', '7'], b=['z', 'w']))
+    assert schema.widened() == {'a': 'DECIMAL(18,1)'}
+    assert schema.widened() == {}
+
+
+def test_coerce_frame_blank_cells_become_null():
+    frame = _frame(d=['1.5', '  ', '2.25'], i=['1', ' ', '3'], b=['true', '', 'false'], t=['a', ' ', None])
+    types = infer_types(frame)
+    assert types['d'] == 'DECIMAL(18,2)' and types['i'] == 'INT' and types['b'] == 'BIT'
+    out = coerce_frame(frame, types, {})
+    assert out['d'].tolist()[0] == Decimal('1.5') and pd.isna(out['d'].tolist()[1])
+    assert out['i'].tolist()[0] == 1 and out['i'].isna().tolist() == [False, True, False]
+    assert out['b'].isna().tolist() == [False, True, False]
+    # Text columns keep their values as they are
+    assert out['t'].tolist()[:2] == ['a', ' ']
+
+
+def test_coerce_frame_dates_use_inferred_format():
+    frame = _frame(day=['01/02/2024', ' ', '12/31/2024'])
+    schema = SchemaInference(['day'])
+    schema.update(frame)
+    out = coerce_frame(frame, schema.types(), schema.formats())
+    assert out['day'].tolist()[0] == pd.Timestamp('2024-01-02') and pd.isna(out['day'].tolist()[1])
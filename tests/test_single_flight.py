@@ -0,0 +1,48 @@
+"""single_flight: one leader per key, followers get the published value."""
+import asyncio
+import threading
+
+from app.single_flight import SingleFlight
+
+
+def test_followers_receive_the_leaders_value():
+    async def main():
+        group = SingleFlight()
+        flight, leader = group.join('k')
+        f2, leader2 = group.join('k')
+        f3, leader3 = group.join('k')
+        assert leader and not leader2 and not leader3
+        assert f2 is flight and flight.waiters == 2
+        waiting = asyncio.gather(f2.wait(), f3.wait())
+        flight.publish({'rows': [1]})
+        assert await waiting == [{'rows': [1]}, {'rows': [1]}]
+        assert group.stats() == {'leaders': 1, 'coalesced': 2, 'in_flight': 0}
+    asyncio.run(main())
+
+
+def test_publish_from_worker_thread_and_only_first_counts():
+    async def main():
+        group = SingleFlight()
+        flight, _ = group.join('k')
+        follower, _ = group.join('k')
+
+        def work():
+            flight.publish('first')
+            flight.publish('second')
+        thread = threading.Thread(target=work)
+        thread.start()
+        assert await asyncio.wait_for(follower.wait(), 5) == 'first'
+        thread.join()
+    asyncio.run(main())
+
+
+def test_new_flight_after_publish():
+    async def main():
+        group = SingleFlight()
+        flight, _ = group.join('k')
+        flight.publish(None)
+        again, leader = group.join('k')
+        assert leader and again is not flight
+        other, other_leader = group.join('other')
+        assert other_leader
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+"""upload_staging chunked uploads: offsets, checksums, concurrent chunks and finalize."""
+import asyncio
+import hashlib
+
+import pytest
+
+from app import upload_staging
+from app.upload_staging import UploadError
+
+DATA = b'id,name\n' + b''.join(b'%d,row %d\n' % (i, i) for i in range(200))
+
+
+@pytest.fixture(autouse=True)
+def staging_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_staging, 'IMPORT_STAGING_DIR', str(tmp_path))
+
+
+async def _blocks(data, size=64):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def _write(staged_file_id, offset, data, sha256=None, owner='alice'):
+    return asyncio.run(upload_staging.write_chunk(staged_file_id, owner, offset, _blocks(data), sha256))
+
+
+def _sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_upload_in_chunks_and_finalize():
+    staged = upload_staging.init_upload('data.csv', len(DATA), 'alice', _sha(DATA))
+    sid = staged.staged_file_id
+    assert _write(sid, 0, DATA[:1000], _sha(DATA[:1000])) == 1000
+    assert upload_staging.upload_status(sid, 'alice')['offset'] == 1000
+    assert _write(sid, 1000, DATA[1000:]) == len(DATA)
+    with pytest.raises(upload_staging.StagingError):
+        upload_staging.get(sid, 'alice')
+    done = upload_staging.finalize_upload(sid, 'alice')
+    assert done.complete and done.meta['sha256'] == _sha(DATA)
+    with open(upload_staging.get(sid, 'alice').path, 'rb') as fh:
+        assert fh.read() == DATA
+
+
+def test_wrong_offset_is_a_conflict():
+    sid = upload_staging.init_upload('data.csv', len(DATA), 'alice').staged_file_id
+    _write(sid, 0, DATA[:100])
+    with pytest.raises(UploadError) as e:
+        _write(sid, 50, DATA[50:150])
+    assert e.value.conflict and e.value.offset == 100
+
+
+def test_bad_chunk_checksum_is_cut_off():
+    sid = upload_staging.init_upload('data.csv', len(DATA), 'alice').staged_file_id
+    _write(sid, 0, DATA[:100])
+    with pytest.raises(UploadError) as e:
+        _write(sid, 100, DATA[100:200], sha256=_sha(b'other'))
+    assert not e.value.conflict and e.value.offset == 100
+    assert upload_staging.upload_status(sid, 'alice')['offset'] == 100
+
+
+def test_chunk_past_declared_size_is_rejected():
+    sid = upload_staging.init_upload('data.csv', 10, 'alice').staged_file_id
+    with pytest.raises(UploadError):
+        _write(sid, 0, DATA[:20])
+    assert upload_staging.upload_status(sid, 'alice')['offset'] == 0
+
+
+def test_concurrent_chunk_is_a_conflict():
+    sid = upload_staging.init_upload('data.csv', len(DATA), 'alice').staged_file_id
+
+    async def main():
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow():
+            yield DATA[:50]
+            started.set()
+            await release.wait()
+            yield DATA[50:100]
+
+        first = asyncio.ensure_future(upload_staging.write_chunk(sid, 'alice', 0, slow()))
+        await started.wait()
+        with pytest.raises(UploadError) as e:
+            await upload_staging.write_chunk(sid, 'alice', 0, _blocks(DATA[:100]))
+        assert e.value.conflict
+        with pytest.raises(UploadError):
+            upload_staging.finalize_upload(sid, 'alice')
+        release.set()
+        return await first
+
+    assert asyncio.run(main()) == 100
+    assert _write(sid, 100, DATA[100:]) == len(DATA)
+
+
+def test_finalize_checks_size_and_hash():
+    sid = upload_staging.init_upload('data.csv', len(DATA), 'alice').staged_file_id
+    _write(sid, 0, DATA[:100])
+    with pytest.raises(UploadError) as e:
+        upload_staging.finalize_upload(sid, 'alice')
+    assert e.value.conflict and e.value.offset == 100
+    _write(sid, 100, DATA[100:])
+    with pytest.raises(UploadError):
+        upload_staging.finalize_upload(sid, 'alice', _sha(b'other'))
+    # A corrupted upload is discarded and has to start over
+    with pytest.raises(upload_staging.StagingError):
+        upload_staging.upload_status(sid, 'alice')
+
+
+def test_other_users_cannot_write():
+    sid = upload_staging.init_upload('data.csv', len(DATA), 'alice').staged_file_id
+    with pytest.raises(upload_staging.StagingError):
+        _write(sid, 0, DATA[:10], owner='mallory')